@@ -0,0 +1,129 @@
+"""
+One-hot vs XGBoost native categorical encoding on CRT_dataset.csv.
+
+Trains the TB adherence model both ways (feature cache off) and reports fit
+time (median of --repeats runs of train()), design matrix size, peak
+Python-side memory during one fit (tracemalloc; xgboost's native buffers are
+not counted) and test AUC. --high-cardinality adds countyid plus a synthetic
+N-level "clinic" column, standing in for the facility/ward/CHV columns of the OLTP
+schema, to show how the one-hot matrix grows.
+
+It also checks that one missing categorical value in a scoring batch only
+changes that row's prediction under native encoding (the column's dtype
+changes with the gap, its category codes must not); the script exits
+non-zero otherwise.
+
+    python benchmarks/categorical_encoding.py [--high-cardinality 400] [--repeats 3]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import contextlib
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from models import TBAdherenceModel
+
+
+class WideTBModel(TBAdherenceModel):
+    """The TB model plus high-cardinality categorical columns."""
+
+    def get_feature_columns(self):
+        return super().get_feature_columns() + ['countyid', 'clinic']
+
+    def get_categorical_columns(self):
+        return super().get_categorical_columns() + ['countyid', 'clinic']
+
+
+def matrix_bytes(X):
+    if sp.issparse(X):
+        X = X.tocsr()
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    if isinstance(X, pd.DataFrame):
+        return int(X.memory_usage(deep=True).sum())
+    return np.asarray(X).nbytes
+
+
+def train(model_cls, encoding, df):
+    model = model_cls()
+    model.use_cache = False
+    model.categorical_encoding = encoding
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = model.train(df)
+    return model, result
+
+
+def run_case(model_cls, encoding, df, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model, result = train(model_cls, encoding, df)
+        times.append(time.perf_counter() - start)
+
+    # Memory in a separate run: tracemalloc slows everything down
+    tracemalloc.start()
+    train(model_cls, encoding, df)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    _, X_train, _, _, _ = model.split_data(df)
+    X = model.pipeline[:-1].transform(X_train)
+    return {
+        'seconds': float(np.median(times)),
+        'peak_mb': peak / 1e6,
+        'columns': X.shape[1],
+        'matrix_mb': matrix_bytes(X) / 1e6,
+        'auc': result['auc']
+    }
+
+
+def missing_value_check(df):
+    """True when a NaN in one row of a batch leaves every other row's prediction unchanged."""
+    model, _ = train(TBAdherenceModel, 'native', df)
+    batch = df.sample(200, random_state=0).reset_index(drop=True)
+    clean = model.predict_proba(batch)
+    ok = True
+    for c in model.categorical_features:
+        gapped = batch.copy()
+        gapped.loc[0, c] = np.nan
+        ok &= np.array_equal(model.predict_proba(gapped)[1:], clean[1:])
+    return bool(ok)
+
+
+def main(high_cardinality, repeats):
+    df = pd.read_csv(os.path.join(project_root, 'CRT_dataset.csv'), low_memory=False)
+    cases = [('TB features', TBAdherenceModel)]
+    if high_cardinality:
+        df['clinic'] = (df['studynumber'] % high_cardinality).astype(str)
+        cases.append((f'+ {high_cardinality}-level clinic', WideTBModel))
+
+    print(f"{'FEATURES':<22}{'ENCODING':<9}{'FIT S':>8}{'PEAK MB':>9}{'COLUMNS':>9}{'MATRIX MB':>11}{'AUC':>8}")
+    for label, model_cls in cases:
+        for encoding in ('onehot', 'native'):
+            r = run_case(model_cls, encoding, df, repeats)
+            print(f"{label:<22}{encoding:<9}{r['seconds']:>8.3f}{r['peak_mb']:>9.1f}{r['columns']:>9}"
+                  f"{r['matrix_mb']:>11.3f}{r['auc']:>8.4f}")
+
+    ok = missing_value_check(df)
+    print(f"One missing value in a batch of valid rows: {'other rows unchanged' if ok else 'OTHER ROWS CHANGED'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Categorical encoding benchmark')
+    parser.add_argument('--high-cardinality', type=int, default=400,
+                        help='Levels of the synthetic clinic column (0 to skip that case)')
+    parser.add_argument('--repeats', type=int, default=3)
+
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+    sys.exit(0 if main(args.high_cardinality, args.repeats) else 1)
@@ -0,0 +1,70 @@
+"""
+Cold start to first prediction for a saved pillar model.
+
+Each measurement runs in a fresh interpreter, so imports and artifact loading
+are paid in full, as they are for the CLI or a restarted prediction server.
+"eager" imports every pillar module first, as `import models` used to;
+"lazy" goes through the registry; "lazy+mmap" also memory-maps the artifact.
+
+    python benchmarks/cold_start.py [--model tb] [--runs 3]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+if {eager}:
+    import models.tb_adherence_model, models.menstrual_tracking_model, models.hiv_qoc_model, models.hiv_adherence_model
+from models.registry import load_model, PILLARS
+t1 = time.perf_counter()
+import io, contextlib
+import pandas as pd
+with contextlib.redirect_stdout(io.StringIO()):
+    model = load_model({model!r})
+t2 = time.perf_counter()
+row = pd.DataFrame([{{c: None for c in model.feature_cols}}])
+model.predict_proba(row)
+t3 = time.perf_counter()
+print(json.dumps({{'import': t1 - t0, 'load': t2 - t1, 'predict': t3 - t2, 'total': t3 - t0}}))
+"""
+
+CASES = [
+    ('eager', True, None),
+    ('lazy', False, None),
+    ('lazy+mmap', False, '0'),
+]
+
+
+def measure(model, eager, mmap_min_bytes):
+    env = dict(os.environ)
+    if mmap_min_bytes is not None:
+        env['MODEL_MMAP_MIN_BYTES'] = mmap_min_bytes
+    code = PROBE.format(root=project_root, eager=eager, model=model)
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(model, runs):
+    print(f"{'MODE':<12}{'IMPORT S':>10}{'LOAD S':>9}{'1ST PRED S':>12}{'TOTAL S':>9}")
+    for label, eager, mmap_min_bytes in CASES:
+        results = [measure(model, eager, mmap_min_bytes) for _ in range(runs)]
+        med = {k: float(np.median([r[k] for r in results])) for k in results[0]}
+        print(f"{label:<12}{med['import']:>10.3f}{med['load']:>9.3f}{med['predict']:>12.3f}{med['total']:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Model cold start benchmark')
+    parser.add_argument('--model', type=str, default='tb')
+    parser.add_argument('--runs', type=int, default=3)
+
+    args = parser.parse_args()
+    main(args.model, args.runs)
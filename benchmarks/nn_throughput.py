@@ -0,0 +1,101 @@
+"""
+Training and inference throughput (samples/sec) of TBAdherenceNN on CRT_dataset.csv.
+
+"dataloader" is the per-item path: a DataLoader over TBAdherenceDataset that
+calls __getitem__ once per row and collates every batch. "batched" draws one
+permutation per epoch and gathers each batch with index_select from the
+pre-materialized tensors (what TBAdherenceTrainer does), in eager mode,
+TorchScript and torch.compile. The rows are repeated --scale times so epochs
+are long enough to time; one warm-up epoch (compilation) is not timed.
+
+    python benchmarks/nn_throughput.py [--scale 10] [--epochs 3] [--batch-size 256] [--threads N]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import warnings
+import contextlib
+
+import pandas as pd
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from models.tb_adherence_nn import TBAdherenceDataset, TBAdherenceNN, TBAdherenceTrainer, iter_batches
+
+
+def train_epochs(forward, model, batches, epochs):
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    loss_fn = nn.BCELoss()
+    forward.train()
+
+    def step(X, y):
+        optimizer.zero_grad(set_to_none=True)
+        loss = loss_fn(forward(X), y)
+        loss.backward()
+        optimizer.step()
+
+    # One untimed epoch: compiles the backward graph and the short last batch
+    for X, y in batches():
+        step(X, y)
+    rows = 0
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for X, y in batches():
+            step(X, y)
+            rows += len(X)
+    return rows / (time.perf_counter() - start)
+
+
+def infer(forward, X, batch_size):
+    forward.eval()
+    with torch.no_grad():
+        # Eval mode may trigger a recompile; keep it out of the timing
+        forward(X[:batch_size])
+        start = time.perf_counter()
+        for s in range(0, len(X), batch_size):
+            forward(X[s:s + batch_size])
+    return len(X) / (time.perf_counter() - start)
+
+
+def main(scale, epochs, batch_size, threads):
+    if threads:
+        torch.set_num_threads(threads)
+    df = pd.read_csv(os.path.join(project_root, 'CRT_dataset.csv'), low_memory=False)
+    df = pd.concat([df] * scale, ignore_index=True)
+    data = TBAdherenceDataset(df)
+    print(f"{len(data)} rows, batch {batch_size}, {torch.get_num_threads()} threads, torch {torch.__version__}")
+
+    loader = DataLoader(data, batch_size=batch_size, shuffle=True)
+    batched = lambda: (data.batch(idx) for idx in iter_batches(len(data), batch_size, shuffle=True))
+
+    print(f"{'PIPELINE':<12}{'MODE':<10}{'TRAIN ROWS/S':>14}{'INFER ROWS/S':>14}")
+    cases = [('dataloader', 'eager', lambda: loader)] + [('batched', m, batched) for m in ('eager', 'script', 'compile')]
+    for pipeline, mode, batches in cases:
+        torch.manual_seed(42)
+        model = TBAdherenceNN(data.X.shape[1])
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            forward = TBAdherenceTrainer(compile_mode=mode)._compiled(model, data.X[:batch_size])
+        if mode != 'eager' and forward is model:
+            print(f"{pipeline:<12}{mode:<10}  unavailable: {out.getvalue().strip()}")
+            continue
+        train_rate = train_epochs(forward, model, batches, epochs)
+        infer_rate = infer(forward, data.X, 4096)
+        print(f"{pipeline:<12}{mode:<10}{train_rate:>14,.0f}{infer_rate:>14,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='TBAdherenceNN throughput benchmark')
+    parser.add_argument('--scale', type=int, default=10, help='Times to repeat the dataset')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads (default: all cores)')
+
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+    main(args.scale, args.epochs, args.batch_size, args.threads)
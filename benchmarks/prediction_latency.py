@@ -0,0 +1,88 @@
+"""
+Offline latency check of the online prediction server.
+
+Starts pipelines/prediction_server.py in-process on a free port, then runs
+--clients concurrent keep-alive clients that each send --requests
+single-patient predictions taken from the training CSV. Prints client-side
+p50/p99 and the server's own /metrics, with and without micro-batching.
+Needs the artifact of the model under test (run snowflake_ml_pipeline.py).
+
+    python benchmarks/prediction_latency.py [--model tb] [--clients 32] [--requests 200]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import numpy as np
+import pandas as pd
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'pipelines'))
+
+from prediction_server import PredictionServer, PredictionClient
+
+DATASETS = {
+    'tb': 'CRT_dataset.csv',
+    'menstrual': 'FedCycleData.csv',
+    'hiv_adherence': 'HIV_adherence_dataset.csv'
+}
+
+
+async def run_client(port, model, records, latencies):
+    client = await PredictionClient('127.0.0.1', port).connect()
+    try:
+        for record in records:
+            start = time.perf_counter()
+            await client.predict(model, [record])
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        await client.close()
+
+
+async def run_case(model, records, clients, requests, max_batch, max_wait_ms):
+    server = PredictionServer([model], port=0, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    await server.start()
+    latencies = []
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            run_client(server.port, model, records[i * requests:(i + 1) * requests], latencies)
+            for i in range(clients)
+        ])
+        seconds = time.perf_counter() - start
+        metrics = server.metrics()[model]
+    finally:
+        await server.stop()
+    lat = np.array(latencies)
+    return {
+        'p50': np.percentile(lat, 50),
+        'p99': np.percentile(lat, 99),
+        'rps': len(lat) / seconds,
+        'batch': metrics['mean_batch_rows']
+    }
+
+
+def main(model, clients, requests):
+    df = pd.read_csv(os.path.join(project_root, DATASETS[model]), low_memory=False)
+    rows = df.sample(clients * requests, replace=True, random_state=42)
+    # JSON-safe records, as a caller would send them
+    records = [{k: (None if pd.isna(v) else v) for k, v in r.items()}
+               for r in rows.astype(object).to_dict('records')]
+
+    cases = [('micro-batched', 256, 2.0), ('one per call', 1, 0.0)]
+    print(f"\n{'MODE':<15}{'P50 MS':>9}{'P99 MS':>9}{'REQ/S':>10}{'MEAN BATCH':>12}")
+    for label, max_batch, max_wait in cases:
+        r = asyncio.run(run_case(model, records, clients, requests, max_batch, max_wait))
+        print(f"{label:<15}{r['p50']:>9.2f}{r['p99']:>9.2f}{r['rps']:>10,.0f}{r['batch']:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Prediction server latency benchmark')
+    parser.add_argument('--model', type=str, default='tb', choices=list(DATASETS))
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200)
+
+    args = parser.parse_args()
+    main(args.model, args.clients, args.requests)
@@ -0,0 +1,84 @@
+"""
+Query latency and IVF recall of the RAG vector index (pipelines/rag_index.py)
+on a synthetic corpus: --rows chunks of 150 words drawn from topic-specific
+Zipf vocabularies, embedded with the deterministic HashingEmbedder into a
+temporary index. Reports p50/p99 per search mode and, for several nprobe
+values, recall@10 of IVF against the exact scan.
+
+    python benchmarks/rag_query.py [--rows 50000] [--queries 200]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'pipelines'))
+
+from rag_index import VectorIndex, HashingEmbedder
+
+TOPICS = 40
+VOCABULARY = 20000
+WORDS_PER_CHUNK = 150
+
+
+def synthetic_chunks(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    words = np.array([f'w{i}' for i in range(VOCABULARY)])
+    # Each topic ranks the vocabulary in its own order; word ranks are Zipf distributed
+    orders = [rng.permutation(VOCABULARY) for _ in range(TOPICS)]
+    topics = rng.integers(0, TOPICS, rows)
+    ranks = np.minimum(rng.zipf(1.3, (rows, WORDS_PER_CHUNK)), VOCABULARY) - 1
+    return [{'chunk_id': f'c{i}', 'doc_id': f'd{i // 100}', 'source': 'synthetic', 'page': 1,
+             'text': ' '.join(words[orders[t][r]])} for i, (t, r) in enumerate(zip(topics, ranks))]
+
+
+def latencies(fn, queries):
+    out = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        out.append((time.perf_counter() - start) * 1000)
+    return np.percentile(out, 50), np.percentile(out, 99)
+
+
+def main(rows, n_queries):
+    chunks = synthetic_chunks(rows)
+    rng = np.random.default_rng(7)
+    queries = [' '.join(chunks[i]['text'].split()[:12]) for i in rng.choice(rows, n_queries, replace=False)]
+
+    with tempfile.TemporaryDirectory() as root:
+        index = VectorIndex(root, HashingEmbedder())
+        start = time.perf_counter()
+        index.append(chunks)
+        build = time.perf_counter() - start
+        print(f"Indexed {rows} chunks in {build:.1f}s ({rows / build:,.0f} chunks/s), "
+              f"{len(index.centroids) if index.centroids is not None else 0} IVF lists")
+        index.search(queries[0], mode='bm25')  # builds the BM25 postings
+
+        vectors = index.embedder.encode(queries)
+        exact = [set(index.dense(v, 10, exact=True)[0].tolist()) for v in vectors]
+
+        print(f"{'SEARCH':<24}{'P50 MS':>10}{'P99 MS':>10}{'RECALL@10':>12}")
+        p50, p99 = latencies(lambda v: index.dense(v, 10, exact=True), vectors)
+        print(f"{'dense exact':<24}{p50:>10.2f}{p99:>10.2f}{1:>12.3f}")
+        for nprobe in (4, 8, 16, 32):
+            p50, p99 = latencies(lambda v: index.dense(v, 10, nprobe), vectors)
+            recall = np.mean([len(set(index.dense(v, 10, nprobe)[0].tolist()) & e) / 10
+                              for v, e in zip(vectors, exact)])
+            print(f"{f'dense ivf nprobe={nprobe}':<24}{p50:>10.2f}{p99:>10.2f}{recall:>12.3f}")
+        for mode in ('bm25', 'hybrid'):
+            p50, p99 = latencies(lambda q: index.search(q, 10, mode), queries)
+            print(f"{mode:<24}{p50:>10.2f}{p99:>10.2f}{'':>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='RAG index query latency benchmark')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+
+    args = parser.parse_args()
+    main(args.rows, args.queries)
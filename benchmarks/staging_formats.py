@@ -0,0 +1,121 @@
+"""
+Compares CSV and Parquet staging for the Postgres -> Snowflake sync.
+
+For every table in TABLES_TO_SYNC the rows are streamed from Postgres exactly as
+sync_table does, masked, and written in both formats. Reported per format:
+write time and bytes staged (CSV is measured gzipped, as PUT AUTO_COMPRESS would
+send it). With --load each format is also PUT + COPY'd into a transient scratch
+table in Snowflake to time the load.
+
+    python benchmarks/staging_formats.py [--load] [--tables ovc_cases households]
+"""
+import os
+import sys
+import gzip
+import shutil
+import time
+import argparse
+import tempfile
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(project_root, 'pipelines'))
+
+from postgres_to_snowflake_sync import (
+    TABLES_TO_SYNC,
+    SYNC_BATCH_ROWS,
+    STAGE_FORMATS,
+    get_postgres_conn,
+    get_snowflake_conn,
+    iter_batches,
+    snowflake_type,
+    write_stage_file,
+    copy_into_sql
+)
+from masking import mask_dataframe
+
+
+def gzipped_size(path):
+    gz_path = f"{path}.gz"
+    with open(path, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    size = os.path.getsize(gz_path)
+    os.remove(gz_path)
+    return size
+
+
+def stage_table(pg_conn, table_name, stage_format, out_dir, batch_size):
+    """Writes every batch of a table in one format; returns (files, column types, rows, bytes, seconds)."""
+    files, col_types, rows, size, seconds = [], None, 0, 0, 0.0
+    for i, df in enumerate(iter_batches(pg_conn, f"SELECT * FROM {table_name}", None, batch_size)):
+        df = mask_dataframe(df, verbose=False)
+        start = time.perf_counter()
+        path = write_stage_file(df, os.path.join(out_dir, f"{table_name}_{i:05d}"), stage_format)
+        seconds += time.perf_counter() - start
+        size += gzipped_size(path) if stage_format == 'csv' else os.path.getsize(path)
+        rows += len(df)
+        files.append(path)
+        if col_types is None:
+            col_types = {col: snowflake_type(df[col]) for col in df.columns}
+    return files, col_types, rows, size, seconds
+
+
+def load_table(sf_cursor, table_name, stage_format, files, col_types):
+    """PUT + COPY the staged files into a transient scratch table and time it."""
+    scratch = f"RAW.BENCH_{table_name.upper()}_{stage_format.upper()}"
+    stage_path = f"@RAW.JALI_CSV_STAGE/bench/{table_name}/{stage_format}/"
+    cols_sql = ", ".join(f"{col.upper()} {sf_type}" for col, sf_type in col_types.items())
+    sf_cursor.execute(f"CREATE OR REPLACE TRANSIENT TABLE {scratch} ({cols_sql})")
+    sf_cursor.execute(f"REMOVE {stage_path}")
+
+    start = time.perf_counter()
+    compress = 'FALSE' if stage_format == 'parquet' else 'TRUE'
+    for path in files:
+        abs_path = os.path.abspath(path).replace('\\', '/')
+        sf_cursor.execute(f"PUT 'file://{abs_path}' {stage_path} OVERWRITE=TRUE AUTO_COMPRESS={compress}")
+    sf_cursor.execute(copy_into_sql(scratch, stage_path, list(col_types), stage_format))
+    seconds = time.perf_counter() - start
+
+    sf_cursor.execute(f"DROP TABLE IF EXISTS {scratch}")
+    sf_cursor.execute(f"REMOVE {stage_path}")
+    return seconds
+
+
+def run_benchmark(tables=None, load=False, batch_size=SYNC_BATCH_ROWS):
+    selected = [t['name'] for t in TABLES_TO_SYNC if not tables or t['name'] in tables]
+    pg_conn = get_postgres_conn()
+    sf_conn = get_snowflake_conn() if load else None
+    results = []
+    try:
+        for table_name in selected:
+            for stage_format in STAGE_FORMATS:
+                out_dir = tempfile.mkdtemp(prefix=f"jali_bench_{table_name}_")
+                try:
+                    files, col_types, rows, size, write_s = stage_table(
+                        pg_conn, table_name, stage_format, out_dir, batch_size)
+                    load_s = None
+                    if load and files:
+                        load_s = load_table(sf_conn.cursor(), table_name, stage_format, files, col_types)
+                    results.append((table_name, stage_format, rows, size, write_s, load_s))
+                finally:
+                    shutil.rmtree(out_dir, ignore_errors=True)
+    finally:
+        pg_conn.close()
+        if sf_conn: sf_conn.close()
+
+    print(f"\n{'TABLE':<25}{'FORMAT':<9}{'ROWS':>10}{'STAGED MB':>11}{'WRITE S':>9}{'LOAD S':>9}")
+    for table_name, stage_format, rows, size, write_s, load_s in results:
+        load_txt = f"{load_s:>9.2f}" if load_s is not None else f"{'-':>9}"
+        print(f"{table_name:<25}{stage_format:<9}{rows:>10}{size / 1e6:>11.3f}{write_s:>9.2f}{load_txt}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CSV vs Parquet staging benchmark')
+    parser.add_argument('--tables', nargs='*', default=None,
+                        help='Subset of tables to benchmark (default: all synced tables)')
+    parser.add_argument('--load', action='store_true',
+                        help='Also time PUT + COPY into transient Snowflake scratch tables')
+    parser.add_argument('--batch-size', type=int, default=SYNC_BATCH_ROWS)
+
+    args = parser.parse_args()
+    run_benchmark(tables=args.tables, load=args.load, batch_size=args.batch_size)
@@ -13,7 +13,7 @@ try:
     from postgres_to_snowflake_sync import run_full_sync
 except ImportError:
     
-    def run_full_sync():
+    def run_full_sync(**kwargs):
         print("Error: Could not find postgres_to_snowflake_sync.py in pipelines folder.")
 
 # workflow dag defination
@@ -40,10 +40,12 @@ with DAG(
     sync_task = PythonOperator(
         task_id='sync_all_postgres_tables',
         python_callable=run_full_sync,
+        op_kwargs={'concurrent': True},
         doc_md="""
         ### Multi-Table Sync
-        This task iterates through all configured Postgres tables and syncs them 
-        into the Snowflake RAW schema incrementally.
+        This task syncs all configured Postgres tables into the Snowflake RAW
+        schema incrementally. Independent tables run in parallel; FK-dependent
+        tables wait for their parents.
         """
     )
 
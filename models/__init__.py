@@ -1,7 +1,13 @@
-from .tb_adherence_model import TBAdherenceModel
-from .menstrual_tracking_model import MenstrualTrackingModel
-from .hiv_qoc_model import HIVQocModel
-from .hiv_adherence_model import HIVAdherenceModel
+import importlib
+
+# Pillar classes are imported on first access, so `import models` stays cheap
+# and only the pillars actually used pull in xgboost/sklearn.
+_LAZY = {
+    'TBAdherenceModel': '.tb_adherence_model',
+    'MenstrualTrackingModel': '.menstrual_tracking_model',
+    'HIVQocModel': '.hiv_qoc_model',
+    'HIVAdherenceModel': '.hiv_adherence_model'
+}
 
 __all__ = [
     'TBAdherenceModel',
@@ -9,3 +15,11 @@ __all__ = [
     'HIVQocModel',
     'HIVAdherenceModel'
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,5 @@
 import os
-import joblib
+import time
 import pandas as pd
 import numpy as np
 from abc import ABC, abstractmethod
@@ -8,11 +8,28 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
+from datetime import datetime
+from .preprocessing import PreprocessingPlan, CategoryEncoder
+from . import registry
+from . import feature_cache
+from . import incremental
+
+CATEGORICAL_ENCODING = os.getenv('JALI_CATEGORICAL_ENCODING', 'onehot')
+CATEGORICAL_ENCODINGS = ('onehot', 'native')
 
 class JaliBaseModel(ABC):
     def __init__(self, model_name):
         self.model_name = model_name
         self.pipeline = None
+        self.metadata = {}
+        # Threads for the estimator (xgboost n_jobs); None keeps its default
+        self.n_jobs = None
+        # Estimator params found by tune(), applied on top of build_estimator()
+        self.tuned_params = None
+        self.use_cache = feature_cache.FEATURE_CACHE_ENABLED
+        # 'onehot' (scaled numerics + OneHotEncoder) or 'native' (XGBoost categorical splits)
+        self.categorical_encoding = CATEGORICAL_ENCODING
+        self.cache = feature_cache.FeatureCache()
         self.feature_cols = self.get_feature_columns()
         self.target_col = self.get_target_column()
         self.categorical_features = self.get_categorical_columns()
@@ -38,11 +55,37 @@ class JaliBaseModel(ABC):
         """Return the ML estimator (e.g. XGBClassifier)."""
         pass
 
-    def build_pipeline(self, numerical_features=None, categorical_features=None):
-        """Constructs the full scikit-learn pipeline."""
+    def build_plan(self):
+        """The cleaning step shared by training and inference."""
+        return PreprocessingPlan(self.feature_cols, self.categorical_features, self.target_col)
+
+    def configured_estimator(self):
+        """build_estimator() with the tuned params and thread budget applied."""
+        estimator = self.build_estimator()
+        if self.tuned_params:
+            estimator.set_params(**self.tuned_params)
+        if self.n_jobs is not None and 'n_jobs' in estimator.get_params():
+            estimator.set_params(n_jobs=self.n_jobs)
+        if self.categorical_encoding == 'native':
+            estimator.set_params(enable_categorical=True, tree_method='hist')
+        return estimator
+
+    def build_pipeline(self, numerical_features=None, categorical_features=None, plan=None):
+        """Constructs the full scikit-learn pipeline, led by the plan when one is given."""
         num_cols = numerical_features if numerical_features is not None else self.numerical_features
         cat_cols = categorical_features if categorical_features is not None else self.categorical_features
 
+        if self.categorical_encoding not in CATEGORICAL_ENCODINGS:
+            raise ValueError(f"Unknown categorical encoding '{self.categorical_encoding}'. "
+                             f"Choose from: {', '.join(CATEGORICAL_ENCODINGS)}")
+        if self.categorical_encoding == 'native':
+            steps = [('prepare', plan)] if plan is not None else []
+            self.pipeline = Pipeline(steps=steps + [
+                ('preprocessor', CategoryEncoder(cat_cols)),
+                ('classifier', self.configured_estimator())
+            ])
+            return self.pipeline
+
         numeric_transformer = Pipeline(steps=[
             ('scaler', StandardScaler())
         ])
@@ -57,88 +100,290 @@ class JaliBaseModel(ABC):
                 ('cat', categorical_transformer, cat_cols)
             ])
 
-        self.pipeline = Pipeline(steps=[
+        estimator = self.configured_estimator()
+        steps = [('prepare', plan)] if plan is not None else []
+        self.pipeline = Pipeline(steps=steps + [
             ('preprocessor', preprocessor),
-            ('classifier', self.build_estimator())
+            ('classifier', estimator)
         ])
         return self.pipeline
 
+    def split_data(self, df):
+        """The plan, and the train/test split of the rows that have a target."""
+        # Only the model's own columns are cleaned, and only rows with a target
+        plan = self.build_plan()
+        df = plan.project(df)
+        y = plan.target(df)
+        X = df.loc[y.index, [c for c in df.columns if c != self.target_col]]
+
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42, stratify=y if len(np.unique(y)) > 1 else None
+        )
+        return plan, X_train, X_test, y_train, y_test
+
+    def fit_design(self, plan, X_fit, y_fit, X_eval, y_eval, purpose='train'):
+        """
+        Fits the plan + ColumnTransformer on X_fit and transforms both frames.
+        Returns (cache key, fitted transform, fit matrix, eval matrix); when the
+        rows and feature config are unchanged the feature cache supplies all of
+        it without running the preprocessing.
+        """
+        key = None
+        if self.use_cache:
+            rows = pd.concat([pd.concat([X_fit, y_fit], axis=1), pd.concat([X_eval, y_eval], axis=1)])
+            key = feature_cache.fingerprint(self, registry.data_hash(rows), purpose)
+            cached = self.cache.get(key)
+            if cached is not None:
+                transform, arrays = cached
+                print(f"   Feature cache hit ({key[:8]}): preprocessing skipped.")
+                return key, transform, arrays['fit'], arrays['eval']
+
+        plan.fit(X_fit)
+        transform = self.build_pipeline(numerical_features=plan.numerical_,
+                                        categorical_features=plan.categorical_, plan=plan)[:-1]
+        X_fit_t = transform.fit_transform(X_fit, y_fit)
+        X_eval_t = transform.transform(X_eval)
+        if key is not None:
+            self.cache.put(key, transform, {'fit': X_fit_t, 'eval': X_eval_t},
+                           config={'model': self.model_name, 'purpose': purpose, 'rows': len(rows)})
+        return key, transform, X_fit_t, X_eval_t
+
     def train(self, df):
         """Clean, split, and train the model."""
         print(f"--- Training {self.model_name} ---")
-        
-        # Case-insensitive column matching
-        actual_cols = {c.upper(): c for c in df.columns}
-        
-        target_col = actual_cols.get(self.target_col.upper())
-        if not target_col:
-            raise KeyError(f"Target column {self.target_col} not found in dataframe.")
-        
-        feature_cols = []
+        started = time.perf_counter()
+        plan, X_train, X_test, y_train, y_test = self.split_data(df)
+
+        key, transform, X_train_t, X_test_t = self.fit_design(plan, X_train, y_train, X_test, y_test)
+        plan = transform.named_steps['prepare']
         for c in self.feature_cols:
-            actual_c = actual_cols.get(c.upper())
-            if not actual_c:
+            if c not in plan.features_:
                 print(f"   Warning: Feature {c} not found in data.")
-                continue
-            feature_cols.append(actual_c)
-            
-        categorical_features = [actual_cols.get(c.upper()) for c in self.categorical_features if c.upper() in actual_cols]
-        numerical_features = [actual_cols.get(c.upper()) for c in self.numerical_features if c.upper() in actual_cols]
-
-        # Drop rows with missing target
-        df = df.dropna(subset=[target_col])
+
+        # Same data, same params: the fit recorded in the cache is the one we would get
+        estimator = self.configured_estimator()
+        estimator_key = feature_cache.params_key(estimator)
+        fit = self.cache.get_fit(key, estimator_key) if key is not None else None
+        if fit is not None:
+            estimator, result = fit
+            print(f"   Unchanged data and parameters: reusing the cached fit.")
+        else:
+            estimator.fit(X_train_t, y_train)
+
+            # Evaluation
+            y_pred = estimator.predict(X_test_t)
+            y_prob = estimator.predict_proba(X_test_t)[:, 1]
+            result = {
+                'auc': float(roc_auc_score(y_test, y_prob)),
+                'report': classification_report(y_test, y_pred, output_dict=True),
+                'report_text': classification_report(y_test, y_pred)
+            }
+            if key is not None:
+                self.cache.put_fit(key, estimator_key, estimator, result)
+        self.pipeline = Pipeline(steps=list(transform.steps) + [('classifier', estimator)])
+
+        print("\nClassification Report:")
+        print(result['report_text'])
         
-        # Pre-cleaning: remove leading/trailing spaces from all columns
-        df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
+        auc = result['auc']
+        print(f"AUC-ROC Score: {auc:.4f}")
+
+        self.metadata = {
+            'features': plan.features_,
+            'categorical_features': plan.categorical_,
+            'target': self.target_col,
+            'auc': float(auc),
+            'data_hash': registry.data_hash(pd.concat([X_train, y_train], axis=1)),
+            'rows': len(X_train) + len(X_test),
+            'params': self.tuned_params,
+            'encoding': self.categorical_encoding,
+            'watermark': incremental.watermark(df, plan.project(df)),
+            'profile': incremental.build_profile(plan.transform(X_train), y_train,
+                                                 plan.numerical_, plan.categorical_),
+            'cache_key': key and f"{key}:{estimator_key}",
+            'trained_at': datetime.now().isoformat(timespec='seconds'),
+            'train_seconds': round(time.perf_counter() - started, 3)
+        }
 
-        # Force numerical conversion
-        for col in numerical_features:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+        return {
+            'auc': auc,
+            'report': result['report'],
+            'from_cache': fit is not None
+        }
 
-        # Fill missing features with defaults
-        df[numerical_features] = df[numerical_features].fillna(0)
-        df[categorical_features] = df[categorical_features].fillna('Unknown')
+    def train_incremental(self, df, rounds=None):
+        """
+        Continues boosting the latest saved artifact on only the rows newer than
+        its training watermark (`rounds` more trees, default INCREMENTAL_ROUNDS),
+        reusing its fitted preprocessing, so an update costs in proportion to the
+        new data. Falls back to train() on the full frame when there is no usable
+        artifact, the features, encoding or parameters changed, the trained rows
+        cannot be matched, or the new rows drift from the training profile.
+        Returns train()'s result plus 'mode' ('incremental', 'full', or
+        'unchanged' when too few rows are new) and 'reason'; an incremental
+        update keeps the artifact's 'auc' and adds 'new_rows_auc', measured
+        on a held-out fifth of the new rows before boosting on all of them.
+        """
+        print(f"--- Incremental training {self.model_name} ---")
+        started = time.perf_counter()
+        try:
+            path = self.artifact_path()
+        except FileNotFoundError:
+            return self._retrain(df, "no saved artifact")
+        previous = registry.read_metadata(path)
+        if 'watermark' not in previous or 'profile' not in previous:
+            return self._retrain(df, "artifact has no training watermark")
+        pipeline = registry.load_pipeline(path)
+        if 'prepare' not in pipeline.named_steps:
+            return self._retrain(df, "artifact predates the preprocessing plan")
 
-        X = df[feature_cols]
-        y = df[target_col]
+        plan = self.build_plan()
+        projected = plan.project(df)
+        reason = incremental.schema_change(previous, plan.fit(projected), self.categorical_encoding)
+        if reason is None and previous.get('params') != self.tuned_params:
+            reason = "estimator parameters changed"
+        if reason is None:
+            mask, reason = incremental.new_rows(df, projected, previous['watermark'])
+        if reason is not None:
+            return self._retrain(df, reason)
 
-        # Final check: Convert target to numeric
-        if y.dtype == object:
-            y = pd.to_numeric(y, errors='coerce').fillna(0)
+        new = projected[mask]
+        y = plan.target(new)
+        X = new.loc[y.index, [c for c in new.columns if c != self.target_col]]
+        if len(X) < incremental.INCREMENTAL_MIN_ROWS:
+            reason = f"{len(X)} new rows (need {incremental.INCREMENTAL_MIN_ROWS})"
+            print(f"   {reason}; keeping {os.path.basename(path)}.")
+            self.pipeline, self.metadata = pipeline, previous
+            return {'auc': previous.get('auc'), 'report': None, 'from_cache': False,
+                    'mode': 'unchanged', 'reason': reason}
 
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y if len(np.unique(y)) > 1 else None
+        # Drift is judged on the cleaned features, against the last full training
+        transform = pipeline[:-1]
+        scores = incremental.drift(previous['profile'], transform.named_steps['prepare'].transform(X), y)
+        worst = max(scores, key=scores.get)
+        if scores[worst] > incremental.DRIFT_PSI_THRESHOLD:
+            return self._retrain(df, f"drift in {worst} (PSI {scores[worst]:.3f})")
+
+        # Judged on held-out new rows first; the update that ships is then boosted on all of them,
+        # so none of the rows the watermark moves past are left out of the model
+        X_fit, X_eval, y_fit, y_eval = train_test_split(
+            X, y, test_size=0.2, random_state=42, stratify=y if y.value_counts().min() > 1 else None
         )
+        rounds = rounds or incremental.INCREMENTAL_ROUNDS
+        booster = pipeline.named_steps['classifier'].get_booster()
+        auc, report = None, None
+        if len(np.unique(y_eval)) > 1:
+            trial = self.configured_estimator().set_params(n_estimators=rounds)
+            trial.fit(transform.transform(X_fit), y_fit, xgb_model=booster)
+            X_eval_t = transform.transform(X_eval)
+            auc = float(roc_auc_score(y_eval, trial.predict_proba(X_eval_t)[:, 1]))
+            report = classification_report(y_eval, trial.predict(X_eval_t), output_dict=True)
+        estimator = self.configured_estimator().set_params(n_estimators=rounds)
+        estimator.fit(transform.transform(X), y, xgb_model=booster)
+        self.pipeline = Pipeline(steps=list(transform.steps) + [('classifier', estimator)])
+        print(f"   Boosted {rounds} more rounds on {len(X)} new rows "
+              f"(max PSI {scores[worst]:.3f} in {worst}); "
+              f"AUC on held-out new rows: {'n/a' if auc is None else f'{auc:.4f}'}")
 
-        self.build_pipeline(numerical_features=numerical_features, categorical_features=categorical_features)
-        self.pipeline.fit(X_train, y_train)
+        # 'auc' stays the last full training's test score; the new-rows score is a small-sample check
+        updates = previous.get('incremental', {}).get('updates', 0) + 1
+        self.metadata = dict(
+            {k: v for k, v in previous.items() if k not in ('model_name', 'version')},
+            data_hash=registry.data_hash(pd.concat([X, y], axis=1)),
+            rows=previous.get('rows', 0) + len(X),
+            cache_key=None,
+            watermark=incremental.watermark(df, projected),
+            incremental={'base_version': previous.get('version'), 'updates': updates,
+                         'new_rows': len(X), 'rounds': rounds, 'max_psi': scores[worst],
+                         'new_rows_auc': auc, 'new_rows_eval': len(X_eval)},
+            trained_at=datetime.now().isoformat(timespec='seconds'),
+            train_seconds=round(time.perf_counter() - started, 3)
+        )
+        return {'auc': previous.get('auc'), 'new_rows_auc': auc, 'report': report, 'from_cache': False,
+                'mode': 'incremental', 'reason': None}
 
-        # Evaluation
-        y_pred = self.pipeline.predict(X_test)
-        y_prob = self.pipeline.predict_proba(X_test)[:, 1]
+    def _retrain(self, df, reason):
+        print(f"   Full retrain: {reason}.")
+        result = self.train(df)
+        result.update(mode='full', reason=reason)
+        return result
 
-        print("\nClassification Report:")
-        print(classification_report(y_test, y_pred))
-        
-        auc = roc_auc_score(y_test, y_prob)
-        print(f"AUC-ROC Score: {auc:.4f}")
+    def saved_metadata(self):
+        """Metadata of the latest saved artifact ({} if there is none)."""
+        try:
+            return registry.read_metadata(self.artifact_path())
+        except FileNotFoundError:
+            return {}
 
-        return {
-            'auc': auc,
-            'report': classification_report(y_test, y_pred, output_dict=True)
-        }
+    def tune(self, df, n_candidates=None, max_rounds=None):
+        """
+        Successive-halving search over the estimator's parameters, early-stopped
+        on a validation split carved out of the training rows (the test rows
+        train() reports on are never seen). The best parameters become
+        self.tuned_params for the next train() and are saved next to the
+        artifacts. Trials share self.n_jobs threads (default: all cores).
+        Returns the parameters.
+        """
+        from .tuning import successive_halving, TUNE_CANDIDATES, TUNE_MAX_ROUNDS
+
+        print(f"--- Tuning {self.model_name} ---")
+        started = time.perf_counter()
+        plan, X_train, _, y_train, _ = self.split_data(df)
+        X_fit, X_val, y_fit, y_val = train_test_split(
+            X_train, y_train, test_size=0.2, random_state=42,
+            stratify=y_train if len(np.unique(y_train)) > 1 else None
+        )
+
+        # Clean and encode once (or not at all, if cached); every trial reuses these matrices
+        self.tuned_params = None
+        _, _, X_fit_t, X_val_t = self.fit_design(plan, X_fit, y_fit, X_val, y_val, purpose='tune')
+        design = (X_fit_t, y_fit, X_val_t, y_val)
+
+        best, trials = successive_halving(
+            self.configured_estimator(), design,
+            n_candidates=n_candidates or TUNE_CANDIDATES, max_rounds=max_rounds or TUNE_MAX_ROUNDS,
+            threads=self.n_jobs
+        )
+        self.tuned_params = dict(best['config'], n_estimators=best['best_iteration'] + 1)
+        path = registry.save_tuned_params(self.model_name, {
+            'params': self.tuned_params,
+            'val_auc': best['auc'],
+            'trials': len(trials),
+            'data_hash': registry.data_hash(pd.concat([X_train, y_train], axis=1)),
+            'tuned_at': datetime.now().isoformat(timespec='seconds'),
+            'tune_seconds': round(time.perf_counter() - started, 3)
+        })
+        print(f"Best val AUC {best['auc']:.4f} after {len(trials)} trials "
+              f"in {time.perf_counter() - started:.2f}s; saved to {path}")
+        return self.tuned_params
+
+    def use_tuned_params(self):
+        """Picks up the parameters saved by an earlier tune(), if any."""
+        saved = registry.load_tuned_params(self.model_name)
+        self.tuned_params = saved.get('params') if saved else None
+        return self.tuned_params
+
+    def predict_proba(self, df):
+        """Probability of the positive class for raw rows, cleaned by the pipeline's own plan."""
+        if 'prepare' not in self.pipeline.named_steps:
+            # Artifacts saved before the plan existed expect already-cleaned columns
+            df = self.build_plan().fit(df).transform(df)
+        return self.pipeline.predict_proba(df)[:, 1]
+
+    def artifact_path(self, version=None):
+        """The saved artifact for a version (default: latest)."""
+        return registry.resolve_artifact(self.model_name, version)
 
     def save(self):
-        """Save model to artifacts folder."""
-        artifact_dir = os.path.join(os.path.dirname(__file__), 'artifacts')
-        os.makedirs(artifact_dir, exist_ok=True)
-        path = os.path.join(artifact_dir, f"{self.model_name.lower().replace(' ', '_')}.joblib")
-        joblib.dump(self.pipeline, path)
+        """Save the pipeline and its metadata as a new version in the artifacts folder."""
+        path = registry.save_artifact(self.pipeline, self.model_name, self.metadata)
         print(f"Model saved to {path}")
         return path
 
-    def load(self, path):
-        """Load model from path."""
-        self.pipeline = joblib.load(path)
+    def load(self, path=None, version=None):
+        """Load model from path (default: this model's latest artifact, or the given version)."""
+        path = path or self.artifact_path(version)
+        self.pipeline = registry.load_pipeline(path)
+        self.metadata = registry.read_metadata(path)
         print(f"Model loaded from {path}")
         return self.pipeline
@@ -0,0 +1,190 @@
+"""
+On-disk cache of fitted preprocessors and transformed design matrices.
+
+An entry is keyed by a fingerprint of the model's input rows (after the plan
+has projected them) and of its feature config, so an unchanged pillar can
+skip the ColumnTransformer entirely, and, when the estimator parameters match
+a fit already recorded in the entry, skip training too. Layout:
+
+    <FEATURE_CACHE_DIR>/<key>/transform.joblib     fitted plan + ColumnTransformer
+    <FEATURE_CACHE_DIR>/<key>/<name>.npz | .npy    matrices (sparse npz, dense npy mmap'd on load,
+                                                   or .joblib frames for native categoricals)
+    <FEATURE_CACHE_DIR>/<key>/fit_<params>.joblib  fitted estimator + its evaluation
+    <FEATURE_CACHE_DIR>/<key>/meta.json            config, sizes, last use
+
+Entries are written to a temporary directory and renamed into place, so
+concurrent pillar processes never see half-written entries. The cache is
+capped at FEATURE_CACHE_MAX_BYTES; least recently used entries go first.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+FEATURE_CACHE_DIR = os.getenv('FEATURE_CACHE_DIR', os.path.join(os.path.dirname(__file__), '.feature_cache'))
+FEATURE_CACHE_MAX_BYTES = int(os.getenv('FEATURE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+FEATURE_CACHE_ENABLED = os.getenv('FEATURE_CACHE', '1') != '0'
+
+# Estimator params that change speed, not the fitted model
+_RUNTIME_PARAMS = {'n_jobs', 'nthread', 'verbosity'}
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b'\0')
+    return h.hexdigest()[:24]
+
+
+def fingerprint(model, data_hash, purpose='train'):
+    """Key of one model's transformed data: input rows + feature config + library version."""
+    import sklearn
+
+    config = {
+        'class': type(model).__name__,
+        'features': model.feature_cols,
+        'categorical': model.categorical_features,
+        'target': model.target_col,
+        'encoding': getattr(model, 'categorical_encoding', 'onehot'),
+        'sklearn': sklearn.__version__
+    }
+    return _digest(config, data_hash, purpose)
+
+
+def params_key(estimator):
+    params = {k: v for k, v in estimator.get_params().items() if k not in _RUNTIME_PARAMS}
+    return _digest(type(estimator).__name__, params)
+
+
+class FeatureCache:
+    def __init__(self, root=FEATURE_CACHE_DIR, max_bytes=FEATURE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def _read_meta(self, key):
+        with open(os.path.join(self._entry(key), 'meta.json')) as f:
+            return json.load(f)
+
+    def _write_meta(self, folder, meta):
+        tmp = os.path.join(folder, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=2, default=str)
+        os.replace(tmp, os.path.join(folder, 'meta.json'))
+
+    def _touch(self, key, meta):
+        meta['last_used'] = time.time()
+        self._write_meta(self._entry(key), meta)
+
+    def get(self, key):
+        """(fitted transform, {name: matrix}) or None. Dense matrices come back memory-mapped."""
+        folder = self._entry(key)
+        try:
+            meta = self._read_meta(key)
+            transform = joblib.load(os.path.join(folder, 'transform.joblib'))
+            arrays = {}
+            for name, kind in meta['arrays'].items():
+                if kind == 'sparse':
+                    arrays[name] = sp.load_npz(os.path.join(folder, f'{name}.npz'))
+                elif kind == 'frame':
+                    arrays[name] = joblib.load(os.path.join(folder, f'{name}.joblib'))
+                else:
+                    arrays[name] = np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+        except (OSError, ValueError, KeyError):
+            return None
+        self._touch(key, meta)
+        return transform, arrays
+
+    def put(self, key, transform, arrays, config=None):
+        """Stores a fitted transform and its matrices under key, then enforces the size cap."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=f'.{key}.', dir=self.root)
+        try:
+            joblib.dump(transform, os.path.join(tmp, 'transform.joblib'))
+            kinds = {}
+            for name, matrix in arrays.items():
+                if sp.issparse(matrix):
+                    sp.save_npz(os.path.join(tmp, f'{name}.npz'), sp.csr_matrix(matrix), compressed=False)
+                    kinds[name] = 'sparse'
+                elif hasattr(matrix, 'columns'):
+                    # Frames with category columns (native categorical encoding)
+                    joblib.dump(matrix, os.path.join(tmp, f'{name}.joblib'))
+                    kinds[name] = 'frame'
+                else:
+                    np.save(os.path.join(tmp, f'{name}.npy'), np.asarray(matrix), allow_pickle=False)
+                    kinds[name] = 'dense'
+            self._write_meta(tmp, {'arrays': kinds, 'config': config or {}, 'created': time.time(),
+                                   'last_used': time.time(), 'fits': {}})
+            try:
+                os.rename(tmp, self._entry(key))
+            except OSError:
+                # Another process stored the same entry first; theirs is as good as ours
+                shutil.rmtree(tmp, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict()
+
+    def get_fit(self, key, estimator_key):
+        """(fitted estimator, stored result) recorded for these params, or None."""
+        try:
+            meta = self._read_meta(key)
+            name = meta['fits'].get(estimator_key)
+            if name is None:
+                return None
+            fit = joblib.load(os.path.join(self._entry(key), name))
+        except (OSError, ValueError, KeyError):
+            return None
+        self._touch(key, meta)
+        return fit['estimator'], fit['result']
+
+    def put_fit(self, key, estimator_key, estimator, result):
+        folder = self._entry(key)
+        if not os.path.isdir(folder):
+            return
+        name = f'fit_{estimator_key}.joblib'
+        tmp = os.path.join(folder, name + '.tmp')
+        joblib.dump({'estimator': estimator, 'result': result}, tmp)
+        os.replace(tmp, os.path.join(folder, name))
+        meta = self._read_meta(key)
+        meta['fits'][estimator_key] = name
+        self._touch(key, meta)
+        self.evict()
+
+    def entries(self):
+        """[(key, bytes, last_used)] of every complete entry."""
+        if not os.path.isdir(self.root):
+            return []
+        out = []
+        for key in os.listdir(self.root):
+            folder = self._entry(key)
+            if key.startswith('.') or not os.path.isdir(folder):
+                continue
+            try:
+                last_used = self._read_meta(key)['last_used']
+            except (OSError, ValueError, KeyError):
+                last_used = 0
+            size = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+            out.append((key, size, last_used))
+        return out
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self.max_bytes:
+            key, size, _ = entries.pop(0)
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,311 @@
+"""
+Dose-history aware immunization status for the whole caseload.
+
+ImmunizationTracker only knows a child's age; this engine also knows which
+doses each child has received, from the immunization events in ovc_cases
+(immunization_status + date_of_event), and reports per child the doses that
+are due, overdue (still inside their catch-up window) or missed (window
+closed), and the next dose to give.
+
+The KEPI schedule is compiled once into a ScheduleIndex: one slot per
+(vaccine, dose), sorted by due age, each with the interval of ages
+[due, due + grace) in which it is simply due, [due + grace, closes) in which
+it is overdue but can be caught up, and >= closes in which it is missed. A
+child's received doses are a bitmask over the slots, so joining events to
+the schedule and classifying every slot for every child are array operations.
+
+The engine is incremental: update() folds new events into the saved
+bitmasks and recomputes only the children with new events or new
+registrations or dates of birth, unless the as-of date moved (every age changed) or the
+schedule did (the bitmasks no longer line up), in which case everyone is.
+A 'Fully Immunized' event depends on the child's age at the event, so it is
+kept as the child's latest such date (full_on) and resolved against the dob
+at every recompute: it counts even when the dob arrives after the event.
+"""
+import os
+import re
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from . import registry
+
+GRACE_DAYS = int(os.getenv('IMMUNIZATION_GRACE_DAYS', '28'))
+# Oldest age (days) at which a dose may still be caught up: (vaccine prefix, dose or None) -> days
+CATCH_UP_LIMIT_DAYS = {('BCG', None): 365, ('OPV', 0): 14, ('ROTA', None): 365}
+DEFAULT_CATCH_UP_LIMIT_DAYS = 5 * 365
+# Normalised (_key) statuses meaning every dose due so far was given; matched exactly,
+# so 'Not Fully Immunized' or 'Partially Immunized' never count
+FULL_IMMUNIZATION_KEYS = {'FULL', 'FULLYIMMUNIZED', 'FULLYIMMUNISED', 'FULLYVACCINATED', 'FULLIMMUNIZATION'}
+IMMUNIZATION_STATE_PATH = os.getenv(
+    'IMMUNIZATION_STATE_PATH', os.path.join(registry.ARTIFACT_ROOT, 'immunization', 'engine_state.joblib')
+)
+
+_MAX_SLOTS = 64
+# Bumped when the saved state's layout changes
+_STATE_VERSION = 3
+
+
+def _key(text):
+    return re.sub(r'[^A-Z0-9]', '', str(text).upper())
+
+
+def _column(df, name):
+    actual = {str(c).upper(): c for c in df.columns}
+    return actual.get(name.upper())
+
+
+class ScheduleIndex:
+    """The schedule as parallel arrays of dose slots, sorted by due age."""
+
+    def __init__(self, schedule, grace_days=GRACE_DAYS):
+        """schedule: ImmunizationTracker.schedule (VACCINE_NAME, due_days, optionally DOSE)."""
+        slots = schedule.dropna(subset=['due_days']).sort_values('due_days', kind='stable').reset_index(drop=True)
+        if len(slots) > _MAX_SLOTS:
+            raise ValueError(f"Schedule has {len(slots)} doses; at most {_MAX_SLOTS} are supported.")
+        vaccine = slots['VACCINE_NAME'].astype(str).str.strip()
+        dose = pd.to_numeric(slots['DOSE'].astype(str).str.extract(r'(\d+)')[0], errors='coerce') \
+            if 'DOSE' in slots.columns else pd.Series(np.nan, index=slots.index)
+        # Doses without a number are numbered in due order within their vaccine
+        dose = dose.fillna(vaccine.groupby(vaccine).cumcount() + 1).astype(int)
+
+        self.vaccine = vaccine.to_numpy(dtype=object)
+        self.dose = dose.to_numpy()
+        self.labels = np.array([f"{v} {d}" for v, d in zip(self.vaccine, self.dose)], dtype=object)
+        self.due = slots['due_days'].to_numpy(dtype=np.int64)
+        self.overdue_from = self.due + grace_days
+        self.closes = np.maximum([self._limit(v, d) for v, d in zip(self.vaccine, self.dose)], self.overdue_from)
+        self.bits = np.left_shift(np.uint64(1), np.arange(len(slots), dtype=np.uint64))
+        # prefix[k]: the first k slots, i.e. everything due by an age with k slots due
+        self.prefix = np.concatenate([[np.uint64(0)], np.cumsum(self.bits, dtype=np.uint64)])
+
+        self.slot_by_key = {_key(f"{v}{d}"): i for i, (v, d) in enumerate(zip(self.vaccine, self.dose))}
+        self.slots_by_vaccine = {}
+        for i, v in enumerate(self.vaccine):
+            self.slots_by_vaccine.setdefault(_key(v), []).append(i)
+        self.signature = registry.data_hash(pd.DataFrame({
+            'label': self.labels, 'due': self.due, 'closes': self.closes
+        }))
+
+    @staticmethod
+    def _limit(vaccine, dose):
+        name = _key(vaccine)
+        for (prefix, limit_dose), days in CATCH_UP_LIMIT_DAYS.items():
+            if name.startswith(prefix) and limit_dose in (None, dose):
+                return days
+        return DEFAULT_CATCH_UP_LIMIT_DAYS
+
+    def __len__(self):
+        return len(self.due)
+
+    def event_masks(self, statuses, ages):
+        """
+        Bitmask of the doses each event records. statuses: immunization_status
+        values; ages: the child's age in days at the event (NaN if unknown).
+        'Fully Immunized' (FULL_IMMUNIZATION_KEYS) covers every dose due by
+        then (no dose when the age is unknown: see full_events()); '<vaccine>
+        <dose>' that dose; a vaccine alone the latest of its
+        doses due by then (its first if none was); anything else ('Partial',
+        'Not Fully Immunized', 'Unknown') no dose.
+        """
+        # Statuses repeat a lot: parse each distinct one once
+        codes, uniques = pd.factorize(pd.Series(statuses, dtype=object).fillna(''))
+        ages = np.asarray(ages, dtype=float)
+        masks = np.zeros(len(codes), dtype=np.uint64)
+        for code, status in enumerate(uniques):
+            key = _key(status)
+            rows = codes == code
+            if key in self.slot_by_key:
+                masks[rows] = self.bits[self.slot_by_key[key]]
+            elif key in FULL_IMMUNIZATION_KEYS:
+                masks[rows] = self.full_masks(ages[rows])
+            elif key in self.slots_by_vaccine:
+                slots = np.asarray(self.slots_by_vaccine[key])
+                taken = np.searchsorted(self.due[slots], np.nan_to_num(ages[rows], nan=0), side='right')
+                masks[rows] = self.bits[slots[np.clip(taken - 1, 0, len(slots) - 1)]]
+        return masks
+
+    def full_events(self, statuses):
+        """Boolean mask of the statuses that record full immunization."""
+        codes, uniques = pd.factorize(pd.Series(statuses, dtype=object).fillna(''))
+        return np.array([_key(u) in FULL_IMMUNIZATION_KEYS for u in uniques], dtype=bool)[codes] \
+            if len(uniques) else np.zeros(len(codes), dtype=bool)
+
+    def full_masks(self, ages):
+        """Every dose due by each age in days (0 where the age is unknown)."""
+        ages = np.asarray(ages, dtype=float)
+        known = ~np.isnan(ages)
+        masks = np.zeros(len(ages), dtype=np.uint64)
+        masks[known] = self.prefix[np.searchsorted(self.due, ages[known], side='right')]
+        return masks
+
+    def classify(self, age_days, received):
+        """
+        Per-slot boolean matrices (children x slots) of doses due, overdue and
+        missed for ages age_days and received bitmasks.
+        """
+        age = np.asarray(age_days, dtype=np.int64)[:, None]
+        todo = (np.asarray(received, dtype=np.uint64)[:, None] & self.bits[None, :]) == 0
+        due = todo & (age >= self.due) & (age < self.overdue_from)
+        overdue = todo & (age >= self.overdue_from) & (age < self.closes)
+        missed = todo & (age >= self.closes)
+        return todo, due, overdue, missed
+
+
+def _ids(values):
+    """OVC ids as an object Index: hashing is much faster than on arrow-backed strings."""
+    return pd.Index(np.asarray(values, dtype=object), dtype=object)
+
+
+def _upsert(current, new):
+    """current with the rows of new replacing (or added to) its rows of the same id."""
+    return pd.concat([current[~current.index.isin(new.index)], new])
+
+
+def _bitwise_or_by(ids, masks):
+    """(unique ids, OR of the masks of each id)."""
+    codes, uniques = pd.factorize(ids, sort=False)
+    order = np.argsort(codes, kind='stable')
+    codes, masks = codes[order], masks[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    return uniques, np.bitwise_or.reduceat(masks, starts) if len(masks) else masks
+
+
+class ImmunizationEngine:
+    def __init__(self, tracker, grace_days=GRACE_DAYS):
+        self.index = ScheduleIndex(tracker.schedule, grace_days)
+        self.dob = pd.Series(dtype='datetime64[ns]', index=_ids([]))
+        self.received = pd.Series(dtype=np.uint64, index=_ids([]))
+        # Latest 'Fully Immunized' event date per child, applied against the dob on recompute
+        self.full_on = pd.Series(dtype='datetime64[ns]', index=_ids([]))
+        self.status = pd.DataFrame()
+        self.watermark = None
+        self.as_of = None
+
+    def update(self, events, ovcs=None, as_of=None):
+        """
+        Folds new immunization events into the caseload and recomputes the
+        children they touch. events: ovc_cases rows (ovc_id,
+        immunization_status, date_of_event, optionally created_at, which
+        advances self.watermark); ovcs: children (ovc_id, dob), of which only
+        new ones or changed dates of birth count. Returns the recomputed rows
+        of self.status.
+        """
+        as_of = pd.Timestamp(as_of if as_of is not None else 'today').normalize()
+        touched = []
+        if ovcs is not None and len(ovcs):
+            dob = pd.Series(pd.to_datetime(ovcs[_column(ovcs, 'dob')], errors='coerce').to_numpy(),
+                            index=_ids(ovcs[_column(ovcs, 'ovc_id')]))
+            dob = dob[~dob.index.duplicated(keep='last')]
+            # Re-reading every child is fine: only new or corrected dates of birth count
+            old = self.dob.reindex(dob.index)
+            dob = dob[~((old == dob) | (old.isna() & dob.isna()))]
+            self.dob = _upsert(self.dob, dob)
+            touched.append(dob.index)
+
+        if events is not None and len(events):
+            ids = _ids(events[_column(events, 'ovc_id')])
+            event_date = pd.to_datetime(events[_column(events, 'date_of_event')], errors='coerce')
+            ages = (event_date.to_numpy() - self.dob.reindex(ids).to_numpy()) / np.timedelta64(1, 'D')
+            statuses = events[_column(events, 'immunization_status')].to_numpy()
+            full = self.index.full_events(statuses)
+            # Full-immunization events are kept by date instead: the dob they need may come later
+            masks = np.where(full, np.uint64(0), self.index.event_masks(statuses, ages))
+            latest = pd.Series(event_date.to_numpy()[full], index=ids[full]).dropna()
+            latest = latest.groupby(level=0).max()
+            if len(latest):
+                previous_full = self.full_on.reindex(latest.index)
+                self.full_on = _upsert(self.full_on, latest.where(~(previous_full > latest), previous_full))
+            uniques, merged = _bitwise_or_by(ids, masks)
+            previous = self.received.reindex(uniques, fill_value=0).to_numpy(dtype=np.uint64)
+            self.received = _upsert(self.received, pd.Series(previous | merged, index=uniques))
+            touched.append(uniques)
+
+            created = _column(events, 'created_at')
+            if created is not None:
+                latest = pd.to_datetime(events[created], errors='coerce').max()
+                if pd.notna(latest) and (self.watermark is None or latest > self.watermark):
+                    self.watermark = latest
+
+        if self.as_of is None or as_of != self.as_of:
+            # Every age moved: nobody's previous status holds
+            touched = [self.dob.index]
+        self.as_of = as_of
+        ids = touched[0].append(touched[1:]).unique() if touched else pd.Index([], dtype=object)
+        return self._recompute(ids)
+
+    def _recompute(self, ids):
+        dob = self.dob.reindex(ids)
+        dob = dob[dob.notna()]
+        ids = dob.index
+        received = self.received.reindex(ids, fill_value=0).to_numpy(dtype=np.uint64)
+        full_age = (self.full_on.reindex(ids) - dob) / np.timedelta64(1, 'D')
+        received = received | self.index.full_masks(full_age.to_numpy(dtype=float))
+        age_days = ((self.as_of - dob).dt.days).to_numpy(dtype=np.int64)
+        todo, due, overdue, missed = self.index.classify(age_days, received)
+
+        # Next dose: the earliest one not received whose window is still open
+        open_doses = todo & ~missed
+        has_next = open_doses.any(axis=1)
+        first = open_doses.argmax(axis=1)
+        next_due = dob.to_numpy() + self.index.due[first].astype('timedelta64[D]')
+        catch_up = dob.to_numpy() + self.index.closes[first].astype('timedelta64[D]')
+        late = has_next & (age_days >= self.index.overdue_from[first])
+
+        status = pd.DataFrame({
+            'ovc_id': ids,
+            'age_days': age_days,
+            'doses_received': ((received[:, None] & self.index.bits) != 0).sum(axis=1),
+            'doses_expected': np.searchsorted(self.index.due, age_days, side='right'),
+            'doses_overdue': overdue.sum(axis=1),
+            'doses_missed': missed.sum(axis=1),
+            'due': self._labels(due),
+            'overdue': self._labels(overdue),
+            'missed': self._labels(missed),
+            'next_vaccine': np.where(has_next, self.index.labels[first], 'Complete'),
+            'next_due_date': pd.Series(next_due).where(has_next).to_numpy(),
+            'catch_up_until': pd.Series(catch_up).where(late).to_numpy(),
+            'status_flag': np.select([overdue.any(axis=1), missed.any(axis=1), ~has_next],
+                                     ['Action Needed', 'Missed Doses', 'Complete'], 'On Track')
+        }).set_index('ovc_id')
+
+        self.status = _upsert(self.status, status) if len(self.status) else status
+        return status
+
+    def _labels(self, matrix):
+        """', '-joined slot labels per row of a children x slots matrix."""
+        masks = (matrix * self.index.bits).sum(axis=1, dtype=np.uint64)
+        unique, inverse = np.unique(masks, return_inverse=True)
+        text = np.array([', '.join(self.index.labels[(int(m) >> np.arange(len(self.index))) & 1 == 1])
+                         for m in unique], dtype=object)
+        return text[inverse.ravel()]
+
+    def save(self, path=IMMUNIZATION_STATE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        state = {'version': _STATE_VERSION, 'signature': self.index.signature, 'dob': self.dob, 'received': self.received,
+                 'full_on': self.full_on, 'status': self.status, 'watermark': self.watermark, 'as_of': self.as_of}
+        tmp = path + '.tmp'
+        joblib.dump(state, tmp)
+        os.replace(tmp, path)
+        return path
+
+    def load(self, path=IMMUNIZATION_STATE_PATH):
+        """
+        Restores a saved caseload. Returns False (and starts empty) when there
+        is none or it was built against a different schedule, in which case
+        the caller must replay every event.
+        """
+        if not os.path.exists(path):
+            return False
+        state = joblib.load(path)
+        if state.get('version') != _STATE_VERSION:
+            print("   Saved immunization state is from an older release; rebuilding from all events.")
+            return False
+        if state.get('signature') != self.index.signature:
+            print("   Immunization schedule changed; rebuilding the caseload from all events.")
+            return False
+        self.dob, self.received, self.status = state['dob'], state['received'], state['status']
+        self.full_on = state['full_on']
+        self.watermark, self.as_of = state['watermark'], state['as_of']
+        return True
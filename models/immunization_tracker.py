@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
@@ -24,58 +25,93 @@ class ImmunizationTracker:
         }
         self.schedule['due_days'] = self.schedule['AGE'].map(self.age_mapping)
 
-    def get_schedule_status(self, child_dob, current_status):
+        # Sorted once: the next dose of a child is a binary search over due_days
+        ordered = self.schedule.dropna(subset=['due_days']).sort_values('due_days', kind='stable')
+        self.due_days = ordered['due_days'].to_numpy(dtype=np.int64)
+        self.vaccines = ordered['VACCINE_NAME'].to_numpy(dtype=object)
+
+    @staticmethod
+    def _as_of(as_of):
+        """The reference date (default: today), as a midnight Timestamp."""
+        return pd.Timestamp(as_of if as_of is not None else datetime.now()).normalize()
+
+    def next_doses(self, dob, as_of=None):
+        """
+        Vectorized next-dose lookup. dob: array-like of dates (missing allowed;
+        each value is parsed on its own, so formats may differ between rows).
+        Returns a DataFrame aligned with dob: age_days (NaN when dob is missing
+        or unparseable), next_vaccine (None when the schedule is complete or
+        age_days is NaN), due_date (Timestamp or NaT), days_remaining.
+        """
+        as_of = self._as_of(as_of)
+        dob = pd.to_datetime(pd.Series(dob).reset_index(drop=True), format='mixed', errors='coerce')
+        age_days = (as_of - dob).dt.days
+
+        # First dose due strictly after today's age; position len(schedule) means complete
+        age = age_days.fillna(-1).to_numpy(dtype=np.int64)
+        pos = np.searchsorted(self.due_days, age, side='right')
+        pending = (pos < len(self.due_days)) & age_days.notna().to_numpy()
+        due_days = np.append(self.due_days, 0)[pos]
+        vaccines = np.append(self.vaccines, None)[pos]
+
+        due_date = (dob + pd.to_timedelta(due_days, unit='D')).where(pending)
+        return pd.DataFrame({
+            'age_days': age_days,
+            'next_vaccine': np.where(pending, vaccines, None),
+            'due_date': due_date,
+            'days_remaining': (due_date - as_of).dt.days
+        })
+
+    def get_schedule_status(self, child_dob, current_status, as_of=None):
         """
         child_dob: datetime object
         current_status: string (e.g. 'Fully Immunized', 'Partial', or last vaccine name)
+        as_of: reference date (default: today)
         Returns: Dict with next due vaccine and days remaining
         """
         dob = pd.to_datetime(child_dob)
-        today = datetime.now()
+        today = self._as_of(as_of)
         age_days = (today - dob).days
-        
-        # Filter vaccines that should have been taken by now
-        due_now = self.schedule[self.schedule['due_days'] <= age_days].copy()
-        
-        # Filter upcoming vaccines
-        upcoming = self.schedule[self.schedule['due_days'] > age_days].sort_values('due_days')
-        
+
+        # First vaccine due after today's age, from the presorted schedule
+        pos = np.searchsorted(self.due_days, age_days, side='right')
+
         next_vaccine = None
-        if not upcoming.empty:
-            row = upcoming.iloc[0]
-            due_date = dob + timedelta(days=int(row['due_days']))
+        if pos < len(self.due_days):
+            due_date = dob + timedelta(days=int(self.due_days[pos]))
             next_vaccine = {
-                'vaccine': row['VACCINE_NAME'],
+                'vaccine': self.vaccines[pos],
                 'due_date': due_date.strftime('%Y-%m-%d'),
                 'days_remaining': (due_date - today).days
             }
-            
+
         return {
             'age_days': age_days,
             'next_due': next_vaccine,
             'status_flag': 'Action Needed' if 'Partial' in str(current_status) else 'On Track'
         }
 
-    def batch_process_ovc(self, ovc_df):
+    def batch_process_ovc(self, ovc_df, as_of=None):
         """
         Processes a list of OVCs and predicts who is likely to miss their next appointment.
+        One vectorized pass over the whole caseload; as_of fixes the reference
+        date (default: today) so a run is reproducible. Children whose dob
+        cannot be parsed are reported as 'Invalid DOB' rather than skipped.
         """
         # Case insensitive mapping
         actual_cols = {c.upper(): c for c in ovc_df.columns}
         col_id = actual_cols.get('OVC_ID', 'ovc_id')
         col_name = actual_cols.get('OVC_NAME', 'ovc_name')
         col_dob = actual_cols.get('DOB', 'dob')
-        col_status = actual_cols.get('IMMUNIZATION_STATUS', 'immunization_status')
 
-        results = []
-        for _, row in ovc_df.iterrows():
-            if pd.isna(row[col_dob]): continue
-            status = self.get_schedule_status(row[col_dob], row.get(col_status, 'Unknown'))
-            results.append({
-                'ovc_id': row[col_id],
-                'ovc_name': row.get(col_name, 'Unknown'),
-                'age_days': status['age_days'],
-                'next_vaccine': status['next_due']['vaccine'] if status['next_due'] else 'Complete',
-                'due_date': status['next_due']['due_date'] if status['next_due'] else 'N/A'
-            })
-        return pd.DataFrame(results)
+        ovcs = ovc_df[ovc_df[col_dob].notna()]
+        doses = self.next_doses(ovcs[col_dob].to_numpy(), as_of)
+        # A missing next dose only means 'Complete' when the dob was understood
+        complete = np.where(doses['age_days'].notna(), 'Complete', 'Invalid DOB')
+        return pd.DataFrame({
+            'ovc_id': ovcs[col_id].to_numpy(),
+            'ovc_name': ovcs[col_name].to_numpy() if col_name in ovcs.columns else 'Unknown',
+            'age_days': doses['age_days'].to_numpy(),
+            'next_vaccine': doses['next_vaccine'].fillna(pd.Series(complete)).to_numpy(),
+            'due_date': doses['due_date'].dt.strftime('%Y-%m-%d').fillna('N/A').to_numpy()
+        })
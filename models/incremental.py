@@ -0,0 +1,143 @@
+"""
+Bookkeeping for JaliBaseModel.train_incremental: the training watermark, and
+the drift and schema checks that decide between continuing to boost the saved
+model on new rows and retraining it from scratch.
+
+A full train() records in the artifact metadata:
+
+    watermark   which rows the model has seen: the latest value of a sync
+                timestamp column (_SYNCED_AT / created_at, as written by the
+                Postgres -> Snowflake sync) when the data has one, otherwise
+                the row count plus a hash of those rows, for append-only files
+    profile     the training distribution of every feature and the target
+                (decile bins for numerics, shares of the top categories for
+                categoricals), the reference the drift check compares against
+
+Incremental updates advance the watermark but keep the profile of the last
+full training, so gradual drift accumulates until it forces a retrain.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import registry
+
+# Sync timestamp columns, in order of preference (matched case-insensitively)
+WATERMARK_COLUMNS = ('_SYNCED_AT', 'created_at')
+# Population stability index above which a feature counts as drifted
+DRIFT_PSI_THRESHOLD = float(os.getenv('DRIFT_PSI_THRESHOLD', '0.2'))
+# Fewer new rows than this are left for the next run (too few to judge drift or to learn from)
+INCREMENTAL_MIN_ROWS = int(os.getenv('INCREMENTAL_MIN_ROWS', '100'))
+# Boosting rounds added per incremental update
+INCREMENTAL_ROUNDS = int(os.getenv('INCREMENTAL_ROUNDS', '20'))
+
+_PROFILE_BINS = 10
+_PROFILE_TOP_CATEGORIES = 30
+_OTHER = '__other__'
+_EPS = 1e-4
+
+
+def watermark_column(columns):
+    actual = {str(c).upper(): c for c in columns}
+    for name in WATERMARK_COLUMNS:
+        if name.upper() in actual:
+            return actual[name.upper()]
+    return None
+
+
+def _timestamps(series):
+    return pd.to_datetime(series, errors='coerce')
+
+
+def watermark(df, projected):
+    """
+    The watermark of a training frame: df is the raw frame (for the sync
+    timestamp), projected the model's own columns of it (for the row hash).
+    """
+    column = watermark_column(df.columns)
+    if column is not None:
+        latest = _timestamps(df[column]).max()
+        return {'column': str(column), 'value': None if pd.isna(latest) else latest.isoformat()}
+    return {'column': None, 'rows': len(projected), 'rows_hash': registry.data_hash(projected)}
+
+
+def new_rows(df, projected, mark):
+    """
+    (mask of the rows of df newer than mark, reason) where reason is None, or
+    why the new rows cannot be told apart and a full retrain is needed.
+    """
+    column = watermark_column(df.columns)
+    if mark.get('column'):
+        if column is None:
+            return None, f"watermark column {mark['column']} is gone"
+        stamps = _timestamps(df[column])
+        if mark.get('value') is None:
+            return stamps.notna().to_numpy(), None
+        return (stamps > pd.Timestamp(mark['value'])).to_numpy(), None
+    if column is not None:
+        return None, f"data now has a sync timestamp ({column})"
+
+    # Append-only files: the first `rows` rows must be exactly the ones trained on
+    seen = mark['rows']
+    if len(projected) < seen or registry.data_hash(projected.iloc[:seen]) != mark['rows_hash']:
+        return None, "previously trained rows changed"
+    mask = np.zeros(len(projected), dtype=bool)
+    mask[seen:] = True
+    return mask, None
+
+
+def build_profile(X, y, numerical, categorical):
+    """Reference distribution of cleaned features X (plan output) and target y."""
+    profile = {}
+    for c in numerical:
+        values = X[c].to_numpy(dtype=float)
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, _PROFILE_BINS + 1)[1:-1]))
+        profile[c] = {'kind': 'numerical', 'edges': edges.tolist(),
+                      'shares': _bin_shares(values, edges).tolist()}
+    for c, values in [(c, X[c]) for c in categorical] + [('__target__', y)]:
+        shares = values.astype(str).value_counts(normalize=True)
+        top = shares.iloc[:_PROFILE_TOP_CATEGORIES]
+        profile[c] = {'kind': 'categorical', 'shares': dict(top.astype(float)),
+                      'other': float(max(1.0 - top.sum(), 0.0))}
+    return profile
+
+
+def _bin_shares(values, edges):
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return counts / max(len(values), 1)
+
+
+def _psi(expected, actual):
+    expected = np.clip(np.asarray(expected, dtype=float), _EPS, None)
+    actual = np.clip(np.asarray(actual, dtype=float), _EPS, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def drift(profile, X, y):
+    """{column: PSI} of the new rows (cleaned X, target y) against the training profile."""
+    scores = {}
+    for c, ref in profile.items():
+        values = y if c == '__target__' else X[c]
+        if ref['kind'] == 'numerical':
+            actual = _bin_shares(values.to_numpy(dtype=float), np.asarray(ref['edges']))
+            scores[c] = _psi(ref['shares'], actual)
+        else:
+            shares = values.astype(str).value_counts(normalize=True)
+            known = list(ref['shares'])
+            expected = [ref['shares'][k] for k in known] + [ref['other']]
+            actual = [float(shares.get(k, 0.0)) for k in known]
+            actual.append(max(1.0 - sum(actual), 0.0))
+            scores[c] = _psi(expected, actual)
+    return scores
+
+
+def schema_change(previous, plan, encoding):
+    """Why the saved model's inputs no longer match the data, or None."""
+    if previous.get('features') != plan.features_:
+        return f"features changed: {previous.get('features')} -> {plan.features_}"
+    if previous.get('categorical_features') != plan.categorical_:
+        return "categorical features changed"
+    if previous.get('encoding', 'onehot') != encoding:
+        return f"encoding changed to {encoding}"
+    return None
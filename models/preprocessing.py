@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+def _is_text(series):
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+def _category_labels(col):
+    """
+    String labels of a categorical column, independent of the dtype pandas
+    gave it: an int64 column at fit time and the same values as float (or
+    mixed with 'Unknown') in a batch with a missing value both give '2',
+    not '2' and '2.0'.
+    """
+    if pd.api.types.is_float_dtype(col):
+        labels = col.astype(str).astype(object)
+        integral = col.notna() & (col % 1 == 0)
+        labels[integral] = col[integral].astype(np.int64).astype(str)
+        return labels
+    if pd.api.types.is_object_dtype(col):
+        return col.map(lambda v: str(int(v)) if isinstance(v, (float, np.floating)) and float(v).is_integer() else str(v))
+    return col.astype(str)
+
+
+class PreprocessingPlan(BaseEstimator, TransformerMixin):
+    """
+    The cleaning JaliBaseModel.train used to do inline, compiled once per
+    column layout and run as the first step of the model pipeline, so the
+    saved artifact cleans inference data exactly the way it cleaned the
+    training data.
+
+    Column names are matched case-insensitively. Only the model's own
+    columns are touched: text is stripped, numerical features are coerced
+    with pd.to_numeric (missing -> 0), categorical features missing ->
+    'Unknown'. The output uses the names declared by the model, whatever
+    the casing of the input.
+    """
+
+    def __init__(self, feature_cols, categorical_features, target_col=None):
+        self.feature_cols = feature_cols
+        self.categorical_features = categorical_features
+        self.target_col = target_col
+
+    def resolve(self, columns):
+        """
+        {declared name: actual column} for the model's columns present in
+        `columns`. Cached per column layout, so repeated calls on frames of
+        the same shape skip the lookup.
+        """
+        key = tuple(columns)
+        cache = self.__dict__.setdefault('_resolved', {})
+        if key not in cache:
+            actual_cols = {str(c).upper(): c for c in columns}
+            wanted = list(self.feature_cols) + ([self.target_col] if self.target_col else [])
+            cache.clear()
+            cache[key] = {c: actual_cols[c.upper()] for c in wanted if c.upper() in actual_cols}
+        return cache[key]
+
+    def fit(self, X, y=None):
+        resolved = self.resolve(X.columns)
+        self.features_ = [c for c in self.feature_cols if c in resolved]
+        self.categorical_ = [c for c in self.features_ if c in self.categorical_features]
+        self.numerical_ = [c for c in self.features_ if c not in self.categorical_features]
+        return self
+
+    def project(self, df):
+        """Just the model's columns, renamed to their declared names."""
+        resolved = self.resolve(df.columns)
+        return df[list(resolved.values())].set_axis(list(resolved), axis=1)
+
+    def target(self, df):
+        """The cleaned target of the rows that have one, as a Series."""
+        resolved = self.resolve(df.columns)
+        if self.target_col not in resolved:
+            raise KeyError(f"Target column {self.target_col} not found in dataframe.")
+        y = df[resolved[self.target_col]].dropna()
+        if not pd.api.types.is_numeric_dtype(y):
+            y = pd.to_numeric(y, errors='coerce').fillna(0)
+        return y.rename(self.target_col)
+
+    def transform(self, X):
+        resolved = self.resolve(X.columns)
+        columns = {}
+        for c in self.numerical_:
+            if c not in resolved:
+                columns[c] = np.zeros(len(X))
+                continue
+            col = X[resolved[c]]
+            if not pd.api.types.is_numeric_dtype(col):
+                # to_numeric ignores surrounding whitespace, so no strip is needed
+                col = pd.to_numeric(col, errors='coerce')
+            columns[c] = col.fillna(0)
+        for c in self.categorical_:
+            if c not in resolved:
+                columns[c] = np.full(len(X), 'Unknown', dtype=object)
+                continue
+            col = X[resolved[c]]
+            if _is_text(col):
+                col = col.str.strip()
+            columns[c] = col.fillna('Unknown')
+        return pd.DataFrame(columns, index=X.index)[self.features_]
+
+
+class CategoryEncoder(BaseEstimator, TransformerMixin):
+    """
+    Native-categorical alternative to OneHotEncoder for XGBoost: keeps one
+    column per feature and turns the categorical ones into pandas category
+    dtype with the categories seen at fit time, so inference codes match
+    training. Unseen values become missing. Values are matched on their
+    labels (integral floats count as ints), so the dtype a batch happens to
+    get does not change its codes. Numerical columns pass through unscaled
+    (trees do not need scaling).
+    """
+
+    def __init__(self, categorical_features):
+        self.categorical_features = categorical_features
+
+    def fit(self, X, y=None):
+        self.categories_ = {c: pd.Index(sorted(_category_labels(X[c]).unique())) for c in self.categorical_features}
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        return self
+
+    def transform(self, X):
+        X = X.copy()
+        for c, categories in self.categories_.items():
+            X[c] = pd.Categorical(_category_labels(X[c]), categories=categories)
+        return X
+
+    def get_feature_names_out(self, input_features=None):
+        return self.feature_names_in_
@@ -0,0 +1,149 @@
+"""
+Registry of the Jali pillar models and their versioned artifacts.
+
+Pillar classes are imported on first use, so listing models or reading
+metadata does not pay for xgboost/sklearn. Every save writes a new version:
+
+    models/artifacts/<model>/v0003.joblib   the fitted pipeline
+    models/artifacts/<model>/v0003.json     features, AUC, data hash, training time
+    models/artifacts/<model>/tuned_params.json   best config of the last tune()
+
+Loading picks the latest version unless one is asked for, falls back to the
+unversioned <model>.joblib written by older releases, and memory-maps
+artifacts of MODEL_MMAP_MIN_BYTES or more, so their numpy arrays are paged in
+on demand instead of read up front.
+"""
+import os
+import re
+import json
+import hashlib
+import importlib
+
+ARTIFACT_ROOT = os.path.join(os.path.dirname(__file__), 'artifacts')
+MODEL_MMAP_MIN_BYTES = int(os.getenv('MODEL_MMAP_MIN_BYTES', str(10 * 1024 * 1024)))
+
+# Pillar key -> (module in this package, class)
+PILLARS = {
+    'tb': ('tb_adherence_model', 'TBAdherenceModel'),
+    'menstrual': ('menstrual_tracking_model', 'MenstrualTrackingModel'),
+    'hiv_qoc': ('hiv_qoc_model', 'HIVQocModel'),
+    'hiv_adherence': ('hiv_adherence_model', 'HIVAdherenceModel')
+}
+
+_VERSION_FILE = re.compile(r'^v(\d+)\.joblib$')
+
+
+def model_class(pillar):
+    if pillar not in PILLARS:
+        raise ValueError(f"Unknown model '{pillar}'. Choose from: {', '.join(PILLARS)}")
+    module, cls = PILLARS[pillar]
+    return getattr(importlib.import_module(f'{__package__}.{module}'), cls)
+
+
+def create_model(pillar):
+    return model_class(pillar)()
+
+
+def model_slug(model_name):
+    return model_name.lower().replace(' ', '_')
+
+
+def artifact_dir(model_name):
+    return os.path.join(ARTIFACT_ROOT, model_slug(model_name))
+
+
+def list_versions(model_name):
+    folder = artifact_dir(model_name)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(int(m.group(1)) for m in map(_VERSION_FILE.match, os.listdir(folder)) if m)
+
+
+def version_path(model_name, version):
+    return os.path.join(artifact_dir(model_name), f'v{version:04d}.joblib')
+
+
+def resolve_artifact(model_name, version=None):
+    """Path of the requested (default: latest) version, or the legacy unversioned file."""
+    versions = list_versions(model_name)
+    if version is not None:
+        if version not in versions:
+            raise FileNotFoundError(f"{model_name} has no version {version} (have: {versions})")
+        return version_path(model_name, version)
+    if versions:
+        return version_path(model_name, versions[-1])
+    legacy = os.path.join(ARTIFACT_ROOT, f'{model_slug(model_name)}.joblib')
+    if os.path.exists(legacy):
+        return legacy
+    raise FileNotFoundError(f"No artifact for {model_name} in {ARTIFACT_ROOT}")
+
+
+def metadata_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + '.json'
+
+
+def read_metadata(artifact_path):
+    path = metadata_path(artifact_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def data_hash(df):
+    """Order-sensitive fingerprint of a DataFrame's contents."""
+    import pandas as pd
+
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(','.join(map(str, df.columns)).encode())
+    return digest.hexdigest()[:16]
+
+
+def save_artifact(pipeline, model_name, metadata=None):
+    """Writes pipeline + metadata as the next version and returns its path."""
+    import joblib
+
+    versions = list_versions(model_name)
+    version = versions[-1] + 1 if versions else 1
+    path = version_path(model_name, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Uncompressed, so the numpy arrays inside can be memory-mapped on load
+    joblib.dump(pipeline, path)
+    with open(metadata_path(path), 'w') as f:
+        json.dump(dict(metadata or {}, model_name=model_name, version=version), f, indent=2, default=str)
+    return path
+
+
+def tuned_params_path(model_name):
+    return os.path.join(artifact_dir(model_name), 'tuned_params.json')
+
+
+def save_tuned_params(model_name, result):
+    """Stores the best config of a tuning run beside the model's artifacts."""
+    path = tuned_params_path(model_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+    return path
+
+
+def load_tuned_params(model_name):
+    path = tuned_params_path(model_name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_pipeline(path, mmap_min_bytes=MODEL_MMAP_MIN_BYTES):
+    import joblib
+
+    mmap_mode = 'r' if os.path.getsize(path) >= mmap_min_bytes else None
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def load_model(pillar, version=None, path=None):
+    """A pillar model with its saved pipeline (latest version by default) loaded."""
+    model = create_model(pillar)
+    model.load(path, version=version)
+    return model
@@ -1,84 +1,250 @@
+import os
+import time
 import torch
 import torch.nn as nn
 from torch.utils.data import Dataset
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import roc_auc_score
+from datetime import datetime
+from . import registry
+
+# Define features (based on Jali.sql structure)
+# Exclude ID columns and Target columns from features
+FEATURE_COLS = [
+    'PROVINCE', 'COUNTYID', 'ARM', 'STRATA', 'GENDER',
+    'AGECAT_CALC', 'OCCUPATION_CALC', 'EDUCATIONLEVEL',
+    'MARRIED_CALC', 'RESIDENCE', 'INCOMCAT_CALC',
+    'DISTTBCL_CALC', 'DISTSUPERV_CALC', 'MEDINSUR_CALC', 'SMEARTEST'
+]
+MODEL_NAME = "TB Adherence NN"
+# 'eager', 'script' (TorchScript) or 'compile' (torch.compile). For a network this
+# small, compiling costs about a minute and has not beaten eager on CPU
+# (benchmarks/nn_throughput.py), so it is opt-in
+NN_COMPILE = os.getenv('NN_COMPILE', 'eager')
+
+
+def _resolve(columns, names):
+    """{declared name: actual column}, matched case-insensitively (Snowflake upper, CSV lower)."""
+    actual = {str(c).upper(): c for c in columns}
+    missing = [c for c in names if c.upper() not in actual]
+    if missing:
+        raise ValueError(f"Columns not found in dataframe: {missing}")
+    return {c: actual[c.upper()] for c in names}
+
 
 class TBAdherenceDataset(Dataset):
-    def __init__(self, dataframe, target_col='OUTCOME_POOR', mode='train'):
+    def __init__(self, dataframe, target_col='OUTCOME_POOR', mode='train', scaler=None):
         """
         Args:
             dataframe (pd.DataFrame): Input dataframe
             target_col (str): Column name for the target variable
             mode (str): 'train' or 'inference' (inference doesn't require target)
+            scaler (StandardScaler): Fitted scaler to apply; None fits one on this data,
+                which only the training set should do
+
+        Features (and the target) are materialized once as contiguous float32
+        tensors; batch(idx) gathers a whole batch with one index_select instead
+        of one __getitem__ call per row.
         """
         self.mode = mode
-        self.df = dataframe.copy()
         self.target_col = target_col
-        
-        # Define features (based on Jali.sql structure)
-        # Exclude ID columns and Target columns from features
-        self.feature_cols = [
-            'PROVINCE', 'COUNTYID', 'ARM', 'STRATA', 'GENDER', 
-            'AGECAT_CALC', 'OCCUPATION_CALC', 'EDUCATIONLEVEL', 
-            'MARRIED_CALC', 'RESIDENCE', 'INCOMCAT_CALC', 
-            'DISTTBCL_CALC', 'DISTSUPERV_CALC', 'MEDINSUR_CALC', 'SMEARTEST'
-        ]
-        
+        self.feature_cols = FEATURE_COLS
+
+        # Only the columns used are copied; rows without a target cannot be trained on
+        resolved = _resolve(dataframe.columns, self.feature_cols + ([target_col] if mode == 'train' else []))
+        df = dataframe[list(resolved.values())].set_axis(list(resolved), axis=1)
+        if self.mode == 'train':
+            df = df[df[target_col].notna()]
+
         # Simple preprocessing (Handle NaNs)
-        self.df[self.feature_cols] = self.df[self.feature_cols].fillna(0)
-        
-        # Extract features
-        self.X = self.df[self.feature_cols].values.astype(np.float32)
-        
-        # Scale features (StandardScaler)
-        # In a real pipeline, we should fit scalar on train and transform test/inference
-        # For now, simplistic local scaling (Should be improved)
-        self.scaler = StandardScaler()
-        self.X = self.scaler.fit_transform(self.X)
+        X = df[self.feature_cols].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=np.float32)
+
+        # Scale features (StandardScaler) with training statistics
+        if scaler is None:
+            scaler = StandardScaler().fit(X)
+        self.scaler = scaler
+        self.X = torch.from_numpy(np.ascontiguousarray(self.scaler.transform(X), dtype=np.float32))
 
         if self.mode == 'train':
-            # Extract target
-            if self.target_col in self.df.columns:
-                self.y = self.df[self.target_col].values.astype(np.float32).reshape(-1, 1)
-            else:
-                raise ValueError(f"Target column {self.target_col} not found in dataframe")
-        
+            y = pd.to_numeric(df[target_col], errors='coerce').fillna(0).to_numpy(dtype=np.float32)
+            self.y = torch.from_numpy(np.ascontiguousarray(y.reshape(-1, 1)))
+
     def __len__(self):
-        return len(self.df)
-    
+        return len(self.X)
+
     def __getitem__(self, idx):
         if self.mode == 'train':
             return self.X[idx], self.y[idx]
         else:
             return self.X[idx]
 
+    def batch(self, idx):
+        """The rows at a tensor of indices, gathered in one call."""
+        if self.mode == 'train':
+            return self.X.index_select(0, idx), self.y.index_select(0, idx)
+        return self.X.index_select(0, idx)
+
+
+def iter_batches(n, batch_size, shuffle=False, generator=None):
+    """Index tensors of successive batches over n rows (one permutation per epoch)."""
+    order = torch.randperm(n, generator=generator) if shuffle else torch.arange(n)
+    for start in range(0, n, batch_size):
+        yield order[start:start + batch_size]
+
+
 class TBAdherenceNN(nn.Module):
     def __init__(self, input_dim):
         super(TBAdherenceNN, self).__init__()
-        
+
         # Feed Forward Neural Network
         self.layer1 = nn.Linear(input_dim, 64)
         self.relu1 = nn.ReLU()
         self.dropout1 = nn.Dropout(0.3)
-        
+
         self.layer2 = nn.Linear(64, 32)
         self.relu2 = nn.ReLU()
         self.dropout2 = nn.Dropout(0.2)
-        
+
         self.layer3 = nn.Linear(32, 1)
         self.sigmoid = nn.Sigmoid()
-        
+
     def forward(self, x):
         x = self.layer1(x)
         x = self.relu1(x)
         x = self.dropout1(x)
-        
+
         x = self.layer2(x)
         x = self.relu2(x)
         x = self.dropout2(x)
-        
+
         x = self.layer3(x)
         x = self.sigmoid(x)
         return x
+
+
+class TBAdherenceTrainer:
+    """
+    Trains TBAdherenceNN on CPU from pre-materialized tensors, and persists
+    the weights together with the scaler fitted on the training rows, so
+    inference data is scaled with training statistics. Artifacts are
+    versioned by the model registry like the XGBoost pillars.
+    """
+
+    def __init__(self, target_col='OUTCOME_POOR', batch_size=256, epochs=20, lr=1e-3,
+                 threads=None, compile_mode=NN_COMPILE, seed=42):
+        self.target_col = target_col
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.lr = lr
+        # Intra-op threads for CPU training; None keeps torch's default (all cores)
+        self.threads = threads
+        self.compile_mode = compile_mode
+        self.seed = seed
+        self.model = None
+        self.scaler = None
+        self.metadata = {}
+        self._forward = None
+
+    def _compiled(self, model, example):
+        """model wrapped per compile_mode, falling back to eager if compilation fails."""
+        if self.compile_mode == 'eager':
+            return model
+        try:
+            if self.compile_mode == 'script':
+                compiled = torch.jit.script(model)
+            elif self.compile_mode == 'compile' and hasattr(torch, 'compile'):
+                compiled = torch.compile(model)
+            else:
+                return model
+            # torch.compile builds lazily; trace one batch now so failures surface here
+            compiled(example)
+            return compiled
+        except Exception as e:
+            print(f"   {self.compile_mode} unavailable ({type(e).__name__}: {e}); training eagerly.")
+            return model
+
+    def fit(self, train_df, val_df=None):
+        """Fits the scaler and network on train_df; reports AUC on val_df if given."""
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        torch.manual_seed(self.seed)
+        generator = torch.Generator().manual_seed(self.seed)
+        started = time.perf_counter()
+
+        train = TBAdherenceDataset(train_df, self.target_col, mode='train')
+        self.scaler = train.scaler
+        self.model = TBAdherenceNN(train.X.shape[1])
+        self._forward = self._compiled(self.model, train.X[:2])
+
+        optimizer = torch.optim.Adam(self.model.parameters(), lr=self.lr)
+        loss_fn = nn.BCELoss()
+        # A scripted module keeps its own train/eval flag, so set it on the wrapper
+        self._forward.train()
+        loop_started = time.perf_counter()
+        for epoch in range(self.epochs):
+            epoch_loss = 0.0
+            for idx in iter_batches(len(train), self.batch_size, shuffle=True, generator=generator):
+                X, y = train.batch(idx)
+                optimizer.zero_grad(set_to_none=True)
+                loss = loss_fn(self._forward(X), y)
+                loss.backward()
+                optimizer.step()
+                epoch_loss += loss.item() * len(idx)
+            print(f"   Epoch {epoch + 1}/{self.epochs}: loss {epoch_loss / len(train):.4f}")
+        loop_seconds = time.perf_counter() - loop_started
+        train_seconds = time.perf_counter() - started
+
+        auc = None
+        if val_df is not None:
+            val = TBAdherenceDataset(val_df, self.target_col, mode='train', scaler=self.scaler)
+            y = val.y.numpy().ravel()
+            if len(np.unique(y)) > 1:
+                auc = float(roc_auc_score(y, self._predict(val.X)))
+                print(f"AUC-ROC Score: {auc:.4f}")
+
+        self.metadata = {
+            'features': FEATURE_COLS,
+            'target': self.target_col,
+            'auc': auc,
+            'rows': len(train),
+            'params': {'batch_size': self.batch_size, 'epochs': self.epochs, 'lr': self.lr},
+            'compile_mode': self.compile_mode,
+            # Of the epochs alone: scaling and compilation are not counted
+            'samples_per_second': round(len(train) * self.epochs / loop_seconds, 1),
+            'trained_at': datetime.now().isoformat(timespec='seconds'),
+            'train_seconds': round(train_seconds, 3)
+        }
+        return self.metadata
+
+    def _predict(self, X):
+        self._forward.eval()
+        step = max(self.batch_size, 4096)
+        with torch.no_grad():
+            out = [self._forward(X[start:start + step]) for start in range(0, len(X), step)]
+        return torch.cat(out).detach().numpy().ravel()
+
+    def predict_proba(self, df):
+        """Probability of a poor outcome for raw rows, scaled with the training scaler."""
+        data = TBAdherenceDataset(df, self.target_col, mode='inference', scaler=self.scaler)
+        return self._predict(data.X)
+
+    def save(self):
+        """Weights + scaler as a new version in the artifacts folder."""
+        artifact = {'state_dict': self.model.state_dict(), 'scaler': self.scaler,
+                    'input_dim': self.model.layer1.in_features, 'features': FEATURE_COLS}
+        path = registry.save_artifact(artifact, MODEL_NAME, self.metadata)
+        print(f"Model saved to {path}")
+        return path
+
+    def load(self, path=None, version=None):
+        path = path or registry.resolve_artifact(MODEL_NAME, version)
+        artifact = registry.load_pipeline(path)
+        self.model = TBAdherenceNN(artifact['input_dim'])
+        self.model.load_state_dict(artifact['state_dict'])
+        self.scaler = artifact['scaler']
+        self.metadata = registry.read_metadata(path)
+        self._forward = self._compiled(self.model, torch.zeros(2, artifact['input_dim']))
+        print(f"Model loaded from {path}")
+        return self.model
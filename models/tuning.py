@@ -0,0 +1,91 @@
+"""
+Budgeted hyperparameter search for the XGBoost pillars.
+
+Successive halving: n_candidates random configurations are fitted with a small
+number of boosting rounds, the best 1/eta (by validation AUC) are refitted with
+eta times more rounds, and so on until max_rounds. The winner is the trial
+with the best validation AUC over all rungs, since a config that early-stops
+well inside a small budget can score lower with more rounds. Every fit
+early-stops on the validation split, and all fits reuse the same already-transformed design
+matrices, so preprocessing runs once per search instead of once per trial.
+Trials of a rung run on a thread pool (xgboost releases the GIL while
+boosting), with the cores split between them.
+"""
+import os
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+TUNE_CANDIDATES = int(os.getenv('TUNE_CANDIDATES', '27'))
+TUNE_MAX_ROUNDS = int(os.getenv('TUNE_MAX_ROUNDS', '600'))
+EARLY_STOPPING_ROUNDS = 20
+
+
+def sample_configs(n, base_pos_weight=1.0, seed=42):
+    """n random XGBoost configurations around sensible defaults."""
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        configs.append({
+            'max_depth': int(rng.integers(2, 9)),
+            'learning_rate': float(10 ** rng.uniform(-2, -0.5)),
+            'min_child_weight': float(10 ** rng.uniform(0, 1)),
+            'subsample': float(rng.uniform(0.6, 1.0)),
+            'colsample_bytree': float(rng.uniform(0.5, 1.0)),
+            'reg_lambda': float(10 ** rng.uniform(-1, 1)),
+            # Class weighting from none up to the full negative/positive ratio
+            'scale_pos_weight': float(1 + rng.uniform(0, 1) * max(base_pos_weight - 1, 0))
+        })
+    return configs
+
+
+def _fit_trial(estimator, config, rounds, design, n_jobs):
+    X_fit, y_fit, X_val, y_val = design
+    params = estimator.get_params()
+    # Removed in xgboost 2; it only adds a warning per trial
+    params.pop('use_label_encoder', None)
+    # Early stopping on logloss, which is smoother than AUC on small validation sets
+    est = estimator.__class__(**dict(
+        params, **config,
+        n_estimators=rounds, n_jobs=n_jobs, eval_metric='logloss',
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS
+    ))
+    est.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+    auc = roc_auc_score(y_val, est.predict_proba(X_val)[:, 1])
+    return {'config': config, 'auc': float(auc), 'rounds': rounds, 'best_iteration': int(est.best_iteration)}
+
+
+def successive_halving(estimator, design, n_candidates=TUNE_CANDIDATES, max_rounds=TUNE_MAX_ROUNDS,
+                       eta=3, threads=None, seed=42, verbose=True):
+    """
+    Searches configs for `estimator` (an XGBClassifier whose other params are
+    kept) on design = (X_fit, y_fit, X_val, y_val), using at most `threads`
+    threads in total (default: all cores). Returns (best trial by validation
+    AUC over every rung, all trials).
+    """
+    y_fit = np.asarray(design[1])
+    positives = max(int((y_fit == 1).sum()), 1)
+    candidates = sample_configs(n_candidates, (len(y_fit) - positives) / positives, seed)
+
+    n_rungs = max(1, int(math.log(n_candidates, eta)) + 1)
+    threads = threads or os.cpu_count() or 1
+    trials = []
+    for rung in range(n_rungs):
+        rounds = max(10, int(max_rounds * eta ** (rung - n_rungs + 1)))
+        pool_size = min(threads, len(candidates))
+        n_jobs = max(1, threads // pool_size)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=pool_size) as pool:
+            results = list(pool.map(lambda c: _fit_trial(estimator, c, rounds, design, n_jobs), candidates))
+        trials.extend(results)
+        results.sort(key=lambda r: r['auc'], reverse=True)
+        if verbose:
+            print(f"   Rung {rung + 1}/{n_rungs}: {len(candidates)} configs x {rounds} rounds, "
+                  f"best val AUC {results[0]['auc']:.4f} ({time.perf_counter() - start:.2f}s)")
+        if rung == n_rungs - 1 or len(results) == 1:
+            # The first of equal AUCs, i.e. the one found with fewer rounds
+            return max(trials, key=lambda r: r['auc']), trials
+        candidates = [r['config'] for r in results[:max(1, len(results) // eta)]]
@@ -0,0 +1,176 @@
+"""
+Defaulter risk scoring and per-CHV visit priority queues for immunization.
+
+score_defaulters() turns ImmunizationEngine.status into, per child, the
+risk of missing the next dose and a visit priority: risk weighted by how
+soon the dose is due (1 once it is due, decaying with URGENCY_HALF_LIFE_DAYS
+before that). Until a defaulter model has been trained on visit outcomes the
+risk is a logistic score over the child's dose history (overdue and missed
+doses, coverage of the doses due so far, weeks late); any callable that
+maps the status frame to probabilities can replace it.
+
+VisitQueue keeps one binary heap per CHV (children are assigned through
+households.chv_id). A rescore pushes a new entry and bumps the child's
+version, so older entries of that child are skipped when they surface (lazy
+deletion) and updates cost O(log n) per changed child instead of a rebuild.
+Heaps are rebuilt (heapify, O(n)) from scratch only when most of the caseload
+changed at once, e.g. when the as-of date moves. The queue is saved next to
+the engine state, so each sync batch only rescores the children it touched.
+"""
+import os
+import heapq
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from . import registry
+
+URGENCY_HALF_LIFE_DAYS = 14
+# Logistic prior: intercept and weights of the dose-history features (dose counts enter as log1p)
+RISK_WEIGHTS = {'intercept': -3.0, 'doses_overdue': 0.8, 'doses_missed': 0.6,
+                'coverage_gap': 2.5, 'weeks_late': 0.08}
+UNASSIGNED = 'UNASSIGNED'
+# Fraction of the queued children an update may touch before the heaps are rebuilt instead
+REBUILD_FRACTION = 0.5
+VISIT_QUEUE_PATH = os.getenv(
+    'VISIT_QUEUE_PATH', os.path.join(registry.ARTIFACT_ROOT, 'immunization', 'visit_queue.pkl')
+)
+
+
+def default_risk(status, as_of):
+    """P(missing the next dose) from the dose-history columns of ImmunizationEngine.status."""
+    w = RISK_WEIGHTS
+    coverage = status['doses_received'] / status['doses_expected'].clip(lower=1)
+    days_late = (as_of - pd.to_datetime(status['next_due_date'])).dt.days.fillna(0).clip(lower=0)
+    logit = (w['intercept']
+             + w['doses_overdue'] * np.log1p(status['doses_overdue'])
+             + w['doses_missed'] * np.log1p(status['doses_missed'])
+             + w['coverage_gap'] * (1 - coverage.clip(upper=1))
+             + w['weeks_late'] * (days_late / 7).clip(upper=26))
+    return 1 / (1 + np.exp(-logit.to_numpy(dtype=float)))
+
+
+def score_defaulters(status, as_of, scorer=default_risk):
+    """
+    Risk, days until the next dose and visit priority of every child with a
+    next dose (complete schedules are left out), indexed by ovc_id.
+    """
+    as_of = pd.Timestamp(as_of).normalize()
+    pending = status[status['next_due_date'].notna()]
+    days_until = (pd.to_datetime(pending['next_due_date']) - as_of).dt.days.to_numpy()
+    risk = np.asarray(scorer(pending, as_of), dtype=float)
+    urgency = np.exp2(-np.clip(days_until, 0, None) / URGENCY_HALF_LIFE_DAYS)
+    return pd.DataFrame({
+        'risk': risk,
+        'days_until_due': days_until,
+        'priority': risk * urgency
+    }, index=pending.index)
+
+
+class VisitQueue:
+    def __init__(self):
+        self.heaps = {}
+        # ovc_id -> (version, chv_id) of the child's live entry
+        self.live = {}
+        self._version = 0
+        # Date the priorities were scored at; a different one means a rebuild
+        self.as_of = None
+
+    def __len__(self):
+        return len(self.live)
+
+    def build(self, scores, chv_of):
+        """
+        Replaces every heap. scores: score_defaulters() output; chv_of:
+        Series ovc_id -> chv_id (children without one go to UNASSIGNED).
+        """
+        chv = chv_of.reindex(scores.index).fillna(UNASSIGNED).to_numpy(dtype=object)
+        self._version += 1
+        version = self._version
+        ids = scores.index.to_numpy(dtype=object)
+        keys = -scores['priority'].to_numpy(dtype=float)
+        self.live = dict(zip(ids, zip([version] * len(ids), chv)))
+        self.heaps = {}
+        order = np.argsort(chv, kind='stable')
+        chv, ids, keys = chv[order], ids[order], keys[order]
+        starts = np.flatnonzero(np.r_[True, chv[1:] != chv[:-1]]) if len(chv) else []
+        for start, end in zip(starts, list(starts[1:]) + [len(chv)]):
+            heap = list(zip(keys[start:end].tolist(), [version] * (end - start), ids[start:end].tolist()))
+            heapq.heapify(heap)
+            self.heaps[chv[start]] = heap
+        return self
+
+    def update(self, scores, chv_of, removed=()):
+        """
+        Rescored children (and their CHV, which may have changed) go in with
+        a new version; removed ids (e.g. schedule complete) drop out. When
+        the scores cover the whole queue it is rebuilt instead.
+        """
+        if not self.live or (len(scores) > REBUILD_FRACTION * len(self.live)
+                             and self.live.keys() <= set(scores.index)):
+            # Everyone was rescored: one heapify is cheaper than a push per child
+            return self.build(scores, chv_of)
+        for ovc_id in removed:
+            self.live.pop(ovc_id, None)
+        self._version += 1
+        chv = chv_of.reindex(scores.index).fillna(UNASSIGNED).to_numpy(dtype=object)
+        for ovc_id, priority, c in zip(scores.index, scores['priority'].to_numpy(dtype=float), chv):
+            self.live[ovc_id] = (self._version, c)
+            heapq.heappush(self.heaps.setdefault(c, []), (-priority, self._version, ovc_id))
+        for c in set(chv):
+            self._compact(c)
+        return self
+
+    def chv_moves(self, chv_of):
+        """ids of queued children whose CHV in chv_of differs from the one they are queued under."""
+        current = chv_of.reindex(pd.Index(list(self.live), dtype=object)).fillna(UNASSIGNED).to_numpy(dtype=object)
+        queued = np.array([chv for _, chv in self.live.values()], dtype=object)
+        return pd.Index(list(self.live), dtype=object)[current != queued]
+
+    def save(self, path=VISIT_QUEUE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        state = {'heaps': self.heaps, 'live': self.live, 'version': self._version, 'as_of': self.as_of}
+        tmp = path + '.tmp'
+        # Plain lists and dicts: pickle writes them several times faster than joblib does
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return path
+
+    def load(self, path=VISIT_QUEUE_PATH):
+        """Restores a saved queue; False (and empty) when there is none."""
+        if not os.path.exists(path):
+            return False
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        self.heaps, self.live, self._version, self.as_of = state['heaps'], state['live'], state['version'], state['as_of']
+        return True
+
+    def _is_live(self, entry, chv):
+        return self.live.get(entry[2]) == (entry[1], chv)
+
+    def _compact(self, chv):
+        """Drops stale entries once they outnumber the live ones."""
+        heap = self.heaps.get(chv, [])
+        if len(heap) > 64 and len(heap) > 2 * sum(1 for e in heap if self._is_live(e, chv)):
+            heap[:] = [e for e in heap if self._is_live(e, chv)]
+            heapq.heapify(heap)
+
+    def top(self, chv, n=10):
+        """[(ovc_id, priority)] of the n children a CHV should visit first."""
+        heap = self.heaps.get(chv, [])
+        out = []
+        while heap and len(out) < n:
+            # Stale entries popped on the way are dropped for good
+            entry = heapq.heappop(heap)
+            if self._is_live(entry, chv):
+                out.append(entry)
+        for entry in out:
+            heapq.heappush(heap, entry)
+        return [(ovc_id, -key) for key, _, ovc_id in out]
+
+    def top_overall(self, n=10, chvs=None):
+        """[(chv_id, ovc_id, priority)] of the n highest priorities across chvs (default: all)."""
+        ranked = [[(-p, c, i) for i, p in self.top(c, n)] for c in (chvs if chvs is not None else self.heaps)]
+        return [(c, i, -key) for key, c, i in heapq.nsmallest(n, heapq.merge(*ranked))]
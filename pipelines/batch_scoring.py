@@ -0,0 +1,151 @@
+"""
+Batch scoring with the saved Jali model artifacts.
+
+Loads a pillar's pipeline from the model registry (latest version unless
+--version is given) and scores a local CSV or a Snowflake query in chunks of
+SCORE_CHUNK_ROWS, so memory stays flat however large the extract is. Each
+pipeline starts with the PreprocessingPlan it was trained with, so raw rows
+are cleaned exactly as they were for training. Probabilities are written
+chunk by chunk to a CSV (--output) or to a Snowflake table (--table).
+
+    python pipelines/batch_scoring.py --model tb --input CRT_dataset.csv --id-cols studynumber --output tb_scores.csv
+    python pipelines/batch_scoring.py --model hiv_adherence --source snowflake \\
+        --query "SELECT * FROM RAW.HIV_ADHERENCE_DATASET" --table ML.HIV_ADHERENCE_SCORES
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+import pandas as pd
+from dotenv import load_dotenv
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+# Sibling scripts (snowflake_ml_pipeline) import by module name, also under python -m pipelines.batch_scoring
+sys.path.append(os.path.join(project_root, 'pipelines'))
+
+from models.registry import PILLARS, load_model
+
+load_dotenv()
+
+SCORE_CHUNK_ROWS = int(os.getenv('SCORE_CHUNK_ROWS', '100000'))
+
+# Same keys as snowflake_ml_pipeline.fetch_data
+SCORING_MODELS = list(PILLARS)
+
+
+def score_frame(model, df, id_cols=()):
+    """id_cols of df plus the positive-class probability, one row per input row."""
+    out = df[list(id_cols)].copy() if id_cols else pd.DataFrame(index=df.index)
+    out['model'] = model.model_name
+    out['probability'] = model.predict_proba(df)
+    out['scored_at'] = datetime.now()
+    return out
+
+
+def iter_csv_chunks(path, chunk_rows=SCORE_CHUNK_ROWS):
+    return pd.read_csv(path, chunksize=chunk_rows, low_memory=False)
+
+
+def iter_snowflake_chunks(query, chunk_rows=SCORE_CHUNK_ROWS):
+    """Streams a query result as DataFrames of at most chunk_rows rows."""
+    from snowflake_ml_pipeline import get_snowflake_conn
+
+    conn = get_snowflake_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(query)
+        columns = [d[0] for d in cur.description]
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    finally:
+        conn.close()
+
+
+def write_csv_chunk(scores, path, first):
+    scores.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+
+
+def write_snowflake_chunk(scores, table, first, conn):
+    from snowflake.connector.pandas_tools import write_pandas
+
+    schema, _, name = table.upper().rpartition('.')
+    scores = scores.rename(columns=str.upper)
+    write_pandas(conn, scores, name, schema=schema or None, auto_create_table=True,
+                 overwrite=first, use_logical_type=True)
+
+
+def run_batch_scoring(model_name, source='local', input_path=None, query=None, output=None,
+                      table=None, id_cols=(), chunk_rows=SCORE_CHUNK_ROWS, artifact=None, version=None):
+    """Scores every chunk of the source and writes it out. Returns (rows scored, seconds)."""
+    print(f"--- Jali Batch Scoring: {model_name} ({source}) ---")
+    model = load_model(model_name, version=version, path=artifact)
+    if model.metadata:
+        print(f"   Version {model.metadata.get('version')}, trained {model.metadata.get('trained_at')}, "
+              f"AUC {model.metadata.get('auc', float('nan')):.4f}")
+    if source == 'local':
+        chunks = iter_csv_chunks(input_path, chunk_rows)
+    else:
+        chunks = iter_snowflake_chunks(query, chunk_rows)
+
+    sf_conn = None
+    if table:
+        from snowflake_ml_pipeline import get_snowflake_conn
+        sf_conn = get_snowflake_conn()
+
+    start = time.perf_counter()
+    rows = 0
+    try:
+        for i, chunk in enumerate(chunks):
+            scores = score_frame(model, chunk, id_cols)
+            if table:
+                write_snowflake_chunk(scores, table, i == 0, sf_conn)
+            else:
+                write_csv_chunk(scores, output, i == 0)
+            rows += len(scores)
+            elapsed = time.perf_counter() - start
+            print(f"   Chunk {i + 1}: {rows} rows scored ({rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+    finally:
+        if sf_conn is not None:
+            sf_conn.close()
+
+    seconds = time.perf_counter() - start
+    print(f"--- Scored {rows} rows in {seconds:.2f}s -> {table or output} ---")
+    return rows, seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score a CSV or Snowflake extract with a saved Jali model')
+    parser.add_argument('--model', type=str, required=True, choices=SCORING_MODELS)
+    parser.add_argument('--source', type=str, default='local', choices=['local', 'snowflake'])
+    parser.add_argument('--input', type=str, help='CSV to score (--source local)')
+    parser.add_argument('--query', type=str, help='SELECT returning the rows to score (--source snowflake)')
+    parser.add_argument('--output', type=str, default=None, help='CSV to write the scores to')
+    parser.add_argument('--table', type=str, default=None,
+                        help='Snowflake table to write the scores to instead of a CSV, e.g. ML.TB_SCORES')
+    parser.add_argument('--id-cols', type=str, default='',
+                        help='Comma-separated columns copied next to each score to identify the row')
+    parser.add_argument('--chunk-rows', type=int, default=SCORE_CHUNK_ROWS,
+                        help=f'Rows scored per chunk (default: {SCORE_CHUNK_ROWS})')
+    parser.add_argument('--artifact', type=str, default=None,
+                        help='Pipeline file to load instead of the registry artifact')
+    parser.add_argument('--version', type=int, default=None,
+                        help='Artifact version to score with (default: latest)')
+
+    args = parser.parse_args()
+    if args.source == 'local' and not args.input:
+        parser.error('--input is required with --source local')
+    if args.source == 'snowflake' and not args.query:
+        parser.error('--query is required with --source snowflake')
+    if not args.table and not args.output:
+        parser.error('give --output or --table')
+
+    run_batch_scoring(args.model, source=args.source, input_path=args.input, query=args.query,
+                      output=args.output, table=args.table,
+                      id_cols=[c for c in args.id_cols.split(',') if c],
+                      chunk_rows=args.chunk_rows, artifact=args.artifact, version=args.version)
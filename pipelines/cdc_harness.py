@@ -0,0 +1,95 @@
+"""
+Docker-free check of the CDC path against a local Postgres.
+
+Needs a running Postgres reachable through the usual DB_* variables with
+wal_level = logical and the wal2json plugin installed. The harness creates a
+scratch table and a temporary replication slot, runs inserts, updates, a
+primary-key change and deletes, then reads them back through cdc_sync's
+reader and collapse logic. The changes are applied with MERGE semantics to an
+in-memory copy instead of Snowflake, and that copy must equal the Postgres
+table. Everything it creates is dropped on exit.
+
+    python pipelines/cdc_harness.py
+"""
+import sys
+import uuid
+
+from postgres_to_snowflake_sync import get_postgres_conn
+from cdc_sync import (
+    get_replication_conn,
+    create_slot,
+    drop_slot,
+    start_stream,
+    read_changes,
+    collapse_changes
+)
+
+HARNESS_TABLE = 'cdc_harness_items'
+KEY_COLS = ['item_id']
+
+
+def apply_locally(target, collapsed):
+    """The MERGE from cdc_sync.merge_sql, applied to a dict keyed by primary key."""
+    for change in collapsed:
+        key = tuple(change['row'][k] for k in KEY_COLS)
+        if change['op'] == 'D':
+            target.pop(key, None)
+        else:
+            target[key] = dict(target.get(key, {}), **change['row'])
+    return target
+
+
+def run_workload(cur):
+    cur.execute(f"INSERT INTO {HARNESS_TABLE} (item_id, name, phone) VALUES "
+                "(1, 'Amina Otieno', '0711'), (2, 'Brian K', '0722'), (3, 'Chebet', '0733')")
+    cur.execute(f"UPDATE {HARNESS_TABLE} SET name = 'Amina W Otieno' WHERE item_id = 1")
+    cur.execute(f"UPDATE {HARNESS_TABLE} SET item_id = 20 WHERE item_id = 2")
+    cur.execute(f"DELETE FROM {HARNESS_TABLE} WHERE item_id = 3")
+    cur.execute(f"INSERT INTO {HARNESS_TABLE} (item_id, name, phone) VALUES (4, 'Dan', NULL)")
+    cur.execute(f"DELETE FROM {HARNESS_TABLE} WHERE item_id = 4")
+
+
+def main():
+    slot_name = f"jali_cdc_harness_{uuid.uuid4().hex[:8]}"
+    pg_conn = get_postgres_conn()
+    pg_conn.autocommit = True
+    repl_conn = get_replication_conn()
+    repl_cur = repl_conn.cursor()
+    cur = pg_conn.cursor()
+    try:
+        cur.execute(f"DROP TABLE IF EXISTS {HARNESS_TABLE}")
+        cur.execute(f"CREATE TABLE {HARNESS_TABLE} (item_id INT PRIMARY KEY, name TEXT, phone TEXT)")
+        create_slot(repl_cur, slot_name)
+
+        run_workload(cur)
+
+        start_stream(repl_cur, [HARNESS_TABLE], slot_name=slot_name)
+        changes, _ = read_changes(repl_cur, idle_seconds=2)
+        raw = changes.get(HARNESS_TABLE, [])
+        collapsed = collapse_changes(raw, KEY_COLS)
+        replica = apply_locally({}, collapsed)
+
+        cur.execute(f"SELECT item_id, name, phone FROM {HARNESS_TABLE}")
+        expected = {(r[0],): {'item_id': r[0], 'name': r[1], 'phone': r[2]} for r in cur.fetchall()}
+
+        print(f"Read {len(raw)} changes, collapsed to {len(collapsed)}.")
+        if replica == expected:
+            print("PASS: replica matches Postgres.")
+            return 0
+        print(f"FAIL:\n   expected {expected}\n   replica  {replica}")
+        return 1
+    finally:
+        repl_conn.close()
+        # The slot can only be dropped once the streaming connection is gone
+        repl_conn = get_replication_conn()
+        try:
+            drop_slot(repl_conn.cursor(), slot_name)
+        except Exception as e:
+            print(f"Warning: could not drop slot {slot_name}: {e}")
+        repl_conn.close()
+        cur.execute(f"DROP TABLE IF EXISTS {HARNESS_TABLE}")
+        pg_conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Log-based change data capture (CDC) for the Postgres -> Snowflake sync.
+
+Instead of re-reading whole tables, row changes are read from a logical
+replication slot (wal2json, format-version 2). They are collapsed to the last
+change per primary key, masked, staged as one micro-file per table and applied
+to RAW.POSTGRES_<TABLE> with a single MERGE. The slot position is only
+confirmed after every table has merged, so a failed run is replayed in full
+next time; MERGE by key makes that replay idempotent.
+
+Setup (once): wal_level = logical in postgresql.conf, the wal2json plugin
+installed, then `python pipelines/cdc_sync.py --create-slot` BEFORE the initial
+full sync so no change falls between the snapshot and the slot.
+"""
+import os
+import json
+import time
+import select
+import argparse
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+import psycopg2
+import psycopg2.errors
+from psycopg2.extras import LogicalReplicationConnection
+from dotenv import load_dotenv
+
+from postgres_to_snowflake_sync import (
+    TABLES_TO_SYNC,
+    SYNC_STAGE_FORMAT,
+    get_snowflake_conn,
+    write_stage_file,
+    copy_into_sql
+)
+from masking import mask_dataframe
+
+load_dotenv()
+
+CDC_SLOT_NAME = os.getenv('CDC_SLOT_NAME', 'jali_cdc')
+CDC_PG_SCHEMA = os.getenv('CDC_PG_SCHEMA', 'public')
+CDC_MAX_CHANGES = int(os.getenv('CDC_MAX_CHANGES', '50000'))
+CDC_IDLE_SECONDS = float(os.getenv('CDC_IDLE_SECONDS', '5'))
+OP_COLUMN = '_cdc_op'
+
+
+def get_replication_conn():
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'jali_oltp'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASS', 'password'),
+        port=os.getenv('DB_PORT', '5432'),
+        connection_factory=LogicalReplicationConnection
+    )
+
+
+def cdc_tables():
+    """Synced tables that have a primary key, parents before children."""
+    tables = {t['name']: t for t in TABLES_TO_SYNC if t.get('key')}
+    ordered, seen = [], set()
+
+    def visit(name):
+        if name in seen or name not in tables:
+            return
+        seen.add(name)
+        for dep in tables[name].get('depends_on', []):
+            visit(dep)
+        ordered.append(tables[name])
+
+    for name in tables:
+        visit(name)
+    return ordered
+
+
+def create_slot(repl_cur, slot_name=CDC_SLOT_NAME):
+    try:
+        repl_cur.create_replication_slot(slot_name, output_plugin='wal2json')
+        print(f"Created replication slot '{slot_name}'.")
+    except psycopg2.errors.DuplicateObject:
+        print(f"Replication slot '{slot_name}' already exists.")
+
+
+def drop_slot(repl_cur, slot_name=CDC_SLOT_NAME):
+    repl_cur.drop_replication_slot(slot_name)
+    print(f"Dropped replication slot '{slot_name}'.")
+
+
+def start_stream(repl_cur, table_names, slot_name=CDC_SLOT_NAME, schema=CDC_PG_SCHEMA):
+    repl_cur.start_replication(slot_name=slot_name, decode=True, options={
+        'format-version': '2',
+        'include-pk': '1',
+        'include-transaction': '1',
+        'add-tables': ','.join(f"{schema}.{name}" for name in table_names)
+    })
+
+
+def parse_wal2json(payload):
+    """
+    Turns one wal2json v2 message into {'table', 'op', 'row', 'identity'}.
+    Returns the action letter ('B'/'C') for transaction markers and None for
+    anything else (truncate, logical messages).
+    """
+    msg = json.loads(payload)
+    action = msg.get('action')
+    if action in ('B', 'C'):
+        return action
+    if action not in ('I', 'U', 'D'):
+        return None
+    return {
+        'table': msg['table'],
+        'op': action,
+        'row': {c['name']: c['value'] for c in msg.get('columns', [])},
+        'identity': {c['name']: c['value'] for c in msg.get('identity', [])}
+    }
+
+
+def read_changes(repl_cur, max_changes=CDC_MAX_CHANGES, idle_seconds=CDC_IDLE_SECONDS):
+    """
+    Reads changes until the stream has been idle for idle_seconds, or until
+    max_changes is reached at a transaction boundary. Returns the changes
+    grouped by table and the LSN of the last message read.
+    """
+    changes, count, last_lsn = {}, 0, None
+    idle_since = time.monotonic()
+    while True:
+        msg = repl_cur.read_message()
+        if msg is None:
+            if time.monotonic() - idle_since >= idle_seconds:
+                break
+            select.select([repl_cur], [], [], min(1.0, idle_seconds))
+            continue
+
+        idle_since = time.monotonic()
+        last_lsn = msg.data_start
+        change = parse_wal2json(msg.payload)
+        if change == 'C' and count >= max_changes:
+            break
+        if isinstance(change, dict):
+            changes.setdefault(change['table'], []).append(change)
+            count += 1
+    return changes, last_lsn
+
+
+def collapse_changes(changes, key_cols):
+    """
+    Keeps only the last change per primary key, in commit order. An update
+    that moves a row to a new key becomes a delete of the old key plus an
+    upsert of the new one.
+    """
+    latest = {}
+    for ch in changes:
+        if ch['op'] == 'U' and ch['identity']:
+            old_key = tuple(ch['identity'].get(k) for k in key_cols)
+            new_key = tuple(ch['row'].get(k) for k in key_cols)
+            if old_key != new_key:
+                latest.pop(old_key, None)
+                latest[old_key] = {'op': 'D', 'row': dict(zip(key_cols, old_key))}
+
+        row = ch['identity'] if ch['op'] == 'D' else ch['row']
+        key = tuple(row.get(k) for k in key_cols)
+        latest.pop(key, None)
+        latest[key] = {'op': ch['op'], 'row': row}
+    return list(latest.values())
+
+
+def changes_to_frame(collapsed):
+    """One row per key with the op in OP_COLUMN; deletes only carry key columns."""
+    records = [dict(c['row'], **{OP_COLUMN: c['op']}) for c in collapsed]
+    return pd.DataFrame.from_records(records)
+
+
+def merge_sql(target_table, staging_table, columns, key_cols):
+    cols = [c.upper() for c in columns if c != OP_COLUMN]
+    op = OP_COLUMN.upper()
+    on = " AND ".join(f"t.{k.upper()} = s.{k.upper()}" for k in key_cols)
+    updates = ", ".join(f"t.{c} = s.{c}" for c in cols)
+    return f"""
+        MERGE INTO {target_table} t
+        USING {staging_table} s ON {on}
+        WHEN MATCHED AND s.{op} = 'D' THEN DELETE
+        WHEN MATCHED THEN UPDATE SET {updates}, t._SYNCED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED AND s.{op} <> 'D' THEN
+            INSERT ({', '.join(cols)}) VALUES ({', '.join('s.' + c for c in cols)})
+    """
+
+
+def apply_table_changes(sf_cursor, table_info, df, stage_format=None):
+    """Stages one micro-file of collapsed changes and MERGEs it into the RAW table."""
+    table_name = table_info['name']
+    target = f"{table_info['schema']}.POSTGRES_{table_name.upper()}"
+    staging = f"{table_info['schema']}.CDC_{table_name.upper()}"
+    stage_path = f"@RAW.JALI_CSV_STAGE/cdc/{table_name}/"
+    stage_format = (stage_format or SYNC_STAGE_FORMAT).lower()
+
+    df = mask_dataframe(df, verbose=False)
+    sf_cursor.execute(f"CREATE OR REPLACE TEMPORARY TABLE {staging} LIKE {target}")
+    sf_cursor.execute(f"ALTER TABLE {staging} ADD COLUMN {OP_COLUMN.upper()} VARCHAR(1)")
+    sf_cursor.execute(f"REMOVE {stage_path}")
+
+    with tempfile.TemporaryDirectory(prefix=f"jali_cdc_{table_name}_") as tmp_dir:
+        part_file = write_stage_file(df, os.path.join(tmp_dir, f"{table_name}_cdc"), stage_format)
+        abs_path = os.path.abspath(part_file).replace('\\', '/')
+        compress = 'FALSE' if stage_format == 'parquet' else 'TRUE'
+        sf_cursor.execute(f"PUT 'file://{abs_path}' {stage_path} OVERWRITE=TRUE AUTO_COMPRESS={compress}")
+
+    sf_cursor.execute(copy_into_sql(staging, stage_path, list(df.columns), stage_format))
+    sf_cursor.execute(merge_sql(target, staging, df.columns, table_info['key']))
+    sf_cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+
+
+def run_cdc_cycle(repl_cur, sf_cursor, tables, max_changes=CDC_MAX_CHANGES,
+                  idle_seconds=CDC_IDLE_SECONDS, stage_format=None):
+    """Reads one batch of changes and merges it. Returns {table: (changes read, rows merged)}."""
+    changes, last_lsn = read_changes(repl_cur, max_changes, idle_seconds)
+    summary = {}
+    for table_info in tables:
+        table_changes = changes.get(table_info['name'])
+        if not table_changes:
+            continue
+        collapsed = collapse_changes(table_changes, table_info['key'])
+        apply_table_changes(sf_cursor, table_info, changes_to_frame(collapsed), stage_format)
+        summary[table_info['name']] = (len(table_changes), len(collapsed))
+        print(f"   {table_info['name']}: {len(table_changes)} changes -> {len(collapsed)} rows merged")
+
+    if last_lsn is not None:
+        # Only now is it safe to let Postgres recycle the WAL we just applied
+        repl_cur.send_feedback(flush_lsn=last_lsn, reply=True)
+    return summary
+
+
+def run_cdc_sync(max_changes=CDC_MAX_CHANGES, idle_seconds=CDC_IDLE_SECONDS, stage_format=None):
+    """Drains the replication slot in micro-batches until no changes are left."""
+    print(f"--- Jali Pipeline: CDC Sync (slot '{CDC_SLOT_NAME}') ---")
+    tables = cdc_tables()
+    start = time.perf_counter()
+    totals = {}
+    repl_conn = get_replication_conn()
+    sf_conn = get_snowflake_conn()
+    try:
+        repl_cur = repl_conn.cursor()
+        sf_cursor = sf_conn.cursor()
+        start_stream(repl_cur, [t['name'] for t in tables])
+        while True:
+            print(f"[{datetime.now()}] Reading changes...")
+            summary = run_cdc_cycle(repl_cur, sf_cursor, tables, max_changes, idle_seconds, stage_format)
+            if not summary:
+                break
+            for name, (read, merged) in summary.items():
+                prev = totals.get(name, (0, 0))
+                totals[name] = (prev[0] + read, prev[1] + merged)
+    finally:
+        repl_conn.close()
+        sf_conn.close()
+
+    print(f"\n{'TABLE':<25}{'CHANGES':>10}{'MERGED':>10}")
+    for name, (read, merged) in totals.items():
+        print(f"{name:<25}{read:>10}{merged:>10}")
+    print(f"--- CDC Sync Finished in {time.perf_counter() - start:.2f}s ---")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Jali Postgres -> Snowflake CDC sync')
+    parser.add_argument('--create-slot', action='store_true', help='Create the replication slot and exit')
+    parser.add_argument('--drop-slot', action='store_true', help='Drop the replication slot and exit')
+    parser.add_argument('--max-changes', type=int, default=CDC_MAX_CHANGES,
+                        help='Changes per micro-batch (rounded up to a transaction boundary)')
+    parser.add_argument('--idle-seconds', type=float, default=CDC_IDLE_SECONDS,
+                        help='Stop reading a micro-batch after this long without changes')
+    parser.add_argument('--stage-format', type=str, default=None, choices=['csv', 'parquet'])
+
+    args = parser.parse_args()
+    if args.create_slot or args.drop_slot:
+        conn = get_replication_conn()
+        try:
+            cur = conn.cursor()
+            create_slot(cur) if args.create_slot else drop_slot(cur)
+        finally:
+            conn.close()
+    else:
+        run_cdc_sync(max_changes=args.max_changes, idle_seconds=args.idle_seconds,
+                     stage_format=args.stage_format)
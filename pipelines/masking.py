@@ -0,0 +1,167 @@
+"""
+PII masking for data leaving Postgres.
+
+Columns are masked according to MASKING_POLICIES (column name -> policy).
+The vectorized kernels give exactly the same output as the per-cell reference
+functions partial_mask_name and mask_generic. Those functions are kept for the
+parity check in benchmarks/masking_throughput.py, and mask the rare cells
+containing NUL characters, which numpy str arrays cannot hold.
+"""
+import numpy as np
+import pandas as pd
+
+# Column (lower-case) -> masking policy
+MASKING_POLICIES = {
+    'caregiver_name': 'partial_name',
+    'ovc_name': 'partial_name',
+    'chv_name': 'partial_name',
+    'national_id': 'full',
+    'phone': 'full',
+    'birth_cert_no': 'full',
+    'ncpwd_no': 'full',
+}
+
+_SPACE = ord(' ')
+_STAR = ord('*')
+
+
+def partial_mask_name(name):
+    if not pd.notna(name) or str(name).strip() == "":
+        return name
+    parts = str(name).split()
+    masked_parts = []
+    for part in parts:
+        if len(part) <= 2:
+            masked_parts.append(part[0] + "*" * (len(part)-1) if len(part) > 1 else "*")
+        else:
+            masked_parts.append(part[0] + "*" * (len(part)-2) + part[-1])
+    return " ".join(masked_parts)
+
+
+def mask_generic(val):
+    if not pd.notna(val) or str(val).strip() == "":
+        return val
+    return "****"
+
+
+# str.isspace() for every code point that can be whitespace (the last is U+3000)
+_IS_SPACE = np.array([chr(i).isspace() for i in range(0x3001)], dtype=bool)
+
+
+def _text_matrix(series):
+    """
+    Lays out str(value) of every non-missing cell as a (rows x chars) matrix of
+    code points. Returns the missing mask, the matrix, the numpy str dtype and
+    the non-missing values, in matrix row order.
+    """
+    missing = series.isna().to_numpy()
+    # numpy's str conversion calls str() per object, exactly like the reference
+    text = series.to_numpy(dtype=object)[~missing]
+    chars = np.array(text if len(text) else [''], dtype=str)[:len(text)]
+    width = max(chars.dtype.itemsize // 4, 1)
+    codes = chars.view(np.uint32).reshape(len(chars), width) if len(chars) else np.zeros((0, 1), np.uint32)
+    return missing, codes, np.dtype(f'<U{width}'), text
+
+
+def _nul_rows(text):
+    """Indices of the values whose str() contains NUL, which numpy str arrays drop or truncate at."""
+    try:
+        joined = ''.join(text)
+    except TypeError:
+        text = [str(t) for t in text]
+        joined = ''.join(text)
+    if '\x00' not in joined:
+        return np.zeros(0, dtype=np.int64)
+    return np.array([i for i, t in enumerate(text) if '\x00' in t], dtype=np.int64)
+
+
+def _whitespace(codes):
+    is_space = (codes == _SPACE) | ((codes >= 9) & (codes <= 13)) | ((codes >= 28) & (codes <= 31))
+    non_ascii = codes > 127
+    if non_ascii.any():
+        high = codes[non_ascii]
+        is_space[non_ascii] = _IS_SPACE[np.minimum(high, len(_IS_SPACE) - 1)] & (high < len(_IS_SPACE))
+    return is_space
+
+
+def mask_partial_name_series(series):
+    """
+    Vectorized partial_mask_name. Masking never changes word lengths, so the
+    names are masked as a (rows x chars) matrix of code points: a character is
+    kept if it is whitespace, the first letter of a word longer than one
+    letter, or the last letter of a word of 3+ letters. Rows whose whitespace
+    is not already single spaces are re-joined afterwards, as str.split() would.
+    """
+    missing, codes, dtype, text = _text_matrix(series)
+    result = series.to_numpy(dtype=object, copy=True)
+    if not len(codes):
+        return pd.Series(result, index=series.index, name=series.name)
+
+    is_space = _whitespace(codes)
+    is_char = (codes != 0) & ~is_space
+    prev_char = np.zeros_like(is_char)
+    prev_char[:, 1:] = is_char[:, :-1]
+    next_char = np.zeros_like(is_char)
+    next_char[:, :-1] = is_char[:, 1:]
+
+    word_start = is_char & ~prev_char
+    word_end = is_char & ~next_char
+    # The letter before a word end is the word start only for 2-letter words
+    before_end_is_start = np.zeros_like(is_char)
+    before_end_is_start[:, 1:] = word_start[:, :-1]
+
+    keep = (word_start & ~word_end) | (word_end & ~word_start & ~before_end_is_start)
+    masked = np.where(is_char & ~keep, np.uint32(_STAR), codes)
+    masked_text = masked.view(dtype).ravel().tolist()
+
+    words = word_start.sum(axis=1)
+    spaces = is_space.sum(axis=1)
+    # Exactly one ' ' between consecutive words means str.split() would change nothing
+    irregular = (spaces != np.maximum(words - 1, 0)) | (is_space & (codes != _SPACE)).any(axis=1)
+    for i in np.flatnonzero(irregular & (words > 0)):
+        masked_text[i] = " ".join(masked_text[i].split())
+
+    # Blank cells (no word at all) are returned unchanged, like the reference
+    rows = np.flatnonzero(~missing)
+    present = words > 0
+    if present.all():
+        result[rows] = masked_text
+    else:
+        result[rows[present]] = [t for t, keep_row in zip(masked_text, present) if keep_row]
+    nul = _nul_rows(text)
+    result[rows[nul]] = [partial_mask_name(v) for v in text[nul]]
+    return pd.Series(result, index=series.index, name=series.name)
+
+
+def mask_full_series(series):
+    """Vectorized mask_generic."""
+    missing, codes, _, text = _text_matrix(series)
+    result = series.to_numpy(dtype=object, copy=True)
+    rows = np.flatnonzero(~missing)
+    has_text = ((codes != 0) & ~_whitespace(codes)).any(axis=1)
+    result[rows[has_text]] = "****"
+    # NUL only matters where the matrix saw no text: '\x00' is not blank to str.strip()
+    blank = np.flatnonzero(~has_text)
+    nul = blank[_nul_rows(text[blank])]
+    result[rows[nul]] = [mask_generic(v) for v in text[nul]]
+    return pd.Series(result, index=series.index, name=series.name)
+
+
+POLICY_KERNELS = {
+    'partial_name': mask_partial_name_series,
+    'full': mask_full_series,
+}
+
+
+def mask_dataframe(df, policies=None, verbose=True):
+    """Masks every column of df that has a policy, in place, and returns df."""
+    policies = MASKING_POLICIES if policies is None else policies
+    for col in df.columns:
+        policy = policies.get(col.lower())
+        if policy is None:
+            continue
+        if policy not in POLICY_KERNELS:
+            raise ValueError(f"Unknown masking policy '{policy}' for column {col}")
+        if verbose: print(f"   Applying {policy} masking to: {col}")
+        df[col] = POLICY_KERNELS[policy](df[col])
+    return df
@@ -1,27 +1,42 @@
 import os
+import argparse
 import psycopg2
 import snowflake.connector
 import pandas as pd
 import time
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from dotenv import load_dotenv
+from sync_state import SyncStateStore, schema_fingerprint
+from masking import mask_dataframe
 
 
 load_dotenv()
 
 # table sync from Postgres to Snowflake
+# 'depends_on' mirrors the FK chain in schema.sql so the concurrent mode never
+# lands a child table before its parents.
+# 'key' is the primary key used by the CDC MERGE (cdc_sync.py); tables without
+# one are left to the batch sync.
 TABLES_TO_SYNC = [
-    {'name': 'ovc_cases', 'schema': 'RAW'},
-    {'name': 'households', 'schema': 'RAW'},
-    {'name': 'chvs', 'schema': 'RAW'},
-    {'name': 'ovcs', 'schema': 'RAW'},
-    {'name': 'caregivers', 'schema': 'RAW'},
-    {'name': 'cbos', 'schema': 'RAW'},
-    {'name': 'facilities', 'schema': 'RAW'},
-    {'name': 'schools', 'schema': 'RAW'},
+    {'name': 'ovc_cases', 'schema': 'RAW', 'key': ['case_id'], 'depends_on': ['ovcs', 'caregivers', 'chvs']},
+    {'name': 'households', 'schema': 'RAW', 'key': ['household_id'], 'depends_on': ['chvs', 'cbos']},
+    {'name': 'chvs', 'schema': 'RAW', 'key': ['chv_id']},
+    {'name': 'ovcs', 'schema': 'RAW', 'key': ['ovc_id'], 'depends_on': ['households']},
+    {'name': 'caregivers', 'schema': 'RAW', 'key': ['caregiver_id'], 'depends_on': ['households']},
+    {'name': 'cbos', 'schema': 'RAW', 'key': ['cbo_id']},
+    {'name': 'facilities', 'schema': 'RAW', 'key': ['facility_id']},
+    {'name': 'schools', 'schema': 'RAW', 'key': ['school_id']},
     {'name': 'immunization_schedule', 'schema': 'RAW'}
 ]
 SYNC_INTERVAL_SECONDS = 300 
+SYNC_MAX_WORKERS = int(os.getenv('SYNC_MAX_WORKERS', '4'))
+SYNC_BATCH_ROWS = int(os.getenv('SYNC_BATCH_ROWS', '50000'))
+# 'csv' (default) or 'parquet' (snappy-compressed, loaded with MATCH_BY_COLUMN_NAME)
+SYNC_STAGE_FORMAT = os.getenv('SYNC_STAGE_FORMAT', 'csv').lower()
+STAGE_FORMATS = ('csv', 'parquet')
 
 def get_postgres_conn():
     return psycopg2.connect(
@@ -43,125 +58,308 @@ def get_snowflake_conn():
         role=os.getenv('SNOWFLAKE_ROLE', 'ACCOUNTADMIN')
     )
 
-def sync_table(table_info):
+def iter_batches(pg_conn, query, params=None, batch_size=SYNC_BATCH_ROWS):
+    """
+    Streams a query through a server-side (named) cursor, yielding DataFrames of
+    at most batch_size rows so only one batch is ever held in memory.
+    """
+    cur = pg_conn.cursor(name=f"jali_sync_{uuid.uuid4().hex[:12]}")
+    cur.itersize = batch_size
+    try:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = [d[0] for d in cur.description]
+            # Same construction pd.read_sql_query uses, so dtypes match the old path
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    finally:
+        cur.close()
+
+def snowflake_type(series):
+    """Maps a pandas column to a Snowflake type, looking inside object columns."""
+    dtype = str(series.dtype)
+    if "int" in dtype: return "INT"
+    if "float" in dtype: return "FLOAT"
+    if "datetime" in dtype: return "TIMESTAMP_NTZ"
+    if dtype == "bool": return "BOOLEAN"
+    # psycopg2 returns DATE columns (and NULL-able ints) as Python objects
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred == "date": return "DATE"
+    if inferred in ("datetime", "datetime64"): return "TIMESTAMP_NTZ"
+    if inferred == "integer": return "INT"
+    if inferred == "boolean": return "BOOLEAN"
+    return "VARCHAR"
+
+def create_target_table(sf_cursor, target_schema, table_name, df):
+    print(f"   Table POSTGRES_{table_name.upper()} doesn't exist. Creating...")
+    # basic schema from dataframe
+    cols_sql = [f"{col.upper()} {snowflake_type(df[col])}" for col in df.columns]
+
+    sf_cursor.execute(f"""
+        CREATE TABLE {target_schema}.POSTGRES_{table_name.upper()} (
+            {', '.join(cols_sql)},
+            _SYNCED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """)
+
+def write_stage_file(df, path_base, stage_format='csv'):
+    """Writes one batch in the staging format and returns the file path."""
+    if stage_format == 'parquet':
+        path = f"{path_base}.parquet"
+        # Snowflake reads microsecond timestamps; Postgres never has finer precision
+        df.to_parquet(path, index=False, compression='snappy',
+                      coerce_timestamps='us', allow_truncated_timestamps=True)
+    else:
+        path = f"{path_base}.csv"
+        df.to_csv(path, index=False, header=False)
+    return path
+
+def copy_into_sql(target_table, stage_path, columns, stage_format='csv'):
+    if stage_format == 'parquet':
+        return f"""
+            COPY INTO {target_table}
+            FROM {stage_path}
+            FILE_FORMAT = (TYPE = 'PARQUET' USE_LOGICAL_TYPE = TRUE)
+            MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+        """
+    # Snowflake COPY INTO requires column list if the CSV doesn't have headers
+    col_list = ", ".join([c.upper() for c in columns])
+    return f"""
+            COPY INTO {target_table} ({col_list})
+            FROM {stage_path}
+            FILE_FORMAT = (TYPE = 'CSV' SKIP_HEADER = 0 FIELD_OPTIONALLY_ENCLOSED_BY = '\"')
+        """
+
+def sync_table(table_info, batch_size=None, stage_format=None, use_state=True):
+    """
+    Syncs a single table and returns a stats dict with the row count and wall time.
+    Rows are streamed from Postgres in batches of batch_size (SYNC_BATCH_ROWS by
+    default); each batch is masked and PUT as its own staged file (CSV or
+    Parquet, see SYNC_STAGE_FORMAT), and a single COPY loads all of them.
+
+    With use_state, the watermark and table metadata come from the local
+    SyncStateStore instead of Postgres/Snowflake metadata queries. If the
+    extracted columns no longer match the saved fingerprint, the state is
+    dropped and the table is re-synced through the metadata path.
+    """
+    state_store = SyncStateStore() if use_state else None
+    stats = _sync_table(table_info, batch_size, stage_format, state_store)
+    if stats['status'] == 'schema_changed':
+        print(f"   Columns of {table_info['name']} changed since the last sync. Re-checking metadata...")
+        state_store.reset(table_info['name'])
+        retry = _sync_table(table_info, batch_size, stage_format, state_store)
+        retry['seconds'] += stats['seconds']
+        stats = retry
+    return stats
+
+def _sync_table(table_info, batch_size, stage_format, state_store):
     table_name = table_info['name']
     target_schema = table_info['schema']
+    batch_size = batch_size or SYNC_BATCH_ROWS
+    stage_format = (stage_format or SYNC_STAGE_FORMAT).lower()
+    if stage_format not in STAGE_FORMATS:
+        raise ValueError(f"Unknown stage format '{stage_format}', expected one of {STAGE_FORMATS}")
     print(f"[{datetime.now()}] Syncing table: {table_name}...")
+    stats = {'table': table_name, 'rows': 0, 'bytes_staged': 0, 'seconds': 0.0, 'status': 'ok'}
+    start = time.perf_counter()
     
     try:
         sf_conn = get_snowflake_conn()
         pg_conn = get_postgres_conn()
         sf_cursor = sf_conn.cursor()
-        
-        # 1. Check if 'created_at' exists for incremental sync
-        cur = pg_conn.cursor()
-        cur.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table_name}' AND column_name = 'created_at'")
-        has_created_at = cur.fetchone() is not None
-        
-        # 2. Fetch data from Postgres
         pg_query = f"SELECT * FROM {table_name}"
-        sf_cursor.execute(f"SHOW TABLES LIKE 'POSTGRES_{table_name.upper()}' IN SCHEMA {target_schema}")
-        table_exists = sf_cursor.fetchone()
-        
+        state = state_store.get(table_name) if state_store else None
         last_sync = datetime(1900, 1, 1)
-        if table_exists and has_created_at:
-            sf_cursor.execute(f"SELECT MAX(created_at) FROM {target_schema}.POSTGRES_{table_name.upper()}")
-            res = sf_cursor.fetchone()[0]
-            if res: last_sync = res
+
+        if state:
+            # 1-2. Everything we need was recorded after the last successful COPY
+            has_created_at = state['has_created_at']
+            table_exists = True
+            if state['high_water_mark']: last_sync = state['high_water_mark']
+            print(f"   Using saved sync state (updated {state['updated_at']}).")
+        else:
+            # 1. Check if 'created_at' exists for incremental sync
+            cur = pg_conn.cursor()
+            cur.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table_name}' AND column_name = 'created_at'")
+            has_created_at = cur.fetchone() is not None
+            cur.close()
+
+            # 2. Work out what to fetch from Postgres
+            sf_cursor.execute(f"SHOW TABLES LIKE 'POSTGRES_{table_name.upper()}' IN SCHEMA {target_schema}")
+            table_exists = sf_cursor.fetchone()
+
+            if table_exists and has_created_at:
+                sf_cursor.execute(f"SELECT MAX(created_at) FROM {target_schema}.POSTGRES_{table_name.upper()}")
+                res = sf_cursor.fetchone()[0]
+                if res: last_sync = res
         
         if has_created_at:
             print(f"   Syncing incremental data since {last_sync}...")
-            df = pd.read_sql_query(f"{pg_query} WHERE created_at > %s", pg_conn, params=(last_sync,))
+            query, params = f"{pg_query} WHERE created_at > %s", (last_sync,)
         else:
             print(f"   No 'created_at' column found. Performing FULL sync for {table_name}...")
-            df = pd.read_sql_query(pg_query, pg_conn)
-        
-            if table_exists:
-                print(f"   Truncating existing table for full reload...")
-                sf_cursor.execute(f"TRUNCATE TABLE {target_schema}.POSTGRES_{table_name.upper()}")
-
-        # 3. De-identify sensitive data
-        def partial_mask_name(name):
-            if not pd.notna(name) or str(name).strip() == "":
-                return name
-            parts = str(name).split()
-            masked_parts = []
-            for part in parts:
-                if len(part) <= 2:
-                    masked_parts.append(part[0] + "*" * (len(part)-1) if len(part) > 1 else "*")
-                else:
-                    masked_parts.append(part[0] + "*" * (len(part)-2) + part[-1])
-            return " ".join(masked_parts)
-
-        def mask_generic(val):
-            if not pd.notna(val) or str(val).strip() == "":
-                return val
-            return "****"
-
-        name_cols = {'caregiver_name', 'ovc_name', 'chv_name'}
-        other_sensitive_cols = {'national_id', 'phone', 'birth_cert_no', 'ncpwd_no'}
-        
-        for col in df.columns:
-            col_lower = col.lower()
-            if col_lower in name_cols:
-                print(f"   Applying partial masking to name: {col}")
-                df[col] = df[col].apply(partial_mask_name)
-            elif col_lower in other_sensitive_cols:
-                print(f"   Applying full masking to: {col}")
-                df[col] = df[col].apply(mask_generic)
-
-        if df.empty:
+            query, params = pg_query, None
+
+        # 3. Stream, de-identify and stage each batch
+        stage_path = f"@RAW.JALI_CSV_STAGE/sync/{table_name}/"
+        sf_cursor.execute(f"REMOVE {stage_path}")
+        columns = None
+        high_water_mark = None
+        with tempfile.TemporaryDirectory(prefix=f"jali_{table_name}_") as tmp_dir:
+            for i, df in enumerate(iter_batches(pg_conn, query, params, batch_size)):
+                if (i == 0 and state and state['schema_fingerprint']
+                        and schema_fingerprint(df.columns) != state['schema_fingerprint']):
+                    stats['status'] = 'schema_changed'
+                    return stats
+
+                df = mask_dataframe(df, verbose=(i == 0))
+                if has_created_at and 'created_at' in df.columns:
+                    batch_max = pd.to_datetime(df['created_at']).max()
+                    if pd.notna(batch_max) and (high_water_mark is None or batch_max > high_water_mark):
+                        high_water_mark = batch_max
+
+                if columns is None:
+                    if not table_exists:
+                        create_target_table(sf_cursor, target_schema, table_name, df)
+                    columns = list(df.columns)
+
+                part_file = write_stage_file(df, os.path.join(tmp_dir, f"{table_name}_{i:05d}"), stage_format)
+                stats['bytes_staged'] += os.path.getsize(part_file)
+                abs_path = os.path.abspath(part_file).replace('\\', '/')
+                # Parquet is already compressed; gzipping it again only costs CPU
+                compress = 'FALSE' if stage_format == 'parquet' else 'TRUE'
+                sf_cursor.execute(f"PUT 'file://{abs_path}' {stage_path} OVERWRITE=TRUE AUTO_COMPRESS={compress}")
+                os.remove(part_file)
+
+                stats['rows'] += len(df)
+                print(f"   Staged batch {i + 1} ({stats['rows']} rows so far)")
+
+        if not has_created_at and table_exists:
+            print(f"   Truncating existing table for full reload...")
+            sf_cursor.execute(f"TRUNCATE TABLE {target_schema}.POSTGRES_{table_name.upper()}")
+
+        if stats['rows'] == 0:
             print(f"   No new records in {table_name}.")
-            return
-
-       
-        if not table_exists:
-            print(f"   Table POSTGRES_{table_name.upper()} doesn't exist. Creating...")
-            # basic schema from dataframe
-            cols_sql = []
-            for col, dtype in df.dtypes.items():
-                sf_type = "VARCHAR"
-                if "int" in str(dtype): sf_type = "INT"
-                elif "float" in str(dtype): sf_type = "FLOAT"
-                elif "datetime" in str(dtype): sf_type = "TIMESTAMP_NTZ"
-                cols_sql.append(f"{col.upper()} {sf_type}")
-            
-            sf_cursor.execute(f"""
-                CREATE TABLE {target_schema}.POSTGRES_{table_name.upper()} (
-                    {', '.join(cols_sql)},
-                    _SYNCED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
-                )
-            """)
-
-        # 3. Upload to Snowflake
-        print(f"   Found {len(df)} new records. Uploading...")
-        temp_file = f"temp_{table_name}.csv"
-        df.to_csv(temp_file, index=False, header=False)
-        
-        # Snowflake COPY INTO requires column list if the CSV doesn't have headers
-        col_list = ", ".join([c.upper() for c in df.columns])
-        
-        abs_path = os.path.abspath(temp_file).replace('\\', '/')
-        sf_cursor.execute(f"PUT 'file://{abs_path}' @RAW.JALI_CSV_STAGE/sync/{table_name}/ OVERWRITE=TRUE")
-        sf_cursor.execute(f"""
-            COPY INTO {target_schema}.POSTGRES_{table_name.upper()} ({col_list})
-            FROM @RAW.JALI_CSV_STAGE/sync/{table_name}/
-            FILE_FORMAT = (TYPE = 'CSV' SKIP_HEADER = 0 FIELD_OPTIONALLY_ENCLOSED_BY = '\"')
-        """)
-        print(f"   Success: {len(df)} records added to {table_name}.")
-        if os.path.exists(temp_file): os.remove(temp_file)
+        else:
+            # 4. Load every staged batch with one COPY
+            sf_cursor.execute(copy_into_sql(f"{target_schema}.POSTGRES_{table_name.upper()}",
+                                            stage_path, columns, stage_format))
+            print(f"   Success: {stats['rows']} records added to {table_name}.")
+
+        # 5. Remember where we got to, so the next run can skip the metadata queries
+        if state_store and (table_exists or columns is not None):
+            state_store.save(
+                table_name, has_created_at,
+                high_water_mark=high_water_mark.to_pydatetime() if high_water_mark is not None else None,
+                fingerprint=schema_fingerprint(columns) if columns is not None else None,
+                rows=stats['rows']
+            )
 
     except Exception as e:
         print(f"Error syncing {table_name}: {e}")
+        stats['status'] = 'error'
     finally:
         if 'sf_conn' in locals(): sf_conn.close()
         if 'pg_conn' in locals(): pg_conn.close()
+        stats['seconds'] = time.perf_counter() - start
+    return stats
+
+def _run_concurrent_sync(max_workers, batch_size=None, stage_format=None, use_state=True):
+    """
+    Runs sync_table over a bounded thread pool. A table is only submitted once
+    every table it depends on (that is also being synced) has finished. If one
+    of those did not sync, the table is not synced either and is reported as
+    'skipped', with the tables it was blocked by, and so are its own dependants.
+    """
+    names = {t['name'] for t in TABLES_TO_SYNC}
+    pending = {t['name']: t for t in TABLES_TO_SYNC}
+    finished = {}
+    results = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            progress = True
+            while progress:
+                progress = False
+                for name, table in list(pending.items()):
+                    deps = [d for d in table.get('depends_on', []) if d in names]
+                    if not all(d in finished for d in deps):
+                        continue
+                    del pending[name]
+                    blocked_by = [d for d in deps if finished[d] != 'ok']
+                    if blocked_by:
+                        print(f"Skipping {name}: {', '.join(blocked_by)} did not sync")
+                        finished[name] = 'skipped'
+                        results.append({'table': name, 'rows': 0, 'bytes_staged': 0, 'seconds': 0.0,
+                                        'status': 'skipped', 'blocked_by': blocked_by})
+                        # Its dependants may now be decided too
+                        progress = True
+                    else:
+                        running[pool.submit(sync_table, table, batch_size, stage_format, use_state)] = name
+
+            if not running:
+                if not pending:
+                    break
+                raise ValueError(f"Circular dependency between tables: {sorted(pending)}")
 
-def run_full_sync():
-    print(f"--- Jali Pipeline: Starting Full Sync ---")
-    for table in TABLES_TO_SYNC:
-        sync_table(table)
+            if not running:
+                raise ValueError(f"Circular dependency between tables: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                finished[running.pop(future)] = result['status']
+                results.append(result)
+    return results
+
+def _print_sync_summary(results, total_seconds):
+    print(f"\n{'TABLE':<25}{'ROWS':>10}{'STAGED MB':>11}{'SECONDS':>10}  STATUS")
+    for r in sorted(results, key=lambda r: r['seconds'], reverse=True):
+        status = f"{r['status']} (blocked by {', '.join(r['blocked_by'])})" if r.get('blocked_by') else r['status']
+        print(f"{r['table']:<25}{r['rows']:>10}{r['bytes_staged'] / 1e6:>11.2f}{r['seconds']:>10.2f}  {status}")
+    total_mb = sum(r['bytes_staged'] for r in results) / 1e6
+    print(f"{'TOTAL':<25}{sum(r['rows'] for r in results):>10}{total_mb:>11.2f}{total_seconds:>10.2f}")
+
+def run_full_sync(concurrent=False, max_workers=None, batch_size=None, stage_format=None, use_state=True):
+    mode = 'concurrent' if concurrent else 'sequential'
+    print(f"--- Jali Pipeline: Starting Full Sync ({mode}) ---")
+    start = time.perf_counter()
+    if concurrent:
+        results = _run_concurrent_sync(max_workers or SYNC_MAX_WORKERS, batch_size, stage_format, use_state)
+    else:
+        results = [sync_table(table, batch_size, stage_format, use_state) for table in TABLES_TO_SYNC]
+    _print_sync_summary(results, time.perf_counter() - start)
     print(f"--- Jali Pipeline: Sync Sequence Finished ---")
+    return results
 
 if __name__ == "__main__":
-    run_full_sync()
+    parser = argparse.ArgumentParser(description='Jali Postgres -> Snowflake sync')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='Sync independent tables in parallel, respecting FK order')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'Worker pool size for --concurrent (default: {SYNC_MAX_WORKERS})')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help=f'Rows per streamed batch / staged file (default: {SYNC_BATCH_ROWS})')
+    parser.add_argument('--stage-format', type=str, default=None, choices=STAGE_FORMATS,
+                        help=f'Staging file format (default: {SYNC_STAGE_FORMAT})')
+    parser.add_argument('--no-state', action='store_true',
+                        help='Ignore the local watermark store and query table metadata')
+    parser.add_argument('--show-state', action='store_true',
+                        help='Print the local watermark store and exit')
+    parser.add_argument('--reset-state', nargs='?', const='*', default=None, metavar='TABLE',
+                        help='Forget saved state for TABLE (or every table) and exit')
+
+    args = parser.parse_args()
+    if args.show_state or args.reset_state:
+        store = SyncStateStore()
+        if args.reset_state:
+            store.reset(None if args.reset_state == '*' else args.reset_state)
+            print(f"Reset sync state for {'all tables' if args.reset_state == '*' else args.reset_state}.")
+        store.print_summary()
+    else:
+        run_full_sync(concurrent=args.concurrent, max_workers=args.workers,
+                      batch_size=args.batch_size, stage_format=args.stage_format,
+                      use_state=not args.no_state)
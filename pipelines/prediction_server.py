@@ -0,0 +1,353 @@
+"""
+Online prediction service for the Jali pillar models.
+
+A small asyncio HTTP/1.1 server (standard library only) that keeps every
+pillar pipeline from models/artifacts/ loaded. Concurrent requests for the
+same model are micro-batched: they queue for at most PREDICT_MAX_WAIT_MS (or
+until PREDICT_MAX_BATCH rows are waiting) and are scored with a single
+predict_proba call, run off the event loop on one worker thread.
+
+    POST /predict/<model>   {"records": [{...}, ...]}  -> {"probabilities": [...]}
+    GET  /metrics           request counts, p50/p99 latency (ms), mean batch size
+    GET  /health            loaded models
+
+<model> is one of batch_scoring.SCORING_MODELS (tb, menstrual, hiv_qoc,
+hiv_adherence). PredictionClient talks to the server over a keep-alive
+connection; benchmarks/prediction_latency.py uses it to measure latency
+offline.
+
+    python pipelines/prediction_server.py [--port 8765]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Sibling scripts import by module name, also under python -m pipelines.prediction_server
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from batch_scoring import SCORING_MODELS
+from models.registry import load_model
+
+PREDICT_HOST = os.getenv('PREDICT_HOST', '127.0.0.1')
+PREDICT_PORT = int(os.getenv('PREDICT_PORT', '8765'))
+PREDICT_MAX_BATCH = int(os.getenv('PREDICT_MAX_BATCH', '256'))
+PREDICT_MAX_WAIT_MS = float(os.getenv('PREDICT_MAX_WAIT_MS', '2'))
+# Latencies kept per model for the percentiles
+METRICS_WINDOW = 10000
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+class LatencyStats:
+    """Rolling request latencies and batch sizes for one model."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_rows = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def summary(self):
+        lat = np.fromiter(self.latencies_ms, dtype=float)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'p50_ms': round(float(np.percentile(lat, 50)), 3) if len(lat) else None,
+            'p99_ms': round(float(np.percentile(lat, 99)), 3) if len(lat) else None,
+            'mean_batch_rows': round(float(np.mean(self.batch_rows)), 2) if self.batch_rows else None
+        }
+
+
+class MicroBatcher:
+    """
+    Collects pending requests for one model and scores them together.
+    Each request is (records, future); the future gets that request's slice
+    of the probabilities. If the batch fails, each request is re-scored on
+    its own, so a bad record only fails the request that sent it.
+    """
+
+    def __init__(self, model, executor, stats, max_batch=PREDICT_MAX_BATCH, max_wait_ms=PREDICT_MAX_WAIT_MS):
+        self.model = model
+        self.executor = executor
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def predict(self, records):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        rows = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while rows < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            records = [r for recs, _ in batch for r in recs]
+            try:
+                probs = await loop.run_in_executor(
+                    self.executor, self.model.predict_proba, pd.DataFrame.from_records(records))
+            except Exception:
+                results = await loop.run_in_executor(self.executor, self._score_each, batch)
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                continue
+            self.stats.batch_rows.append(len(records))
+            start = 0
+            for recs, future in batch:
+                if not future.done():
+                    future.set_result(probs[start:start + len(recs)].tolist())
+                start += len(recs)
+
+    def _score_each(self, batch):
+        """Probabilities (or the exception) of every request in a failed batch, scored alone."""
+        results = []
+        for records, _ in batch:
+            try:
+                results.append(self.model.predict_proba(pd.DataFrame.from_records(records)).tolist())
+            except Exception as e:
+                results.append(e)
+        self.stats.batch_rows.extend(len(records) for records, _ in batch)
+        return results
+
+
+class PredictionServer:
+    def __init__(self, model_names=None, host=PREDICT_HOST, port=PREDICT_PORT,
+                 max_batch=PREDICT_MAX_BATCH, max_wait_ms=PREDICT_MAX_WAIT_MS):
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.model_names = list(model_names or SCORING_MODELS)
+        # One scoring thread: XGBoost parallelises inside each predict call
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jali-predict')
+        self.models = {}
+        self.batchers = {}
+        self.stats = {}
+        self.server = None
+
+    def load_models(self):
+        start = time.perf_counter()
+        for name in self.model_names:
+            try:
+                self.models[name] = load_model(name)
+            except FileNotFoundError:
+                print(f"   Warning: no artifact for '{name}', it will not be served.")
+        if not self.models:
+            raise RuntimeError("No model artifacts found. Run pipelines/snowflake_ml_pipeline.py first.")
+        print(f"Loaded {len(self.models)} models in {time.perf_counter() - start:.2f}s")
+
+    def warm_up(self):
+        """One tiny prediction per model so the first real request is not the slow one."""
+        for model in self.models.values():
+            model.predict_proba(pd.DataFrame([{c: None for c in model.feature_cols}]))
+
+    async def start(self):
+        self.load_models()
+        self.warm_up()
+        for name, model in self.models.items():
+            self.stats[name] = LatencyStats()
+            self.batchers[name] = MicroBatcher(model, self.executor, self.stats[name],
+                                               self.max_batch, self.max_wait_ms)
+            self.batchers[name].start()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Serving {', '.join(self.models)} on http://{self.host}:{self.port}")
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            batcher.task.cancel()
+        self.executor.shutdown(wait=False)
+
+    def metrics(self):
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_http_message(reader, request=True)
+                except ValueError as e:
+                    # The body cannot be framed, so the connection cannot be reused
+                    writer.write(http_response(400, {'error': str(e)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', 'models': list(self.models)}
+        if method == 'GET' and path == '/metrics':
+            return 200, self.metrics()
+        if method == 'POST' and path.startswith('/predict/'):
+            return await self._predict(path[len('/predict/'):], body)
+        return 404, {'error': f'No route for {method} {path}'}
+
+    async def _predict(self, name, body):
+        if name not in self.batchers:
+            return 404, {'error': f"Model '{name}' is not loaded"}
+        start = time.perf_counter()
+        stats = self.stats[name]
+        stats.requests += 1
+        try:
+            data = json.loads(body or b'{}')
+            records = data.get('records') if isinstance(data, dict) and 'records' in data else [data]
+            if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                raise ValueError("Expected {'records': [{...}, ...]} or a single record object")
+        except ValueError as e:
+            stats.errors += 1
+            return 400, {'error': str(e)}
+        if not records:
+            return 200, {'model': name, 'probabilities': []}
+        try:
+            probs = await self.batchers[name].predict(records)
+        except Exception as e:
+            stats.errors += 1
+            return 500, {'error': str(e)}
+        stats.latencies_ms.append((time.perf_counter() - start) * 1000)
+        return 200, {'model': name, 'probabilities': probs}
+
+
+async def read_http_message(reader, request=True):
+    """
+    Reads one HTTP/1.1 message. Returns (method, path, headers, body) for a
+    request or (status, headers, body) for a response; None at end of stream.
+    Raises ValueError for a malformed start line or Content-Length.
+    """
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+    parts = start_line.decode('latin-1').split()
+    if len(parts) < (3 if request else 2) or (not request and not parts[1].isdigit()):
+        raise ValueError(f"Malformed start line: {start_line[:100]!r}")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    length = headers.get('content-length', '0')
+    if not length.isdigit():
+        raise ValueError(f"Invalid Content-Length: {length[:100]!r}")
+    body = await reader.readexactly(int(length))
+    if request:
+        return parts[0].upper(), parts[1], headers, body
+    return int(parts[1]), headers, body
+
+
+def http_response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+class PredictionClient:
+    """Keep-alive asyncio client for PredictionServer."""
+
+    def __init__(self, host=PREDICT_HOST, port=PREDICT_PORT):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return self
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Type: application/json\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+        await self.writer.drain()
+        status, _, body = await read_http_message(self.reader, request=False)
+        data = json.loads(body)
+        if status != 200:
+            raise RuntimeError(f"{status}: {data.get('error')}")
+        return data
+
+    async def predict(self, model, records):
+        data = await self.request('POST', f'/predict/{model}', {'records': records})
+        return data['probabilities']
+
+    async def metrics(self):
+        return await self.request('GET', '/metrics')
+
+
+async def serve(host=PREDICT_HOST, port=PREDICT_PORT, model_names=None):
+    server = PredictionServer(model_names, host, port)
+    await server.start()
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Jali online prediction server')
+    parser.add_argument('--host', type=str, default=PREDICT_HOST)
+    parser.add_argument('--port', type=int, default=PREDICT_PORT)
+    parser.add_argument('--models', type=str, default=None,
+                        help=f"Comma-separated models to serve (default: {','.join(SCORING_MODELS)})")
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.models.split(',') if args.models else None))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,514 @@
+"""
+On-disk retrieval index over the chunks produced by rag_ingest.py, for the
+chat assistant (jali-app FloatingChatButton) and the web-agent notebook.
+
+Layout of RAG_INDEX_DIR:
+
+    embeddings.f32   row-major float32 (rows x dim), L2-normalised
+    embeddings.i8    the same rows quantised to int8, scale per row in scales.f32
+    chunks.jsonl     one chunk record per row (chunk_id, doc_id, source, page, text)
+    ivf.npz          k-means centroids and the list of every row
+    manifest.json    embedder, dim, row count, removed rows; written last
+    compact/         a compaction in progress (see VectorIndex.compact)
+
+The matrices are plain binary files opened with np.memmap, so a query only
+pages in the rows it touches and appending new documents is a write at the
+end of each file. manifest.json is replaced atomically after the data files
+are written, and only its row count is trusted, so an interrupted append
+leaves the index as it was (stray tail bytes are truncated by the next one).
+
+Dense search is IVF: the query is compared with sqrt(rows) k-means centroids and
+only the rows of the RAG_NPROBE nearest lists are scanned, on the int8 copy;
+the best candidates are re-scored exactly from the float32 rows. Below
+IVF_MIN_ROWS, or before the centroids exist, every row is scanned. Rows
+appended after training are assigned to their nearest centroid; the
+centroids are retrained once the index has grown IVF_RETRAIN_GROWTH times.
+BM25 runs over an in-memory inverted index of the live rows, built from
+chunks.jsonl on first use, and search() fuses both rankings with reciprocal
+rank fusion. Removed rows stay on disk until they are more than
+COMPACT_FRACTION of the index, when sync() rewrites it without them.
+
+Embeddings come from any object with `name`, `dim` and `encode(texts)`
+returning L2-normalised float32 rows. HashingEmbedder is a deterministic,
+dependency-free stand-in (signed feature hashing of words and word pairs);
+set RAG_EMBEDDER=sentence-transformers:<model> to use a local
+sentence-transformers model instead. An index only accepts the embedder it
+was built with.
+
+    python pipelines/rag_index.py build [--rebuild]
+    python pipelines/rag_index.py query "when is the measles vaccine due" [--k 5] [--mode hybrid]
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Importable as pipelines.rag_index too (e.g. from the web-agent notebook)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rag_ingest import ingest, project_root
+
+RAG_INDEX_DIR = os.getenv('RAG_INDEX_DIR', os.path.join(project_root, 'pipelines', '.rag_index'))
+RAG_EMBEDDER = os.getenv('RAG_EMBEDDER', 'hashing')
+HASHING_DIM = int(os.getenv('RAG_HASHING_DIM', '384'))
+IVF_MIN_ROWS = int(os.getenv('RAG_IVF_MIN_ROWS', '2000'))
+RAG_NPROBE = int(os.getenv('RAG_NPROBE', '16'))
+IVF_RETRAIN_GROWTH = 2.0
+COMPACT_FRACTION = 0.25
+# Dense candidates re-scored in float32, per requested result
+RERANK_FACTOR = 4
+BM25_K1, BM25_B = 1.2, 0.75
+RRF_K = 60
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+_FILES = ('embeddings.f32', 'embeddings.i8', 'scales.f32', 'chunks.jsonl')
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word pairs: deterministic, no model files."""
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _features(self, text):
+        words = tokenize(text)
+        return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+    def encode(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in Counter(self._features(text)).items():
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+                # Sublinear term frequency, as in tf-idf
+                out[row, h % self.dim] += (1 if h >> 63 else -1) * (1 + math.log(count))
+        return _normalise(out)
+
+
+class SentenceTransformerEmbedder:
+    """A local sentence-transformers model (pip install sentence-transformers)."""
+
+    def __init__(self, model_name):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("RAG_EMBEDDER=sentence-transformers:<model> needs: pip install sentence-transformers")
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f'sentence-transformers:{model_name}'
+
+    def encode(self, texts):
+        return self.model.encode(list(texts), batch_size=64, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+def get_embedder(spec=None):
+    """Embedder from a spec: 'hashing', 'hashing-<dim>' or 'sentence-transformers:<model>'."""
+    spec = spec or RAG_EMBEDDER
+    if spec.startswith('sentence-transformers:'):
+        return SentenceTransformerEmbedder(spec.split(':', 1)[1])
+    if spec == 'hashing':
+        return HashingEmbedder()
+    if spec.startswith('hashing-'):
+        return HashingEmbedder(int(spec.split('-', 1)[1]))
+    raise ValueError(f"Unknown embedder '{spec}'")
+
+
+def _normalise(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1)
+
+
+def quantize(x):
+    """int8 codes and per-row scales with x ~= codes * scale."""
+    scales = np.abs(x).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(x / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class BM25:
+    """Okapi BM25 over an inverted index of term -> (rows, term counts)."""
+
+    def __init__(self):
+        self.postings = defaultdict(lambda: ([], []))
+        self.lengths = []
+        self._frozen = None
+
+    def add(self, texts):
+        for text in texts:
+            row = len(self.lengths)
+            counts = Counter(tokenize(text))
+            for term, count in counts.items():
+                rows, tfs = self.postings[term]
+                rows.append(row)
+                tfs.append(count)
+            self.lengths.append(sum(counts.values()))
+        self._frozen = None
+
+    def _arrays(self, term):
+        """Postings of a term as arrays, converted once after each add()."""
+        if self._frozen is None:
+            self._frozen = {}
+            lengths = np.asarray(self.lengths, dtype=np.float32)
+            self._norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1))
+        if term not in self._frozen:
+            rows, tfs = self.postings[term]
+            self._frozen[term] = (np.asarray(rows, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+        return self._frozen[term]
+
+    def scores(self, query):
+        """Sparse scores: (rows, scores) of the rows matching any query term."""
+        n = len(self.lengths)
+        terms = [t for t in set(tokenize(query)) if t in self.postings]
+        if not terms:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows, weights = [], []
+        for term in terms:
+            r, tfs = self._arrays(term)
+            idf = math.log(1 + (n - len(r) + 0.5) / (len(r) + 0.5))
+            rows.append(r)
+            weights.append(idf * tfs * (BM25_K1 + 1) / (tfs + self._norm[r]))
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        return matched, np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+
+
+class VectorIndex:
+    def __init__(self, root=RAG_INDEX_DIR, embedder=None):
+        self.root = root
+        self.embedder = embedder or get_embedder()
+        self._finish_compaction()
+        self.manifest = self._read_manifest() or {
+            'embedder': self.embedder.name, 'dim': self.embedder.dim, 'rows': 0,
+            'removed': [], 'ivf_rows': 0
+        }
+        if self.manifest['embedder'] != self.embedder.name:
+            raise ValueError(f"Index at {root} was built with {self.manifest['embedder']}, "
+                             f"not {self.embedder.name}; rebuild it or use that embedder")
+        self.dim = self.manifest['dim']
+        self._open()
+
+    def __len__(self):
+        return self.manifest['rows'] - len(self.manifest['removed'])
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path('manifest.json')) as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def _map(self, name, dtype, width):
+        rows = self.manifest['rows']
+        if not rows:
+            return np.zeros((0, width) if width else 0, dtype=dtype)
+        shape = (rows, width) if width else (rows,)
+        return np.memmap(self._path(name), dtype=dtype, mode='r', shape=shape)
+
+    def _open(self):
+        """(Re)maps the matrices and loads chunk records for the committed rows."""
+        self.vectors = self._map('embeddings.f32', np.float32, self.dim)
+        self.codes = self._map('embeddings.i8', np.int8, self.dim)
+        self.scales = self._map('scales.f32', np.float32, None)
+        self.chunks = []
+        if self.manifest['rows']:
+            with open(self._path('chunks.jsonl')) as f:
+                for line, _ in zip(f, range(self.manifest['rows'])):
+                    self.chunks.append(json.loads(line))
+        self.ids = {c['chunk_id']: row for row, c in enumerate(self.chunks)}
+        self.removed = np.zeros(self.manifest['rows'], dtype=bool)
+        self.removed[self.manifest['removed']] = True
+        self._bm25 = None
+        self.centroids, self.lists = None, None
+        if self.manifest['ivf_rows'] and os.path.exists(self._path('ivf.npz')):
+            with np.load(self._path('ivf.npz')) as ivf:
+                self.centroids = ivf['centroids']
+                self._set_lists(ivf['assign'][:self.manifest['rows']])
+
+    def _set_lists(self, assign):
+        self.assign = assign
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def _write_manifest(self):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self._path('manifest.json'))
+
+    def _append_bytes(self, name, data, committed):
+        """Writes data after the first `committed` bytes of a file, dropping any uncommitted tail."""
+        with open(self._path(name), 'ab') as f:
+            f.truncate(committed)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, chunks, batch_size=256):
+        """
+        Embeds and appends chunks not already indexed (by chunk_id); removed
+        rows whose chunk_id comes back (e.g. a reverted edit) are made live
+        again instead. Returns the number of rows added or restored.
+        """
+        restored = sorted({self.ids[c['chunk_id']] for c in chunks
+                           if c['chunk_id'] in self.ids and self.removed[self.ids[c['chunk_id']]]})
+        if restored:
+            self.manifest['removed'] = sorted(set(self.manifest['removed']) - set(restored))
+            self.removed[restored] = False
+            self._bm25 = None
+        new = [c for c in chunks if c['chunk_id'] not in self.ids]
+        new = list({c['chunk_id']: c for c in new}.values())
+        if not new:
+            if restored:
+                self._write_manifest()
+            return len(restored)
+        os.makedirs(self.root, exist_ok=True)
+        vectors = np.concatenate([
+            np.asarray(self.embedder.encode([c['text'] for c in new[i:i + batch_size]]), dtype=np.float32)
+            for i in range(0, len(new), batch_size)])
+        codes, scales = quantize(vectors)
+
+        rows = self.manifest['rows']
+        if rows:
+            # Byte length of chunks.jsonl up to the committed rows
+            with open(self._path('chunks.jsonl'), 'rb') as f:
+                text_bytes = sum(len(line) for line, _ in zip(f, range(rows)))
+        else:
+            text_bytes = 0
+        records = ''.join(json.dumps({k: c.get(k) for k in ('chunk_id', 'doc_id', 'source', 'page', 'text')}) + '\n'
+                          for c in new)
+        self._append_bytes('embeddings.f32', vectors.tobytes(), rows * self.dim * 4)
+        self._append_bytes('embeddings.i8', codes.tobytes(), rows * self.dim)
+        self._append_bytes('scales.f32', scales.tobytes(), rows * 4)
+        self._append_bytes('chunks.jsonl', records.encode(), text_bytes)
+
+        total = rows + len(new)
+        if total >= IVF_MIN_ROWS and total >= IVF_RETRAIN_GROWTH * self.manifest['ivf_rows']:
+            self.manifest['rows'] = total
+            self._open()
+            self.train_ivf()
+        else:
+            if self.centroids is not None:
+                assign = np.concatenate([self.assign, self._nearest(vectors)])
+                np.savez(self._path('ivf.npz'), centroids=self.centroids, assign=assign)
+            self.manifest['rows'] = total
+        self._write_manifest()
+        self._open()
+        return len(new) + len(restored)
+
+    def _nearest(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def train_ivf(self, nlist=None, iterations=10, seed=0):
+        """Spherical k-means over the float32 rows; sqrt(rows) lists by default."""
+        rows = self.manifest['rows']
+        nlist = nlist or max(1, int(math.sqrt(rows)))
+        rng = np.random.default_rng(seed)
+        sample = self.vectors[np.sort(rng.choice(rows, min(rows, 256 * nlist), replace=False))]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for k in range(nlist):
+                members = sample[assign == k]
+                # An empty list keeps its centroid
+                if len(members):
+                    centroids[k] = members.sum(axis=0)
+            centroids = _normalise(centroids)
+        self.centroids = centroids.astype(np.float32)
+        assign = np.concatenate([self._nearest(np.asarray(self.vectors[i:i + 65536]))
+                                 for i in range(0, rows, 65536)])
+        np.savez(self._path('ivf.npz'), centroids=self.centroids, assign=assign)
+        self.manifest['ivf_rows'] = rows
+        self._set_lists(assign)
+
+    def remove(self, doc_ids):
+        """Drops every row of the given documents from results (rows stay on disk)."""
+        doc_ids = set(doc_ids)
+        return self._remove_rows([row for row, c in enumerate(self.chunks) if c['doc_id'] in doc_ids])
+
+    def _remove_rows(self, rows):
+        rows = [row for row in rows if not self.removed[row]]
+        if rows:
+            self.manifest['removed'] = sorted(set(self.manifest['removed']) | set(rows))
+            self.removed[rows] = True
+            self._bm25 = None
+            self._write_manifest()
+        return len(rows)
+
+    def sync(self, chunks):
+        """
+        Makes the index match an ingest() run: appends new chunks and removes
+        rows whose chunk is gone (deleted documents, or documents re-chunked
+        with other settings). Compacts the index once more than
+        COMPACT_FRACTION of its rows are removed.
+        """
+        current = {c['chunk_id'] for c in chunks}
+        removed = self._remove_rows([row for row, c in enumerate(self.chunks) if c['chunk_id'] not in current])
+        added = self.append(chunks)
+        if len(self.manifest['removed']) > COMPACT_FRACTION * self.manifest['rows']:
+            self.compact()
+        return added, removed
+
+    def compact(self):
+        """
+        Rewrites the index without its removed rows, keeping the IVF
+        centroids. The new files and manifest are written to compact/ first
+        and then moved over the old ones; an interrupted move is finished by
+        the next VectorIndex opened on the directory. Returns the rows dropped.
+        """
+        dropped = len(self.manifest['removed'])
+        if not dropped:
+            return 0
+        live = np.flatnonzero(~self.removed)
+        staging = self._path('compact')
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, matrix in (('embeddings.f32', self.vectors), ('embeddings.i8', self.codes),
+                             ('scales.f32', self.scales)):
+            with open(os.path.join(staging, name), 'wb') as f:
+                for i in range(0, len(live), 65536):
+                    f.write(np.ascontiguousarray(matrix[live[i:i + 65536]]).tobytes())
+        with open(os.path.join(staging, 'chunks.jsonl'), 'w') as f:
+            f.writelines(json.dumps(self.chunks[row]) + '\n' for row in live)
+        manifest = dict(self.manifest, rows=len(live), removed=[])
+        if self.centroids is not None:
+            np.savez(os.path.join(staging, 'ivf.npz'), centroids=self.centroids, assign=self.assign[live])
+            manifest['ivf_rows'] = int(np.count_nonzero(~self.removed[:self.manifest['ivf_rows']]))
+        # manifest.json in compact/ marks the new files as complete
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        self._finish_compaction()
+        self.manifest = self._read_manifest()
+        self._open()
+        return dropped
+
+    def _finish_compaction(self):
+        """Moves a complete compaction over the index; discards an incomplete one."""
+        staging = self._path('compact')
+        if not os.path.isdir(staging):
+            return
+        if os.path.exists(os.path.join(staging, 'manifest.json')):
+            # Data files first, manifest last; files already moved are skipped
+            for name in _FILES + ('ivf.npz', 'manifest.json'):
+                if os.path.exists(os.path.join(staging, name)):
+                    os.replace(os.path.join(staging, name), self._path(name))
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def dense(self, query_vector, k=10, nprobe=None, exact=False):
+        """(rows, cosine scores) of the k nearest rows with a positive score, best first."""
+        if not self.manifest['rows']:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        q = np.asarray(query_vector, dtype=np.float32).ravel()
+        if not q.any():
+            # Nothing to compare (e.g. a query of punctuation only)
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if exact or self.centroids is None:
+            candidates = None
+            scores = np.asarray(self.vectors @ q)
+        else:
+            probe = np.argsort(-(self.centroids @ q))[:nprobe or RAG_NPROBE]
+            candidates = np.sort(np.concatenate([self.lists[p] for p in probe]))
+            candidates = candidates[~self.removed[candidates]]
+            # Approximate scores from the int8 rows, then exact ones for the best few
+            approx = (np.asarray(self.codes[candidates], dtype=np.float32) @ q) * self.scales[candidates]
+            keep = min(len(candidates), k * RERANK_FACTOR)
+            candidates = candidates[np.argpartition(-approx, keep - 1)[:keep]] if keep else candidates[:0]
+            candidates = np.sort(candidates)
+            scores = np.asarray(self.vectors[candidates]) @ q
+        if candidates is None:
+            scores = np.where(self.removed, -np.inf, scores)
+            candidates = np.arange(len(scores))
+        # Removed rows (-inf) and rows sharing nothing with the query are not hits
+        keep = scores > 0
+        candidates, scores = candidates[keep], scores[keep]
+        top = np.argsort(-scores, kind='stable')[:k]
+        return candidates[top], scores[top]
+
+    def bm25(self, query, k=10):
+        if self._bm25 is None:
+            # Removed rows would skew idf and the average length; BM25 row i is index row _bm25_rows[i]
+            self._bm25_rows = np.flatnonzero(~self.removed)
+            self._bm25 = BM25()
+            self._bm25.add(self.chunks[row]['text'] for row in self._bm25_rows)
+        rows, scores = self._bm25.scores(query)
+        rows = self._bm25_rows[rows]
+        top = np.argsort(-scores, kind='stable')[:k]
+        return rows[top], scores[top]
+
+    def search(self, query, k=5, mode='hybrid', nprobe=None, exact=False):
+        """
+        Top-k chunk records for a query, each with a 'score'. mode: 'dense',
+        'bm25' or 'hybrid' (reciprocal rank fusion of both, over 4k candidates each).
+        """
+        if mode == 'bm25':
+            rows, scores = self.bm25(query, k)
+        else:
+            depth = k if mode == 'dense' else 4 * k
+            rows, scores = self.dense(self.embedder.encode([query])[0], depth, nprobe, exact)
+            if mode == 'hybrid':
+                fused = defaultdict(float)
+                for ranked in (rows, self.bm25(query, depth)[0]):
+                    for rank, row in enumerate(ranked.tolist()):
+                        fused[row] += 1 / (RRF_K + rank + 1)
+                best = sorted(fused.items(), key=lambda kv: -kv[1])[:k]
+                rows, scores = [r for r, _ in best], [s for _, s in best]
+            rows, scores = rows[:k], scores[:k]
+        return [dict(self.chunks[int(r)], score=round(float(s), 6)) for r, s in zip(rows, scores)]
+
+
+def build(rebuild=False, root=RAG_INDEX_DIR, embedder=None):
+    """Ingests the RAG corpus and brings the index up to date with it."""
+    if rebuild:
+        for name in _FILES + ('ivf.npz', 'manifest.json'):
+            if os.path.exists(os.path.join(root, name)):
+                os.remove(os.path.join(root, name))
+    chunks, report = ingest()
+    index = VectorIndex(root, embedder)
+    started = time.perf_counter()
+    added, removed = index.sync(chunks)
+    return index, report, added, removed, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local retrieval index over the RAG corpus')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build', help='Ingest the corpus and append new chunks to the index')
+    build_cmd.add_argument('--rebuild', action='store_true', help='Start from an empty index')
+    query_cmd = sub.add_parser('query', help='Search the index')
+    query_cmd.add_argument('text')
+    query_cmd.add_argument('--k', type=int, default=5)
+    query_cmd.add_argument('--mode', choices=['hybrid', 'dense', 'bm25'], default='hybrid')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        index, report, added, removed, seconds = build(args.rebuild)
+        for row in report['documents']:
+            if row['status'].startswith('failed'):
+                print(f"{row['source']}: {row['status']}")
+        print(f"{report['pages']} pages, {report['chunks']} chunks ingested in {report['seconds']:.2f}s; "
+              f"{added} rows appended, {removed} removed in {seconds:.2f}s; {len(index)} rows live, "
+              f"IVF {'with ' + str(len(index.centroids)) + ' lists' if index.centroids is not None else 'not trained'}")
+    else:
+        index = VectorIndex()
+        started = time.perf_counter()
+        hits = index.search(args.text, args.k, args.mode)
+        print(f"{len(hits)} results in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for hit in hits:
+            print(f"{hit['score']:.4f}  {hit['source']} p.{hit['page']}: {hit['text'][:160]!r}")
@@ -0,0 +1,351 @@
+"""
+Ingestion of the RAG corpus: the PDFs and DOCX files under "RAG data" plus
+the KEPI schedule PDF at the repo root, turned into text chunks for retrieval.
+
+Text is extracted in a process pool. Large PDFs are split into page ranges
+of PAGES_PER_TASK so one long handbook does not keep a single worker busy
+while the others idle. PDFs need PyMuPDF (pip install pymupdf, several times
+faster) or pypdf (pip install pypdf); neither is needed for DOCX, which is
+read straight from its XML with the standard library, split at explicit
+page breaks. Without either library, PDFs are reported as failed and
+everything else is still ingested.
+
+Every document is cached under RAG_CACHE_DIR by the sha256 of its bytes,
+with its chunks and the settings that produced them (extractor, chunk size
+and overlap), so a re-run only extracts new or changed files, or files whose
+settings changed (renaming or moving a file costs nothing). Chunk IDs are
+derived from the document hash, those settings, the page and the character
+offset, so unchanged documents keep their IDs across runs.
+
+    python pipelines/rag_ingest.py [--workers 4] [--force] [paths ...]
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import zipfile
+import argparse
+import tempfile
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SOURCES = [
+    os.path.join(project_root, 'RAG data'),
+    os.path.join(project_root, 'KEPI-VACCINE-SCHEDULE-FROM-LIMURU-COTTAGE-HOSPITAL.pdf')
+]
+RAG_CACHE_DIR = os.getenv('RAG_CACHE_DIR', os.path.join(project_root, 'pipelines', '.rag_cache'))
+CHUNK_CHARS = int(os.getenv('RAG_CHUNK_CHARS', '1200'))
+CHUNK_OVERLAP = int(os.getenv('RAG_CHUNK_OVERLAP', '200'))
+PAGES_PER_TASK = int(os.getenv('RAG_PAGES_PER_TASK', '50'))
+SUPPORTED = ('.pdf', '.docx')
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def discover(paths):
+    """Supported files under the given files/folders, in a stable order."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, files in os.walk(path):
+                found += [os.path.join(folder, f) for f in files
+                          if f.lower().endswith(SUPPORTED) and not f.startswith(('.', '~$'))]
+        elif path.lower().endswith(SUPPORTED) and os.path.exists(path):
+            found.append(path)
+    return sorted(set(found))
+
+
+def _pdf_backend():
+    try:
+        import pymupdf
+        return 'pymupdf'
+    except ImportError:
+        try:
+            import fitz
+            return 'fitz'
+        except ImportError:
+            pass
+    try:
+        import pypdf
+        return 'pypdf'
+    except ImportError:
+        raise ImportError("PDF extraction needs PyMuPDF or pypdf: pip install pymupdf (or pypdf)")
+
+
+def pdf_page_count(path):
+    backend = _pdf_backend()
+    if backend == 'pypdf':
+        import pypdf
+        return len(pypdf.PdfReader(path).pages)
+    import importlib
+    with importlib.import_module(backend).open(path) as doc:
+        return doc.page_count
+
+
+def extract_pdf_pages(path, start, stop):
+    """[(page number from 1, text)] of pages start..stop-1."""
+    backend = _pdf_backend()
+    if backend == 'pypdf':
+        import pypdf
+        reader = pypdf.PdfReader(path)
+        return [(i + 1, reader.pages[i].extract_text() or '') for i in range(start, stop)]
+    import importlib
+    with importlib.import_module(backend).open(path) as doc:
+        return [(i + 1, doc[i].get_text()) for i in range(start, stop)]
+
+
+def extraction_settings(path):
+    """What the chunks of a file depend on besides its bytes; part of its cache entry and chunk IDs."""
+    if path.lower().endswith('.pdf'):
+        backend = _pdf_backend()
+        extractor = 'pymupdf' if backend == 'fitz' else backend
+    else:
+        extractor = 'docx-xml'
+    return {'extractor': extractor, 'chunk_chars': CHUNK_CHARS, 'chunk_overlap': CHUNK_OVERLAP}
+
+
+def extract_docx_pages(path):
+    """[(page, text)] of a DOCX, split at explicit and last-rendered page breaks."""
+    with zipfile.ZipFile(path) as z:
+        root = ElementTree.fromstring(z.read('word/document.xml'))
+    pages, paragraphs, words = [], [], []
+    for node in root.iter():
+        if node.tag == f'{_W}t' and node.text:
+            words.append(node.text)
+        elif node.tag == f'{_W}tab':
+            words.append('\t')
+        elif (node.tag == f'{_W}br' and node.get(f'{_W}type') == 'page') or node.tag == f'{_W}lastRenderedPageBreak':
+            paragraphs.append(''.join(words))
+            words = []
+            pages.append('\n'.join(paragraphs))
+            paragraphs = []
+        elif node.tag == f'{_W}p':
+            # Paragraph elements open before their text; close the previous one
+            if words:
+                paragraphs.append(''.join(words))
+            words = []
+    paragraphs.append(''.join(words))
+    pages.append('\n'.join(paragraphs))
+    return [(i + 1, text) for i, text in enumerate(pages) if text.strip()]
+
+
+def _extract_task(task):
+    """
+    Worker entry point: (path, start, stop) for a PDF page range, (path, None,
+    None) for a DOCX. Returns (task, pages, seconds, error): a file that
+    cannot be read fails its own task only, with error describing why.
+    """
+    path, start, stop = task
+    started = time.perf_counter()
+    try:
+        if path.lower().endswith('.pdf'):
+            pages = extract_pdf_pages(path, start, stop)
+        else:
+            pages = extract_docx_pages(path)
+        return task, pages, time.perf_counter() - started, None
+    except Exception as e:
+        return task, [], time.perf_counter() - started, _describe(e)
+
+
+def chunk_pages(doc_id, pages, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP, extractor=''):
+    """
+    Overlapping chunks of about `size` characters per page, cut at the last
+    whitespace before the limit. IDs: hash of document, extractor, size,
+    overlap, page and offset.
+    """
+    chunks = []
+    version = f"{doc_id}:{extractor}:{size}:{overlap}"
+    for page, text in pages:
+        text = re.sub(r'[ \t]+', ' ', re.sub(r'\s*\n\s*', '\n', text)).strip()
+        start = 0
+        while start < len(text):
+            end = min(start + size, len(text))
+            if end < len(text):
+                cut = max(text.rfind(' ', start + size // 2, end), text.rfind('\n', start + size // 2, end))
+                end = cut if cut > start else end
+            piece = text[start:end].strip()
+            if piece:
+                chunk_id = hashlib.sha1(f"{version}:{page}:{start}".encode()).hexdigest()[:16]
+                chunks.append({'chunk_id': chunk_id, 'doc_id': doc_id, 'page': page, 'start': start, 'text': piece})
+            if end >= len(text):
+                break
+            start = max(end - overlap, start + 1)
+    return chunks
+
+
+class ChunkCache:
+    """
+    Extracted chunks per document hash, as <RAG_CACHE_DIR>/<hash>.json. An
+    entry only counts for the settings it was extracted with.
+    """
+
+    def __init__(self, root=RAG_CACHE_DIR):
+        self.root = root
+
+    def path(self, doc_id):
+        return os.path.join(self.root, f'{doc_id}.json')
+
+    def get(self, doc_id, settings):
+        try:
+            with open(self.path(doc_id)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('settings') == settings else None
+
+    def put(self, doc_id, entry):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.path(doc_id))
+
+    def prune(self, keep):
+        """Removes cached documents whose hash is not in keep."""
+        if not os.path.isdir(self.root):
+            return 0
+        stale = [f for f in os.listdir(self.root) if f.endswith('.json') and f[:-5] not in keep]
+        for f in stale:
+            os.remove(os.path.join(self.root, f))
+        return len(stale)
+
+
+def ingest(paths=None, workers=None, force=False, cache=None, prune=None):
+    """
+    Extracts and chunks every supported document under paths (default: the
+    RAG corpus), reusing cached chunks for unchanged files. Returns
+    (chunks, report) where report has per-document rows and totals.
+    prune drops cached documents that were not seen; by default only a run
+    over the whole corpus prunes, so ingesting a few files keeps the rest.
+
+    A file that cannot be read (corrupt, encrypted, no PDF library) is
+    reported as failed and the rest of the run goes on; files with the same
+    bytes as an earlier one are reported as duplicates and contribute no
+    chunks of their own, since their chunk IDs would be the same.
+    """
+    prune = paths is None if prune is None else prune
+    cache = cache or ChunkCache()
+    started = time.perf_counter()
+    files = discover(paths or DEFAULT_SOURCES)
+    hashes = {path: file_hash(path) for path in files}
+
+    entries, failed, duplicates, tasks, first_path = {}, {}, {}, [], {}
+    for path in files:
+        doc_id = hashes[path]
+        if doc_id in first_path:
+            duplicates[path] = first_path[doc_id]
+            continue
+        first_path[doc_id] = path
+        try:
+            settings = extraction_settings(path)
+            entry = None if force else cache.get(doc_id, settings)
+            if entry is not None:
+                entries[path] = dict(entry, cached=True)
+            elif path.lower().endswith('.pdf'):
+                pages = pdf_page_count(path)
+                tasks += [(path, s, min(s + PAGES_PER_TASK, pages)) for s in range(0, pages, PAGES_PER_TASK)]
+                if not pages:
+                    entries[path] = _new_entry(cache, doc_id, settings, [], 0.0)
+            else:
+                tasks.append((path, None, None))
+        except Exception as e:
+            failed[path] = _describe(e)
+
+    extracted, cpu_seconds = {}, {}
+    if tasks:
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Biggest ranges first keeps the tail short
+            ordered = sorted(tasks, key=lambda t: -((t[2] or 0) - (t[1] or 0)))
+            for (path, _, _), pages, seconds, error in pool.map(_extract_task, ordered):
+                cpu_seconds[path] = cpu_seconds.get(path, 0.0) + seconds
+                if error is not None:
+                    failed.setdefault(path, error)
+                else:
+                    extracted.setdefault(path, []).extend(pages)
+
+    # A document is cached only when every one of its page ranges was read
+    for path, pages in extracted.items():
+        if path in failed:
+            continue
+        pages.sort()
+        entries[path] = _new_entry(cache, hashes[path], extraction_settings(path), pages, cpu_seconds[path])
+
+    chunks, rows = [], []
+    for path in files:
+        source = os.path.relpath(path, project_root)
+        if path in entries:
+            entry = entries[path]
+            chunks += [dict(c, source=source) for c in entry['chunks']]
+            rows.append({'source': source, 'pages': entry['pages'], 'chunks': len(entry['chunks']),
+                         'seconds': entry['extract_seconds'], 'cached': entry['cached'],
+                         'status': 'cache' if entry['cached'] else 'extracted'})
+        else:
+            status = (f"duplicate of {os.path.relpath(duplicates[path], project_root)}" if path in duplicates
+                      else f"failed: {failed[path]}")
+            rows.append({'source': source, 'pages': 0, 'chunks': 0, 'seconds': round(cpu_seconds.get(path, 0.0), 3),
+                         'cached': False, 'status': status})
+    if prune:
+        cache.prune(set(hashes.values()))
+
+    wall = time.perf_counter() - started
+    new_pages = sum(r['pages'] for r in rows if r['status'] == 'extracted')
+    report = {
+        'documents': rows,
+        'extracted_documents': sum(r['status'] == 'extracted' for r in rows),
+        'cached_documents': sum(r['status'] == 'cache' for r in rows),
+        'failed_documents': len(failed),
+        'duplicate_documents': len(duplicates),
+        'pages': sum(r['pages'] for r in rows),
+        'extracted_pages': new_pages,
+        'chunks': len(chunks),
+        'seconds': wall,
+        'pages_per_second': new_pages / wall if new_pages else None
+    }
+    return chunks, report
+
+
+def _new_entry(cache, doc_id, settings, pages, seconds):
+    entry = {'doc_id': doc_id, 'settings': settings, 'pages': len(pages), 'extract_seconds': round(seconds, 3),
+             'chunks': chunk_pages(doc_id, pages, settings['chunk_chars'], settings['chunk_overlap'],
+                                   settings['extractor'])}
+    cache.put(doc_id, entry)
+    return dict(entry, cached=False)
+
+
+def _describe(error):
+    return f"{type(error).__name__}: {error}"
+
+
+def print_report(report):
+    print(f"{'DOCUMENT':<60}{'PAGES':>7}{'CHUNKS':>8}{'SECONDS':>9}  SOURCE")
+    for r in report['documents']:
+        name = r['source'] if len(r['source']) <= 58 else r['source'][:55] + '...'
+        print(f"{name:<60}{r['pages']:>7}{r['chunks']:>8}{r['seconds']:>9.2f}  {r['status']}")
+    rate = report['pages_per_second']
+    print(f"{report['extracted_documents']} extracted, {report['cached_documents']} cached, "
+          f"{report['failed_documents']} failed, {report['duplicate_documents']} duplicates; "
+          f"{report['pages']} pages, {report['chunks']} chunks in {report['seconds']:.2f}s"
+          + (f" ({rate:.1f} pages/sec extracted)" if rate else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract and chunk the RAG corpus')
+    parser.add_argument('paths', nargs='*', help='Files or folders (default: RAG data + KEPI schedule PDF)')
+    parser.add_argument('--workers', type=int, default=None, help='Extraction processes (default: one per core)')
+    parser.add_argument('--force', action='store_true', help='Ignore the chunk cache and re-extract everything')
+
+    args = parser.parse_args()
+    _, report = ingest(args.paths or None, workers=args.workers, force=args.force)
+    print_report(report)
@@ -1,5 +1,7 @@
 import os
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import snowflake.connector
 from dotenv import load_dotenv
@@ -16,6 +18,9 @@ from models import (
     HIVAdherenceModel
 )
 from models.immunization_tracker import ImmunizationTracker
+from models.immunization_engine import ImmunizationEngine
+from models.visit_queue import VisitQueue, score_defaulters
+from models.feature_cache import FeatureCache
 
 
 load_dotenv()
@@ -58,83 +63,219 @@ def fetch_data(source_type, dataset_name):
         finally:
             conn.close()
 
-def run_pipeline(source='local', models_to_run='all'):
-    print(f"==================================================")
-    print(f"JALI ML PILLARS - Source: {source.upper()}")
-    print(f"==================================================")
+# How models are trained; run_pipeline overrides these from its arguments
+DEFAULT_OPTIONS = {'n_jobs': None, 'tune': False, 'use_cache': True, 'encoding': None, 'incremental': False,
+                   'as_of': None}
 
-    # Definitive 4 Pillars
-    # 1. HIV Adherence (Processes both Adherence and QoC datasets)
-    if models_to_run in ['all', 'hiv']:
-        print(f"\n[PILLAR 1] HIV ADHERENCE")
-        models = [HIVAdherenceModel(), HIVQocModel()]
-        datasets = ['hiv_adherence', 'hiv_qoc']
-        for model, ds in zip(models, datasets):
-            try:
-                df = fetch_data(source, ds)
-                model.train(df)
-                model.save()
-                print(f"   Done: {model.model_name} processed.")
-            except Exception as e:
-                print(f"   Error in HIV step ({ds}): {e}")
-
-    # 2. TB Adherence
-    if models_to_run in ['all', 'tb']:
-        print(f"\n[PILLAR 2] TB ADHERENCE")
-        try:
-            model = TBAdherenceModel()
-            df = fetch_data(source, 'tb')
-            model.train(df)
+def train_and_save(model, source, dataset, options=None):
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    model.n_jobs = options['n_jobs']
+    model.use_cache = model.use_cache and options['use_cache']
+    if options['encoding']:
+        model.categorical_encoding = options['encoding']
+    df = fetch_data(source, dataset)
+    if options['tune']:
+        model.tune(df)
+    elif model.use_tuned_params():
+        # The last tune()'s params carry over to runs without --tune (and keep incremental runs incremental)
+        print(f"   Using the parameters saved by the last --tune run.")
+    if options['incremental']:
+        if model.train_incremental(df)['mode'] != 'unchanged':
             model.save()
-            print(f"   Done: TB Adherence Model processed.")
-        except Exception as e:
-            print(f"   Error in TB step: {e}")
+        return
+    result = model.train(df)
+    if result['from_cache'] and model.saved_metadata().get('cache_key') == model.metadata['cache_key']:
+        print(f"   Unchanged since the saved artifact; not saving a new version.")
+        return
+    model.save()
 
-    # 3. Immunization Tracker
-    if models_to_run in ['all', 'immunization']:
-        print(f"\n[PILLAR 3] IMMUNIZATION TRACKER")
+def run_hiv_pillar(source, options=None):
+    # 1. HIV Adherence (Processes both Adherence and QoC datasets)
+    models = [HIVAdherenceModel(), HIVQocModel()]
+    datasets = ['hiv_adherence', 'hiv_qoc']
+    ok = True
+    for model, ds in zip(models, datasets):
         try:
-            if source == 'snowflake':
-                print("   Fetching updated schedule from Snowflake...")
-                conn = get_snowflake_conn()
-                schedule_df = pd.read_sql_query("SELECT * FROM RAW.POSTGRES_IMMUNIZATION_SCHEDULE", conn)
-                conn.close()
-            else:
-                print("   Reading local schedule...")
-                schedule_df = pd.read_csv(os.path.join(project_root, 'immunization_schedule.csv'))
-            
-            tracker = ImmunizationTracker(schedule_df)
-            
-            if source == 'snowflake':
-                print("   Processing OVC immunization records...")
-                conn = get_snowflake_conn()
-                ovc_query = """
-                    SELECT c.ovc_id, o.ovc_name, o.dob, c.immunization_status 
-                    FROM RAW.POSTGRES_OVC_CASES c
-                    JOIN RAW.POSTGRES_OVCS o ON c.ovc_id = o.ovc_id
-                    LIMIT 10
-                """
-                ovc_df = pd.read_sql_query(ovc_query, conn)
-                conn.close()
-                results = tracker.batch_process_ovc(ovc_df)
-                print("\nSample Immunization Schedule Results:")
-                print(results)
-            else:
-                print("   Immunization tracker ready. (Skipping batch process in local mode)")
+            train_and_save(model, source, ds, options)
+            print(f"   Done: {model.model_name} processed.")
         except Exception as e:
-            print(f"   Error in Immunization step: {e}")
+            print(f"   Error in HIV step ({ds}): {e}")
+            ok = False
+    return ok
 
-    # 4. Menstrual Tracking
-    if models_to_run in ['all', 'menstrual']:
-        print(f"\n[PILLAR 4] MENSTRUAL TRACKING")
-        try:
-            model = MenstrualTrackingModel()
-            df = fetch_data(source, 'menstrual')
-            model.train(df)
-            model.save()
-            print(f"   Done: Menstrual Tracking Model processed.")
-        except Exception as e:
-            print(f"   Error in Menstrual step: {e}")
+def run_tb_pillar(source, options=None):
+    try:
+        train_and_save(TBAdherenceModel(), source, 'tb', options)
+        print(f"   Done: TB Adherence Model processed.")
+        return True
+    except Exception as e:
+        print(f"   Error in TB step: {e}")
+        return False
+
+def run_immunization_pillar(source, options=None):
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    try:
+        if source == 'snowflake':
+            print("   Fetching updated schedule from Snowflake...")
+            conn = get_snowflake_conn()
+            schedule_df = pd.read_sql_query("SELECT * FROM RAW.POSTGRES_IMMUNIZATION_SCHEDULE", conn)
+            conn.close()
+        else:
+            print("   Reading local schedule...")
+            schedule_df = pd.read_csv(os.path.join(project_root, 'immunization_schedule.csv'))
+        
+        tracker = ImmunizationTracker(schedule_df)
+        
+        if source == 'snowflake':
+            print("   Processing OVC immunization records...")
+            conn = get_snowflake_conn()
+            ovc_query = """
+                SELECT c.ovc_id, o.ovc_name, o.dob, c.immunization_status 
+                FROM RAW.POSTGRES_OVC_CASES c
+                JOIN RAW.POSTGRES_OVCS o ON c.ovc_id = o.ovc_id
+            """
+            ovc_df = pd.read_sql_query(ovc_query, conn)
+            conn.close()
+            start = time.perf_counter()
+            results = tracker.batch_process_ovc(ovc_df, as_of=options['as_of'])
+            print(f"   Scheduled {len(results)} OVCs in {time.perf_counter() - start:.2f}s "
+                  f"(as of {options['as_of'] or 'today'}).")
+            print("\nSample Immunization Schedule Results:")
+            print(results.head(10))
+            update_dose_history(tracker, options['as_of'])
+        else:
+            print("   Immunization tracker ready. (Skipping batch process in local mode)")
+        return True
+    except Exception as e:
+        print(f"   Error in Immunization step: {e}")
+        return False
+
+def update_dose_history(tracker, as_of=None):
+    """Folds the immunization events synced since the last run into the saved dose-history status."""
+    print("   Updating dose-history status from immunization events...")
+    engine = ImmunizationEngine(tracker)
+    resumed = engine.load()
+    events_query = """
+        SELECT ovc_id, immunization_status, date_of_event, created_at
+        FROM RAW.POSTGRES_OVC_CASES
+        WHERE immunization_status IS NOT NULL
+    """
+    params = None
+    if resumed and engine.watermark is not None:
+        events_query += " AND created_at > %s"
+        params = (engine.watermark.to_pydatetime(),)
+    conn = get_snowflake_conn()
+    try:
+        ovcs = pd.read_sql_query("""
+            SELECT o.ovc_id, o.dob, h.chv_id
+            FROM RAW.POSTGRES_OVCS o
+            LEFT JOIN RAW.POSTGRES_HOUSEHOLDS h ON o.household_id = h.household_id
+        """, conn)
+        events = pd.read_sql_query(events_query, conn, params=params)
+    finally:
+        conn.close()
+
+    start = time.perf_counter()
+    changed = engine.update(events, ovcs, as_of=as_of)
+    engine.save()
+    print(f"   {len(events)} new events; recomputed {len(changed)} of {len(engine.status)} children "
+          f"in {time.perf_counter() - start:.2f}s.")
+    print(engine.status['status_flag'].value_counts().to_string())
+    build_visit_queue(engine, ovcs, changed, rebuild=not resumed)
+    return engine
+
+def build_visit_queue(engine, ovcs, changed=None, rebuild=False, top=10):
+    """
+    Brings the saved per-CHV visit queues up to date: only the children the
+    engine just recomputed (changed) and those who moved to another CHV are
+    rescored, and children whose schedule is now complete drop out. The queue
+    is rebuilt from the whole caseload when there is none, rebuild is set
+    (the engine state was rebuilt) or the as-of date moved.
+    """
+    cols = {c.upper(): c for c in ovcs.columns}
+    chv_of = pd.Series(ovcs[cols['CHV_ID']].to_numpy(), index=pd.Index(ovcs[cols['OVC_ID']].to_numpy(dtype=object)))
+    chv_of = chv_of[~chv_of.index.duplicated()]
+    start = time.perf_counter()
+    queue = VisitQueue()
+    if rebuild or changed is None or not queue.load() or queue.as_of != engine.as_of:
+        queue = VisitQueue().build(score_defaulters(engine.status, engine.as_of), chv_of)
+        mode = 'rebuilt'
+    else:
+        ids = changed.index.append(queue.chv_moves(chv_of)).unique()
+        rescored = engine.status.loc[ids]
+        scores = score_defaulters(rescored, engine.as_of)
+        removed = rescored.index[rescored['next_due_date'].isna()]
+        queue.update(scores, chv_of, removed=removed)
+        mode = f'updated ({len(scores)} rescored, {len(removed)} complete)'
+    queue.as_of = engine.as_of
+    queue.save()
+    print(f"   Visit queues {mode}: {len(queue)} children across {len(queue.heaps)} CHVs "
+          f"in {time.perf_counter() - start:.2f}s.")
+    print(f"\nTop {top} visits county-wide:")
+    for chv, ovc_id, priority in queue.top_overall(top):
+        print(f"   CHV {chv:<12} OVC {ovc_id:<15} priority {priority:.3f}  "
+              f"next {engine.status.at[ovc_id, 'next_vaccine']}")
+    return queue
+
+def run_menstrual_pillar(source, options=None):
+    try:
+        train_and_save(MenstrualTrackingModel(), source, 'menstrual', options)
+        print(f"   Done: Menstrual Tracking Model processed.")
+        return True
+    except Exception as e:
+        print(f"   Error in Menstrual step: {e}")
+        return False
+
+# Definitive 4 Pillars, in run order: key -> (title, runner)
+PILLARS = {
+    'hiv': ("[PILLAR 1] HIV ADHERENCE", run_hiv_pillar),
+    'tb': ("[PILLAR 2] TB ADHERENCE", run_tb_pillar),
+    'immunization': ("[PILLAR 3] IMMUNIZATION TRACKER", run_immunization_pillar),
+    'menstrual': ("[PILLAR 4] MENSTRUAL TRACKING", run_menstrual_pillar)
+}
+
+def run_pillar(pillar, source, options=None):
+    """Runs one pillar and returns its timing: {pillar, seconds, status}."""
+    title, runner = PILLARS[pillar]
+    print(f"\n{title}")
+    start = time.perf_counter()
+    ok = runner(source, options)
+    return {'pillar': pillar, 'seconds': time.perf_counter() - start, 'status': 'ok' if ok else 'error'}
+
+def _print_pillar_summary(results, total_seconds, mode):
+    print(f"\n{'PILLAR':<15}{'SECONDS':>10}  STATUS")
+    for r in results:
+        print(f"{r['pillar']:<15}{r['seconds']:>10.2f}  {r['status']}")
+    serial = sum(r['seconds'] for r in results)
+    print(f"{'TOTAL':<15}{total_seconds:>10.2f}  ({mode}; pillars sum to {serial:.2f}s)")
+
+def run_pipeline(source='local', models_to_run='all', parallel=False, workers=None, tune=False,
+                 use_cache=True, encoding=None, incremental=False, as_of=None):
+    print(f"==================================================")
+    print(f"JALI ML PILLARS - Source: {source.upper()}")
+    print(f"==================================================")
+
+    pillars = [p for p in PILLARS if models_to_run in ['all', p]]
+    options = dict(DEFAULT_OPTIONS, tune=tune, use_cache=use_cache, encoding=encoding, incremental=incremental,
+                   as_of=as_of)
+    start = time.perf_counter()
+    if parallel and len(pillars) > 1:
+        # Split the cores between the pillars so concurrent xgboost fits do not oversubscribe
+        cpus = os.cpu_count() or 1
+        workers = min(workers or cpus, len(pillars))
+        n_jobs = max(1, cpus // workers)
+        mode = f"{workers} processes x {n_jobs} threads"
+        print(f"Training pillars in parallel: {mode}")
+        options['n_jobs'] = n_jobs
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {p: pool.submit(run_pillar, p, source, options) for p in pillars}
+            results = [futures[p].result() for p in pillars]
+    else:
+        mode = "sequential"
+        results = [run_pillar(p, source, options) for p in pillars]
+
+    _print_pillar_summary(results, time.perf_counter() - start, mode)
+    return results
 
 
 if __name__ == "__main__":
@@ -143,6 +284,27 @@ if __name__ == "__main__":
                         help='Data source: local CSV or Snowflake table')
     parser.add_argument('--models', type=str, default='all', 
                         help='Pillar to run: all, hiv, tb, immunization, or menstrual')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Train the pillars concurrently in a process pool, sharing the CPU cores')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processes for --parallel (default: one per pillar, at most one per core)')
+    parser.add_argument('--tune', action='store_true',
+                        help='Search XGBoost parameters (successive halving) before training each model')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore the feature cache and preprocess/train from scratch')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Empty the feature cache before running')
+    parser.add_argument('--encoding', type=str, default=None, choices=['onehot', 'native'],
+                        help='Categorical encoding: one-hot, or XGBoost native categoricals (hist)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Continue boosting the saved models on rows newer than their training '
+                             'watermark; retrain fully on drift or schema change')
+    parser.add_argument('--as-of', type=str, default=None,
+                        help='Reference date (YYYY-MM-DD) for the immunization schedule (default: today)')
     
     args = parser.parse_args()
-    run_pipeline(source=args.source, models_to_run=args.models)
+    if args.clear_cache:
+        FeatureCache().clear()
+    run_pipeline(source=args.source, models_to_run=args.models, parallel=args.parallel, workers=args.workers,
+                 tune=args.tune, use_cache=not args.no_cache, encoding=args.encoding,
+                 incremental=args.incremental, as_of=args.as_of)
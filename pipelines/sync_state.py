@@ -0,0 +1,101 @@
+import os
+import json
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+
+# Local, file-backed state for postgres_to_snowflake_sync: one row per table with
+# its created_at high-water mark and a fingerprint of the extracted columns.
+SYNC_STATE_PATH = os.getenv(
+    'SYNC_STATE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.sync_state.db')
+)
+
+
+def schema_fingerprint(columns):
+    """Stable short hash of the ordered column names of an extracted table."""
+    payload = json.dumps([str(c).lower() for c in columns])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class SyncStateStore:
+    def __init__(self, path=SYNC_STATE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    table_name TEXT PRIMARY KEY,
+                    has_created_at INTEGER NOT NULL,
+                    high_water_mark TEXT,
+                    schema_fingerprint TEXT,
+                    rows_synced INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # A fresh connection per call keeps the store safe to use from sync worker threads;
+        # sqlite3's own context manager only commits or rolls back, so close it here too
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, table_name):
+        """Returns the saved state for a table, or None if it has never synced."""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM sync_state WHERE table_name = ?", (table_name,)).fetchone()
+        if row is None:
+            return None
+        state = dict(row)
+        state['has_created_at'] = bool(state['has_created_at'])
+        if state['high_water_mark']:
+            state['high_water_mark'] = datetime.fromisoformat(state['high_water_mark'])
+        return state
+
+    def save(self, table_name, has_created_at, high_water_mark=None, fingerprint=None, rows=0):
+        """Records a successful COPY. A None watermark/fingerprint keeps the previous value."""
+        hwm = high_water_mark.isoformat() if high_water_mark is not None else None
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO sync_state (table_name, has_created_at, high_water_mark,
+                                        schema_fingerprint, rows_synced, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (table_name) DO UPDATE SET
+                    has_created_at = excluded.has_created_at,
+                    high_water_mark = COALESCE(excluded.high_water_mark, sync_state.high_water_mark),
+                    schema_fingerprint = COALESCE(excluded.schema_fingerprint, sync_state.schema_fingerprint),
+                    rows_synced = sync_state.rows_synced + excluded.rows_synced,
+                    updated_at = excluded.updated_at
+            """, (table_name, int(has_created_at), hwm, fingerprint, rows, datetime.now().isoformat()))
+
+    def reset(self, table_name=None):
+        """Forgets one table (or every table), forcing a metadata lookup on the next sync."""
+        with self._connect() as conn:
+            if table_name:
+                conn.execute("DELETE FROM sync_state WHERE table_name = ?", (table_name,))
+            else:
+                conn.execute("DELETE FROM sync_state")
+
+    def all(self):
+        with self._connect() as conn:
+            names = [r[0] for r in conn.execute("SELECT table_name FROM sync_state ORDER BY table_name")]
+        return [self.get(name) for name in names]
+
+    def print_summary(self):
+        states = self.all()
+        print(f"Sync state: {self.path}")
+        if not states:
+            print("   (empty)")
+            return
+        print(f"{'TABLE':<25}{'MODE':<13}{'HIGH WATER MARK':<28}{'FINGERPRINT':<18}{'ROWS':>10}  UPDATED")
+        for s in states:
+            mode = 'incremental' if s['has_created_at'] else 'full'
+            hwm = str(s['high_water_mark'] or '-')
+            print(f"{s['table_name']:<25}{mode:<13}{hwm:<28}{s['schema_fingerprint'] or '-':<18}"
+                  f"{s['rows_synced']:>10}  {s['updated_at']}")
@@ -1,9 +1,17 @@
 import pandas as pd
+import numpy as np
 import psycopg2
 from psycopg2 import sql
 import os
+import io
+import hashlib
 import math
+import time
+import re
+import argparse
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from psycopg2.pool import ThreadedConnectionPool
 
 # Database Configuration
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -29,6 +37,52 @@ def clean_date(val):
     except:
         return None
 
+def _is_text_column(series):
+    return pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty')
+
+def _null_like(series):
+    """Cells clean_value/clean_date turn into NULL: NaN, 'nan' (any case) or blank."""
+    text = series.astype(str).astype(object)
+    return series.isna().to_numpy() | (text.str.lower() == 'nan').to_numpy() | (text.str.strip() == '').to_numpy()
+
+def clean_column(series):
+    """Column-wise clean_value: same output, one vectorized pass per column."""
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype=object, copy=True)
+        values[series.isna().to_numpy()] = None
+        return values
+    if not _is_text_column(series):
+        # Mixed Python objects (ints among strings etc.) keep the scalar rules
+        return np.array([clean_value(v) for v in series], dtype=object)
+    null = _null_like(series)
+    values = series.astype(object).str.strip().to_numpy(dtype=object, copy=True)
+    values[null] = None
+    return values
+
+def clean_date_column(series):
+    """
+    Column-wise clean_date. ISO dates are parsed in one vectorized call; any
+    value that does not fit ISO 8601 is re-parsed per element with
+    format='mixed', which is what the scalar pd.to_datetime call does.
+    """
+    if not _is_text_column(series):
+        return np.array([clean_date(v) for v in series], dtype=object)
+    null = _null_like(series)
+    text = series.astype(object).where(~null, None)
+    try:
+        parsed = pd.to_datetime(text, format='ISO8601', errors='coerce')
+        values = np.array(parsed.dt.date, dtype=object)
+        values[parsed.isna().to_numpy()] = None
+        retry = parsed.isna().to_numpy() & ~null
+        if retry.any():
+            reparsed = pd.to_datetime(text[retry], format='mixed', errors='coerce')
+            values[retry] = np.array(reparsed.dt.date, dtype=object)
+            values[np.flatnonzero(retry)[reparsed.isna().to_numpy()]] = None
+    except ValueError:
+        # Mixed UTC offsets cannot share one datetime64 column; parse per value
+        return np.array([clean_date(v) for v in series], dtype=object)
+    return values
+
 def ensure_database():
     """Connects to default 'postgres' db to ensure 'jali_oltp' exists"""
     try:
@@ -60,7 +114,257 @@ def ensure_database():
         print(f"Warning: Could not check/create database: {e}")
         return False
 
-def migrate():
+# Tables in load order. 'columns' maps target column -> CSV column, 'dates'
+# lists target columns parsed with clean_date, 'dedupe' is the CSV column that
+# identifies a row (None = every row is loaded) and 'conflict' the primary key
+# used for ON CONFLICT DO NOTHING.
+LOAD_PLAN = [
+    {'table': 'cbos', 'label': 'organizations', 'dedupe': 'cbo_id', 'conflict': 'cbo_id',
+     'columns': {'cbo_id': 'cbo_id', 'cbo_name': 'cbo'}},
+    {'table': 'chvs', 'label': 'CHVs/CHWs', 'dedupe': 'chv_id', 'conflict': 'chv_id',
+     'columns': {'chv_id': 'chv_id', 'chv_name': 'chv_names'}},
+    {'table': 'households', 'label': 'Households & Locations', 'dedupe': 'household', 'conflict': 'household_id',
+     'columns': {
+         'household_id': 'household', 'chv_id': 'chv_id', 'cbo_id': 'cbo_id',
+         'ward_id': 'ward_id', 'ward_name': 'ward',
+         'constituency_id': 'consituency_id', 'constituency_name': 'constituency',
+         'county_id': 'countyid', 'county_name': 'county'}},
+    {'table': 'caregivers', 'label': 'Caregivers', 'dedupe': 'caregiver_id', 'conflict': 'caregiver_id',
+     'dates': ['dob'],
+     'columns': {
+         'caregiver_id': 'caregiver_id', 'household_id': 'household',
+         'caregiver_name': 'caregiver_names', 'national_id': 'caregiver_nationalid',
+         'phone': 'phone', 'gender': 'caregiver_gender', 'dob': 'caregiver_dob',
+         'hiv_status': 'caregiverhivstatus', 'caregiver_type': 'caregiver_type',
+         'father_alive': 'father_alive', 'mother_alive': 'mother_alive'}},
+    {'table': 'ovcs', 'label': 'OVCs', 'dedupe': 'ovc_id', 'conflict': 'ovc_id',
+     'dates': ['dob'],
+     'columns': {
+         'ovc_id': 'ovc_id', 'household_id': 'household', 'ovc_name': 'ovc_names',
+         'gender': 'gender', 'dob': 'dob', 'birth_cert_no': 'bcertnumber',
+         'ncpwd_no': 'ncpwdnumber', 'disability_status': 'ovcdisability',
+         'hiv_status': 'ovchivstatus'}},
+    {'table': 'facilities', 'label': 'Facilities', 'dedupe': 'facility_id', 'conflict': 'facility_id',
+     'columns': {'facility_id': 'facility_id', 'facility_name': 'facility', 'mfl_code': 'facility_mfl_code'}},
+    {'table': 'schools', 'label': 'Schools', 'dedupe': 'school_id', 'conflict': 'school_id',
+     'columns': {'school_id': 'school_id', 'school_name': 'school_name', 'school_level': 'schoollevel'}},
+    {'table': 'ovc_cases', 'label': 'Process Tracking Events', 'dedupe': None, 'conflict': None,
+     'dates': ['date_of_event', 'date_of_linkage', 'registration_date', 'exit_date'],
+     'columns': {
+         'ovc_id': 'ovc_id', 'caregiver_id': 'caregiver_id', 'chv_id': 'chv_id',
+         'facility_id': 'facility_id', 'school_id': 'school_id',
+         'date_of_event': 'date_of_event', 'date_of_linkage': 'date_of_linkage',
+         'registration_date': 'registration_date', 'exit_date': 'exit_date',
+         'art_status': 'artstatus', 'ccc_number': 'ccc_number',
+         'duration_on_art': 'duration_on_art', 'viral_load': 'viral_load',
+         'suppression_status': 'suppression', 'immunization_status': 'immunization',
+         'eligibility': 'eligibility', 'exit_status': 'exit_status',
+         'exit_reason': 'exit_reason'}},
+]
+
+PROGRESS_EVERY = 2000
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "50000"))
+# Rows of the CSV read, loaded and committed together. Bounds memory and is
+# the unit a failed run resumes from.
+CHUNK_ROWS = int(os.getenv("MIGRATE_CHUNK_ROWS", "100000"))
+MIGRATE_WORKERS = int(os.getenv("MIGRATE_WORKERS", "4"))
+
+CHECKPOINT_DDL = """
+    CREATE TABLE IF NOT EXISTS migration_checkpoints (
+        file_hash VARCHAR(64) PRIMARY KEY,
+        source_file TEXT,
+        chunk_rows INT NOT NULL,
+        last_chunk INT NOT NULL,
+        rows_loaded BIGINT NOT NULL,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+def table_frame(df, spec):
+    """The CSV columns feeding one table, deduplicated on its natural key."""
+    frame = df[list(spec['columns'].values())]
+    if spec['dedupe']:
+        frame = frame.dropna(subset=[spec['dedupe']]).drop_duplicates(spec['dedupe'])
+    return frame
+
+def clean_frame(frame, spec):
+    """
+    Cleans every column of a table in one pass per column and returns a frame
+    named after the target columns, holding Python objects ready for the DB.
+    """
+    dates = set(spec.get('dates', []))
+    columns = {}
+    for target, source in spec['columns'].items():
+        clean = clean_date_column if target in dates else clean_column
+        columns[target] = clean(frame[source])
+    return pd.DataFrame(columns, index=frame.index, dtype=object)
+
+def insert_sql(spec):
+    cols = list(spec['columns'])
+    conflict = f" ON CONFLICT ({spec['conflict']}) DO NOTHING" if spec['conflict'] else ""
+    return (f"INSERT INTO {spec['table']} ({', '.join(cols)}) "
+            f"VALUES ({', '.join(['%s'] * len(cols))}){conflict}")
+
+def load_table_rows(cur, spec, frame):
+    """Row-by-row INSERTs. Returns rows inserted; the caller commits."""
+    query = insert_sql(spec)
+    processed, inserted = 0, 0
+    for row in clean_frame(frame, spec).itertuples(index=False, name=None):
+        cur.execute(query, row)
+        inserted += cur.rowcount
+        processed += 1
+        if processed % PROGRESS_EVERY == 0:
+            print(f"Progress: {processed} rows loaded...")
+    return inserted
+
+def bulk_load_table(cur, spec, frame):
+    """
+    Streams the table through COPY FROM STDIN into a temporary staging table,
+    then moves it into place with one INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+    Returns the number of rows inserted; the caller commits.
+    """
+    table = spec['table']
+    cols = ', '.join(spec['columns'])
+    stage = f"_stage_{table}"
+    cur.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA")
+
+    for start in range(0, len(frame), BULK_CHUNK_ROWS):
+        chunk = clean_frame(frame.iloc[start:start + BULK_CHUNK_ROWS], spec)
+        buf = io.StringIO()
+        chunk.to_csv(buf, header=False, index=False)
+        buf.seek(0)
+        cur.copy_expert(f"COPY {stage} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+
+    conflict = f" ON CONFLICT ({spec['conflict']}) DO NOTHING" if spec['conflict'] else ""
+    cur.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage}{conflict}")
+    return cur.rowcount
+
+def split_schema(schema):
+    """
+    Splits schema.sql into (table statements, CREATE INDEX statements) so the
+    indexes can be built once, after the data is in, instead of being
+    maintained row by row during the load.
+    """
+    text = "\n".join(line for line in schema.splitlines() if not line.strip().startswith('--'))
+    statements = [stmt.strip() for stmt in text.split(';') if stmt.strip()]
+    indexes = [stmt for stmt in statements if re.match(r'CREATE\s+(UNIQUE\s+)?INDEX', stmt, re.I)]
+    tables = [stmt for stmt in statements if stmt not in indexes]
+    return tables, indexes
+
+def fk_dependencies(schema):
+    """{table: set of tables its FOREIGN KEYs reference}, read from schema.sql."""
+    deps = {}
+    pattern = r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*?)\n\);'
+    for table, body in re.findall(pattern, schema, re.I | re.S):
+        deps[table.lower()] = {ref.lower() for ref in re.findall(r'REFERENCES\s+(\w+)', body, re.I)} - {table.lower()}
+    return deps
+
+def create_indexes(conn, cur, statements):
+    print(f"Building {len(statements)} deferred indexes...")
+    start = time.perf_counter()
+    for stmt in statements:
+        cur.execute(stmt)
+    conn.commit()
+    print(f"Indexes built in {time.perf_counter() - start:.2f}s.")
+
+def load_table(cur, spec, frame, bulk):
+    return bulk_load_table(cur, spec, frame) if bulk else load_table_rows(cur, spec, frame)
+
+def _load_pooled(pool, spec, frame, bulk):
+    """Loads one table on its own pooled connection and commits it there."""
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            count = load_table(cur, spec, frame, bulk)
+        conn.commit()
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    return fn(*args), time.perf_counter() - start
+
+def load_chunk(cur, df, bulk, report, pool=None, deps=None):
+    """
+    Loads every LOAD_PLAN table for one chunk. Without a pool the tables run
+    in LOAD_PLAN order on cur. With a pool, a table starts as soon as every
+    table it references (deps, from schema.sql) has been committed, so
+    independent dimensions load side by side. Tables with an ON CONFLICT key
+    are idempotent and commit on their own connection; the others (ovc_cases)
+    stay on cur, uncommitted, so they land atomically with the checkpoint.
+    """
+    def record(spec, frame, count, seconds):
+        totals = report[spec['table']]
+        totals[0] += len(frame)
+        totals[1] += count
+        totals[2] += seconds
+
+    if pool is None:
+        for spec in LOAD_PLAN:
+            print(f"Loading {spec['label']}...")
+            frame = table_frame(df, spec)
+            count, seconds = _timed(load_table, cur, spec, frame, bulk)
+            record(spec, frame, count, seconds)
+        return
+
+    names = {spec['table'] for spec in LOAD_PLAN}
+    pending = {spec['table']: spec for spec in LOAD_PLAN}
+    finished = set()
+    with ThreadPoolExecutor(max_workers=pool.maxconn) as executor:
+        running = {}
+        while pending or running:
+            for name, spec in list(pending.items()):
+                if all(d in finished for d in deps.get(name, ()) if d in names):
+                    print(f"Loading {spec['label']}...")
+                    frame = table_frame(df, spec)
+                    if spec['conflict']:
+                        future = executor.submit(_timed, _load_pooled, pool, spec, frame, bulk)
+                    else:
+                        future = executor.submit(_timed, load_table, cur, spec, frame, bulk)
+                    running[future] = (spec, frame)
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f"Circular dependency between tables: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                spec, frame = running.pop(future)
+                count, seconds = future.result()
+                record(spec, frame, count, seconds)
+                finished.add(spec['table'])
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_checkpoint(cur, digest):
+    cur.execute("SELECT chunk_rows, last_chunk, rows_loaded, completed FROM migration_checkpoints WHERE file_hash = %s",
+                (digest,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {'chunk_rows': row[0], 'last_chunk': row[1], 'rows_loaded': row[2], 'completed': row[3]}
+
+def save_checkpoint(cur, digest, chunk_rows, last_chunk, rows_loaded, completed=False):
+    """Upserts the checkpoint inside the caller's transaction."""
+    cur.execute("""
+        INSERT INTO migration_checkpoints (file_hash, source_file, chunk_rows, last_chunk, rows_loaded, completed, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (file_hash) DO UPDATE SET
+            chunk_rows = EXCLUDED.chunk_rows, last_chunk = EXCLUDED.last_chunk, rows_loaded = EXCLUDED.rows_loaded,
+            completed = EXCLUDED.completed, updated_at = EXCLUDED.updated_at
+    """, (digest, os.path.abspath(FILE_PATH), chunk_rows, last_chunk, rows_loaded, completed))
+
+def migrate(bulk=False, restart=False, workers=1):
     print("--- Jali Data Migration (PostgreSQL) ---")
     
     # Try to ensure DB exists first
@@ -83,148 +387,104 @@ def migrate():
         print("You can modify the script or set environment variables to change credentials.")
         return
 
-    # 1. Apply Schema
+    # 1. Apply Schema (tables now, indexes once the data is loaded)
     print("Applying schema.sql...")
     try:
         with open('schema.sql', 'r') as f:
             schema = f.read()
-            cur.execute(schema)
-            conn.commit()
+        table_ddl, index_ddl = split_schema(schema)
+        for stmt in table_ddl:
+            cur.execute(stmt)
+        cur.execute(CHECKPOINT_DDL)
+        conn.commit()
     except Exception as e:
         print(f"Schema Error: {e}")
         conn.rollback()
         return
 
-    # 2. Read CSV
+    # 2. Find where a previous run of this exact file stopped
     if not os.path.exists(FILE_PATH):
         print(f"Error: {FILE_PATH} not found in current directory.")
         return
-        
-    print(f"Reading {FILE_PATH}...")
-    df = pd.read_csv(FILE_PATH, low_memory=False)
-    print(f"Loaded {len(df)} rows.")
-
-    # 3. Load Dimensions
-    print("Loading organizations...")
-    cbos = df[['cbo_id', 'cbo']].dropna(subset=['cbo_id']).drop_duplicates('cbo_id')
-    for _, row in cbos.iterrows():
-        cur.execute("INSERT INTO cbos (cbo_id, cbo_name) VALUES (%s, %s) ON CONFLICT (cbo_id) DO NOTHING", 
-                    (clean_value(row['cbo_id']), clean_value(row['cbo'])))
-
-    print("Loading CHVs/CHWs...")
-    chvs = df[['chv_id', 'chv_names']].dropna(subset=['chv_id']).drop_duplicates('chv_id')
-    for _, row in chvs.iterrows():
-        cur.execute("INSERT INTO chvs (chv_id, chv_name) VALUES (%s, %s) ON CONFLICT (chv_id) DO NOTHING", 
-                    (clean_value(row['chv_id']), clean_value(row['chv_names'])))
-
-    print("Loading Households & Locations...")
-    households = df[[
-        'household', 'chv_id', 'cbo_id', 'ward_id', 'ward', 
-        'consituency_id', 'constituency', 'countyid', 'county'
-    ]].dropna(subset=['household']).drop_duplicates('household')
-    
-    for _, row in households.iterrows():
-        cur.execute("""
-            INSERT INTO households (
-                household_id, chv_id, cbo_id, ward_id, ward_name, 
-                constituency_id, constituency_name, county_id, county_name
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) 
-            ON CONFLICT (household_id) DO NOTHING
-        """, (
-            clean_value(row['household']), clean_value(row['chv_id']), clean_value(row['cbo_id']),
-            clean_value(row['ward_id']), clean_value(row['ward']),
-            clean_value(row['consituency_id']), clean_value(row['constituency']),
-            clean_value(row['countyid']), clean_value(row['county'])
-        ))
-
-    print("Loading Caregivers...")
-    caregivers = df[[
-        'caregiver_id', 'household', 'caregiver_names', 'caregiver_nationalid', 
-        'phone', 'caregiver_gender', 'caregiver_dob', 'caregiverhivstatus',
-        'caregiver_type', 'father_alive', 'mother_alive'
-    ]].dropna(subset=['caregiver_id']).drop_duplicates('caregiver_id')
-    
-    for _, row in caregivers.iterrows():
-        cur.execute("""
-            INSERT INTO caregivers (
-                caregiver_id, household_id, caregiver_name, national_id, phone, 
-                gender, dob, hiv_status, caregiver_type, father_alive, mother_alive
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
-            ON CONFLICT (caregiver_id) DO NOTHING
-        """, (
-            clean_value(row['caregiver_id']), clean_value(row['household']),
-            clean_value(row['caregiver_names']), clean_value(row['caregiver_nationalid']),
-            clean_value(row['phone']), clean_value(row['caregiver_gender']),
-            clean_date(row['caregiver_dob']), clean_value(row['caregiverhivstatus']),
-            clean_value(row['caregiver_type']), clean_value(row['father_alive']),
-            clean_value(row['mother_alive'])
-        ))
-
-    print("Loading OVCs...")
-    ovcs = df[[
-        'ovc_id', 'household', 'ovc_names', 'gender', 'dob', 
-        'bcertnumber', 'ncpwdnumber', 'ovcdisability', 'ovchivstatus'
-    ]].dropna(subset=['ovc_id']).drop_duplicates('ovc_id')
-    
-    for _, row in ovcs.iterrows():
-        cur.execute("""
-            INSERT INTO ovcs (
-                ovc_id, household_id, ovc_name, gender, dob, 
-                birth_cert_no, ncpwd_no, disability_status, hiv_status
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) 
-            ON CONFLICT (ovc_id) DO NOTHING
-        """, (
-            clean_value(row['ovc_id']), clean_value(row['household']),
-            clean_value(row['ovc_names']), clean_value(row['gender']),
-            clean_date(row['dob']), clean_value(row['bcertnumber']),
-            clean_value(row['ncpwdnumber']), clean_value(row['ovcdisability']),
-            clean_value(row['ovchivstatus'])
-        ))
-
-    print("Loading Facilities & Schools...")
-    facilities = df[['facility_id', 'facility', 'facility_mfl_code']].dropna(subset=['facility_id']).drop_duplicates('facility_id')
-    for _, row in facilities.iterrows():
-        cur.execute("INSERT INTO facilities (facility_id, facility_name, mfl_code) VALUES (%s, %s, %s) ON CONFLICT (facility_id) DO NOTHING",
-                   (clean_value(row['facility_id']), clean_value(row['facility']), clean_value(row['facility_mfl_code'])))
-                   
-    schools = df[['school_id', 'school_name', 'schoollevel']].dropna(subset=['school_id']).drop_duplicates('school_id')
-    for _, row in schools.iterrows():
-        cur.execute("INSERT INTO schools (school_id, school_name, school_level) VALUES (%s, %s, %s) ON CONFLICT (school_id) DO NOTHING",
-                   (clean_value(row['school_id']), clean_value(row['school_name']), clean_value(row['schoollevel'])))
-
-    # 4. Final Load
-    print("Loading Process Tracking Events...")
-    case_count = 0
-    for _, row in df.iterrows():
-        cur.execute("""
-            INSERT INTO ovc_cases (
-                ovc_id, caregiver_id, chv_id, facility_id, school_id,
-                date_of_event, date_of_linkage, registration_date, exit_date,
-                art_status, ccc_number, duration_on_art, viral_load, 
-                suppression_status, immunization_status, eligibility,
-                exit_status, exit_reason
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            clean_value(row['ovc_id']), clean_value(row['caregiver_id']), clean_value(row['chv_id']),
-            clean_value(row['facility_id']), clean_value(row['school_id']),
-            clean_date(row['date_of_event']), clean_date(row['date_of_linkage']),
-            clean_date(row['registration_date']), clean_date(row['exit_date']),
-            clean_value(row['artstatus']), clean_value(row['ccc_number']),
-            clean_value(row['duration_on_art']), clean_value(row['viral_load']),
-            clean_value(row['suppression']), clean_value(row['immunization']),
-            clean_value(row['eligibility']), clean_value(row['exit_status']),
-            clean_value(row['exit_reason'])
-        ))
-        case_count += 1
-        if case_count % 2000 == 0:
-            print(f"Progress: {case_count} rows loaded...")
+
+    digest = file_hash(FILE_PATH)
+    if restart:
+        # A stale checkpoint must not outlive the run that replaces it
+        cur.execute("DELETE FROM migration_checkpoints WHERE file_hash = %s", (digest,))
+        conn.commit()
+    checkpoint = None if restart else get_checkpoint(cur, digest)
+    if checkpoint and checkpoint['completed']:
+        print(f"{FILE_PATH} (sha256 {digest[:12]}) was already fully loaded. Use --restart to load it again.")
+        create_indexes(conn, cur, index_ddl)
+        cur.close()
+        conn.close()
+        return
+    chunk_rows = checkpoint['chunk_rows'] if checkpoint else CHUNK_ROWS
+    last_chunk = checkpoint['last_chunk'] if checkpoint else -1
+    rows_loaded = checkpoint['rows_loaded'] if checkpoint else 0
+    if checkpoint:
+        print(f"Resuming after chunk {last_chunk + 1} ({rows_loaded} rows already committed).")
+
+    # 3. Read the CSV in chunks; each chunk loads dimensions, then the events
+    # that reference them, and commits together with its checkpoint. Reading
+    # as text keeps ids identical across chunks whatever their inferred dtype.
+    print(f"Reading {FILE_PATH} in chunks of {chunk_rows} rows...")
+    report = {spec['table']: [0, 0, 0.0] for spec in LOAD_PLAN}
+    chunk_index = last_chunk
+    pool = None
+    if workers > 1:
+        print(f"Loading independent tables in parallel on {workers} pooled connections.")
+        pool = ThreadedConnectionPool(1, workers, host=DB_HOST, database=DB_NAME,
+                                      user=DB_USER, password=DB_PASS, port=DB_PORT)
+    deps = fk_dependencies(schema)
+    load_start = time.perf_counter()
+    try:
+        # Committed rows are skipped by the parser (line 0 is the header), not re-read as chunks
+        reader = pd.read_csv(FILE_PATH, chunksize=chunk_rows, dtype=str,
+                             skiprows=range(1, rows_loaded + 1) if rows_loaded else None)
+        for chunk_index, df in enumerate(reader, start=last_chunk + 1):
+            load_chunk(cur, df, bulk, report, pool, deps)
+            rows_loaded += len(df)
+            save_checkpoint(cur, digest, chunk_rows, chunk_index, rows_loaded)
             conn.commit()
+            print(f"Chunk {chunk_index + 1} committed ({rows_loaded} rows so far).")
+
+        save_checkpoint(cur, digest, chunk_rows, chunk_index, rows_loaded, completed=True)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error in chunk {chunk_index + 1}: {e}")
+        print(f"{rows_loaded} rows are committed. Re-run to resume from the next chunk.")
+        cur.close()
+        conn.close()
+        return
+    finally:
+        if pool is not None:
+            pool.closeall()
+    load_seconds = time.perf_counter() - load_start
+
+    create_indexes(conn, cur, index_ddl)
 
-    conn.commit()
     print(f"--- Migration Successful! ---")
-    print(f"Final Count: {case_count} events stored.")
+    print(f"Final Count: {rows_loaded} rows processed.")
+    print(f"\n{'TABLE':<15}{'SOURCE ROWS':>12}{'INSERTED':>10}{'SECONDS':>9}{'ROWS/SEC':>11}")
+    for table, (source_rows, count, seconds) in report.items():
+        print(f"{table:<15}{source_rows:>12}{count:>10}{seconds:>9.2f}{source_rows / max(seconds, 1e-9):>11.0f}")
+    print(f"{'WALL CLOCK':<15}{rows_loaded:>12}{'':>10}{load_seconds:>9.2f}{rows_loaded / max(load_seconds, 1e-9):>11.0f}")
     cur.close()
     conn.close()
 
 if __name__ == "__main__":
-    migrate()
+    parser = argparse.ArgumentParser(description='Load the Tumikia extract into the Jali OLTP database')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Load each table with COPY FROM STDIN + INSERT ... SELECT instead of row INSERTs')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore any saved checkpoint for this file and load it from the first chunk')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='Load independent tables in parallel, respecting the FK order in schema.sql')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'Pooled connections for --concurrent (default: {MIGRATE_WORKERS})')
+
+    args = parser.parse_args()
+    workers = (args.workers or MIGRATE_WORKERS) if args.concurrent else 1
+    migrate(bulk=args.bulk, restart=args.restart, workers=workers)
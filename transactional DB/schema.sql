@@ -105,8 +105,8 @@ CREATE TABLE IF NOT EXISTS ovc_cases (
 );
 
 -- Indexes for performance
-CREATE INDEX idx_households_chv ON households(chv_id);
-CREATE INDEX idx_caregivers_household ON caregivers(household_id);
-CREATE INDEX idx_ovcs_household ON ovcs(household_id);
-CREATE INDEX idx_ovc_cases_ovc ON ovc_cases(ovc_id);
-CREATE INDEX idx_ovc_cases_date ON ovc_cases(date_of_event);
+CREATE INDEX IF NOT EXISTS idx_households_chv ON households(chv_id);
+CREATE INDEX IF NOT EXISTS idx_caregivers_household ON caregivers(household_id);
+CREATE INDEX IF NOT EXISTS idx_ovcs_household ON ovcs(household_id);
+CREATE INDEX IF NOT EXISTS idx_ovc_cases_ovc ON ovc_cases(ovc_id);
+CREATE INDEX IF NOT EXISTS idx_ovc_cases_date ON ovc_cases(date_of_event);